@@ -0,0 +1,63 @@
+"""Compare two json results of benchmarks.run.
+
+Usage:
+
+    python -m benchmarks.compare base.json new.json --threshold 1.2
+
+Exit status is 1 if the median time of any benchmark is slower than threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(baseResults: dict, newResults: dict, threshold: float = 1.2) -> list:
+    """Print new/base ratio of median time and peak memory of each benchmark.
+
+    Returns:
+        List of names of benchmarks slower than threshold
+    """
+    if baseResults["params"] != newResults["params"]:
+        print(f'Warning: params differ, base {baseResults["params"]} new {newResults["params"]}')
+
+    print(f'base {baseResults["commit"]} {baseResults["date"]}')
+    print(f'new  {newResults["commit"]} {newResults["date"]}')
+    print(f'{"benchmark":<36} {"base (s)":>10} {"new (s)":>10} {"time":>7} {"memory":>7}')
+
+    slower = []
+    for name, newResult in newResults["benchmarks"].items():
+        baseResult = baseResults["benchmarks"].get(name)
+        if baseResult is None:
+            print(f'{name:<36} {"":>10} {newResult["median"]:10.4f}')
+            continue
+        timeRatio = newResult["median"] / baseResult["median"]
+        memoryRatio = newResult["peakMemoryBytes"] / max(baseResult["peakMemoryBytes"], 1)
+        flag = ""
+        if timeRatio > threshold:
+            flag = " slower"
+            slower.append(name)
+        print(f'{name:<36} {baseResult["median"]:10.4f} {newResult["median"]:10.4f}'
+              f' {timeRatio:7.2f} {memoryRatio:7.2f}{flag}')
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two sanpy benchmark results")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="new/base ratio of median time that is slower")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        baseResults = json.load(f)
+    with open(args.new) as f:
+        newResults = json.load(f)
+
+    slower = compare(baseResults, newResults, threshold=args.threshold)
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Run benchmarks and save results as json, see readme.md.
+
+Usage:
+
+    python -m benchmarks.run --size small --out results.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import sanpy
+from benchmarks import suite
+
+sizes = {
+    "small": {"durSec": 60, "numSweeps": 2, "spikeFreq": 3, "fs": 10000, "model": "epsp",
+              "numFiles": 4, "kymLines": 5000},
+    "medium": {"durSec": 300, "numSweeps": 4, "spikeFreq": 3, "fs": 10000, "model": "epsp",
+               "numFiles": 8, "kymLines": 20000},
+    "large": {"durSec": 600, "numSweeps": 10, "spikeFreq": 3, "fs": 20000, "model": "epsp",
+              "numFiles": 16, "kymLines": 100000},
+}
+# parameters of synthetic recordings, override each with command line arguments
+
+
+def _getCommit() -> str:
+    """Get git commit of sanpy, None if not in a git repo."""
+    folder = os.path.dirname(os.path.abspath(sanpy.__file__))
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=folder,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def runBenchmark(benchmark: suite.benchmark, repeat: int) -> dict:
+    """Time benchmark.run() repeat times and trace its peak memory in one extra run.
+
+    Returns:
+        Dict with keys (seconds, min, median, mean, peakMemoryBytes)
+    """
+    benchmark.setupOnce()
+
+    seconds = []
+    for _ in range(repeat):
+        benchmark.setup()
+        startTime = time.perf_counter()
+        benchmark.run()
+        seconds.append(time.perf_counter() - startTime)
+
+    # tracing memory is slow, do not time it
+    benchmark.setup()
+    tracemalloc.start()
+    startMemory, _ = tracemalloc.get_traced_memory()
+    benchmark.run()
+    _, peakMemory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+        "mean": statistics.mean(seconds),
+        "peakMemoryBytes": peakMemory - startMemory,
+    }
+
+
+def runBenchmarks(params: dict, repeat: int = 5, filter: str = None, workDir: str = None) -> dict:
+    """Run all benchmarks whose name contains filter.
+
+    Args:
+        params: Parameters of synthetic recordings, see sizes
+        repeat: Number of timed runs of each benchmark
+        filter: Only run benchmarks with this in their name, None for all
+        workDir: Folder for synthetic recordings, None for a temporary folder
+
+    Returns:
+        Dict of results, can be saved as json
+    """
+    results = {
+        "commit": _getCommit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sanpy": sanpy.__version__,
+        "platform": platform.platform(),
+        "params": params,
+        "repeat": repeat,
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        data = suite.makeData(workDir or tmpDir, params)
+        for benchmarkClass in suite.benchmarks:
+            if filter is not None and filter not in benchmarkClass.name:
+                continue
+            oneResult = runBenchmark(benchmarkClass(data, params), repeat)
+            results["benchmarks"][benchmarkClass.name] = oneResult
+            print(f'{benchmarkClass.name:<36} median {oneResult["median"]:10.4f} s'
+                  f'  peak {oneResult["peakMemoryBytes"] / 2**20:10.1f} MB')
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run sanpy benchmarks")
+    parser.add_argument("--size", choices=sizes.keys(), default="small")
+    for key, value in sizes["small"].items():
+        parser.add_argument(f"--{key}", type=type(value), default=None,
+                            help=f"override {key} of size")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default=None, help="only run benchmarks with this in their name")
+    parser.add_argument("--workDir", default=None, help="folder for synthetic recordings")
+    parser.add_argument("--out", default=None, help="save json results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep sanpy info logging")
+    args = parser.parse_args(argv)
+
+    params = dict(sizes[args.size])
+    for key in params.keys():
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    results = runBenchmarks(params, repeat=args.repeat, filter=args.filter, workDir=args.workDir)
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Benchmarks of detection, I/O and pooling hot paths.
+
+Each benchmark is a class with setupOnce() (untimed, once), setup() (untimed,
+before each repeat) and run() (timed). Benchmarks share the synthetic recordings
+made by benchmarks.run in a work folder, see makeData().
+"""
+
+import os
+import shutil
+from abc import ABC, abstractmethod
+
+import sanpy
+from sanpy.kymAnalysis import makeKymograph
+from benchmarks import synthetic
+
+from sanpy.sanpyLogger import get_logger
+logger = get_logger(__name__)
+
+
+def makeData(workDir: str, params: dict) -> dict:
+    """Make synthetic recordings in workDir.
+
+    Args:
+        workDir: Folder to save recordings into
+        params: Dict with keys (durSec, numSweeps, spikeFreq, fs, model, numFiles)
+
+    Returns:
+        Dict with keys (path, folder), one recording and a folder of numFiles recordings
+    """
+    sweepKwargs = {key: params[key] for key in ["durSec", "numSweeps", "spikeFreq", "fs", "model"]}
+    os.makedirs(workDir, exist_ok=True)
+
+    sweepX, sweepY = synthetic.makeSweeps(**sweepKwargs)
+    path = synthetic.saveRecording(os.path.join(workDir, "synthetic.sanpy"), sweepX, sweepY)
+
+    folder = os.path.join(workDir, "folder")
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    synthetic.makeRecordingFolder(folder, numFiles=params["numFiles"], **sweepKwargs)
+
+    return {"path": path, "folder": folder}
+
+
+class benchmark(ABC):
+    """Base class of one benchmark, derived classes define run()."""
+
+    name = ""
+    # name in the json results
+
+    def __init__(self, data: dict, params: dict):
+        self.data = data
+        self.params = params
+        self.detectionDict = synthetic.getDetectionDict()
+
+    def setupOnce(self):
+        pass
+
+    def setup(self):
+        pass
+
+    @abstractmethod
+    def run(self):
+        """The code to time."""
+
+
+class detectDvdt(benchmark):
+    name = "bAnalysis.spikeDetect.dvdt"
+
+    def setupOnce(self):
+        self.detectionDict["detectionType"] = sanpy.bDetection.detectionTypes.dvdt.value
+
+    def setup(self):
+        self.ba = sanpy.bAnalysis(self.data["path"])
+
+    def run(self):
+        self.ba.spikeDetect(self.detectionDict)
+
+
+class detectMv(detectDvdt):
+    name = "bAnalysis.spikeDetect.mv"
+
+    def setupOnce(self):
+        self.detectionDict["detectionType"] = sanpy.bDetection.detectionTypes.mv.value
+
+
+class getDerivative(benchmark):
+    name = "fileLoader._getDerivative"
+
+    def setupOnce(self):
+        self.ba = sanpy.bAnalysis(self.data["path"])
+
+    def setup(self):
+        self.ba.fileLoader.clearFilterCache()
+
+    def run(self):
+        self.ba.fileLoader._getDerivative()
+
+
+class _detected(benchmark):
+    """Benchmarks of one detected recording."""
+
+    def setupOnce(self):
+        self.ba = sanpy.bAnalysis(self.data["path"])
+        self.ba.spikeDetect(self.detectionDict)
+
+
+class getStat(_detected):
+    name = "bAnalysis.getStat"
+
+    def run(self):
+        for stat in ["thresholdSec", "peakVal", "widths_50", "isi_ms"]:
+            self.ba.getStat(stat)
+
+
+class asDataFrame(_detected):
+    name = "bAnalysis.asDataFrame"
+
+    def run(self):
+        self.ba.asDataFrame(regenerateAnalysisDataFrame=True)
+
+
+class saveHdf(_detected):
+    name = "bAnalysis._saveHdf_pytables"
+
+    def setupOnce(self):
+        super().setupOnce()
+        self.hdfPath = os.path.join(os.path.dirname(self.data["path"]), "synthetic.h5")
+
+    def setup(self):
+        if os.path.isfile(self.hdfPath):
+            os.remove(self.hdfPath)
+        self.ba._setDetectionDirty()  # o.w. it is not saved
+
+    def run(self):
+        self.ba._saveHdf_pytables(self.hdfPath)
+
+
+class loadHdf(saveHdf):
+    name = "bAnalysis._loadHdf_pytables"
+
+    def setupOnce(self):
+        super().setupOnce()
+        super().setup()
+        super().run()
+
+    def setup(self):
+        self.loadedBa = sanpy.bAnalysis(self.data["path"])
+
+    def run(self):
+        self.loadedBa._loadHdf_pytables(self.hdfPath, self.ba.uuid)
+
+
+class loadFolder(benchmark):
+    name = "analysisDir.loadFolder"
+
+    def setupOnce(self):
+        self.ad = sanpy.analysisDir(self.data["folder"])
+
+    def setup(self):
+        # without header index, every file is loaded
+        headerIndexPath = self.ad._getHeaderIndexPath()
+        if os.path.isfile(headerIndexPath):
+            os.remove(headerIndexPath)
+
+    def run(self):
+        self.ad.loadFolder()
+
+
+class loadFolderIndexed(loadFolder):
+    name = "analysisDir.loadFolder.indexed"
+
+    def setup(self):
+        pass
+
+
+class poolBuild(benchmark):
+    name = "analysisDir.pool_build"
+
+    def setupOnce(self):
+        self.ad = sanpy.analysisDir(self.data["folder"])
+        for rowIdx in range(self.ad.numFiles):
+            self.ad.getAnalysis(rowIdx).spikeDetect(self.detectionDict)
+
+    def setup(self):
+        self.ad._poolCache = {}
+
+    def run(self):
+        self.ad.pool_build()
+
+
+class poolBuildCached(poolBuild):
+    name = "analysisDir.pool_build.cached"
+
+    def setupOnce(self):
+        super().setupOnce()
+        self.ad.pool_build()
+
+    def setup(self):
+        pass
+
+
+class analyzeDiameter(benchmark):
+    name = "kymAnalysis.analyzeDiameter"
+
+    def setupOnce(self):
+        self.kymImage = makeKymograph(numLines=self.params["kymLines"])
+
+    def setup(self):
+        self.ka = sanpy.kymAnalysis("kymograph.tif", tifData=self.kymImage, autoLoad=False)
+        self.ka.setRoiRect([0, 90, self.params["kymLines"], 10])
+
+    def run(self):
+        self.ka.analyzeDiameter()
+
+
+benchmarks = [
+    detectDvdt,
+    detectMv,
+    getDerivative,
+    getStat,
+    asDataFrame,
+    saveHdf,
+    loadHdf,
+    loadFolder,
+    loadFolderIndexed,
+    poolBuild,
+    poolBuildCached,
+    analyzeDiameter,
+]
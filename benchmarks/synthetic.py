@@ -0,0 +1,115 @@
+"""Synthetic recordings and kymographs for benchmarks.
+
+Recordings are saved as .sanpy text files (seconds column, one column per sweep)
+so they load with sanpy.fileloaders.fileLoader_text like any user file.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import sanpy.atfStim
+
+from sanpy.sanpyLogger import get_logger
+logger = get_logger(__name__)
+
+models = ["epsp", "hh"]
+# epsp: sanpy.atfStim.getSpikeTrain(), a train of large sum of exponential events
+# hh: sanpy.models.myStochHH, a stochastic Hodgkin Huxley neuron (slow, simulated once and tiled)
+
+_hhTemplateSec = 0.5
+# seconds of stochastic HH to simulate, longer recordings repeat it
+
+
+def _hhTemplate(fs: int) -> np.ndarray:
+    """Simulate a short stochastic HH recording at fs (Hz)."""
+    from sanpy.models.myStochHH import myRun2
+
+    # myRun2 steps at 1/10 of the sampling interval
+    _timeArray, _inputCurrent, voltageArray = myRun2(durSec=_hhTemplateSec, baseLineShift=60, fs=fs)
+    return np.asarray(voltageArray[::10], dtype=float)
+
+
+def makeSweeps(
+    durSec: float = 60,
+    numSweeps: int = 1,
+    spikeFreq: float = 3,
+    fs: int = 10000,
+    noiseAmp: float = 0.5,
+    model: str = "epsp",
+    seed: int = 0,
+):
+    """Make synthetic sweeps.
+
+    Args:
+        durSec: Duration of each sweep (s)
+        numSweeps: Number of sweeps
+        spikeFreq: Spike frequency (Hz), only for model 'epsp'
+        fs: Sampling frequency (Hz)
+        noiseAmp: Standard deviation of gaussian noise (mV)
+        model: One of models
+        seed: Seed of noise
+
+    Returns:
+        sweepX: Seconds, shape is (samples,)
+        sweepY: mV, shape is (samples, sweeps)
+    """
+    rng = np.random.default_rng(seed)
+    numSamples = int(durSec * fs)
+    sweepX = np.arange(numSamples) / fs
+
+    if model == "epsp":
+        _spikeTrain, oneSweep = sanpy.atfStim.getSpikeTrain(
+            durSec=durSec, fs=fs, spikeFreq=spikeFreq, amp=200, noiseAmp=0, baseLineShift=60
+        )
+    elif model == "hh":
+        template = _hhTemplate(fs)
+        oneSweep = np.resize(template, numSamples)
+    else:
+        logger.error(f'Did not understand model "{model}", expecting one of {models}')
+        return None, None
+
+    sweepY = np.repeat(oneSweep[:numSamples, np.newaxis], numSweeps, axis=1)
+    if noiseAmp > 0:
+        sweepY += rng.normal(scale=noiseAmp, size=sweepY.shape)
+    return sweepX, sweepY
+
+
+def saveRecording(path: str, sweepX: np.ndarray, sweepY: np.ndarray) -> str:
+    """Save sweeps as a .sanpy text file, columns are (s, mV_0, mV_1, ...)."""
+    df = pd.DataFrame(sweepY, columns=[f"mV_{sweep}" for sweep in range(sweepY.shape[1])])
+    df.insert(0, "s", sweepX)
+    df.to_csv(path, index=False, float_format="%.6g")
+    return path
+
+
+def makeRecordingFolder(
+    folder: str,
+    numFiles: int = 4,
+    seed: int = 0,
+    **kwargs,
+) -> list:
+    """Save numFiles synthetic recordings into folder, see makeSweeps() for kwargs.
+
+    Returns:
+        List of file paths
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for fileIdx in range(numFiles):
+        sweepX, sweepY = makeSweeps(seed=seed + fileIdx, **kwargs)
+        if sweepX is None:
+            return paths
+        path = os.path.join(folder, f"synthetic_{fileIdx}.sanpy")
+        paths.append(saveRecording(path, sweepX, sweepY))
+    return paths
+
+
+def getDetectionDict() -> dict:
+    """Detection parameters for synthetic recordings."""
+    dDict = sanpy.bDetection().getDetectionDict("Fast Neuron")
+    dDict["dvdtThreshold"] = 10
+    dDict["mvThreshold"] = -30
+    dDict["refractory_ms"] = 20
+    return dDict
@@ -2,6 +2,10 @@
 D_BJ_MANUSCRIPT = True
 DO_KYMOGRAPH_ANALYSIS = False
 
+import importlib
+import sys
+import types
+
 from .sanpyLogger import *
 
 from ._util import *
@@ -9,15 +13,9 @@ from .analysisUtil import *
 
 from .bAnalysis_ import bAnalysis
 # from .bAnalysis_ import MetaData  # Aug 2023
-from .analysisDir import *
-from .analysisPlot import *
 from .bAnalysisUtil import *
-from .atfStim import *
 from .bAnalysisResults import *
 
-from .bAbfText import bAbfText
-from .bExport import bExport
-
 from .version import analysisVersion
 from .version import interfaceVersion
 #from .version import __version__
@@ -25,9 +23,113 @@ from ._version import __version__
 
 from .bDetection import bDetection
 
-from .kymAnalysis import kymAnalysis
 from ._util import _loadLineScanHeader
 
 from .fileloaders import *
 
 from .metaData import MetaData
+
+# modules that import matplotlib, tables, requests, ... are imported on first use, see __getattr__()
+# key is attribute of sanpy, value is (module, attribute in module), attribute None is the module
+# was 'from .analysisDir import *', 'from .analysisPlot import *' and 'from .atfStim import *',
+# only the classes (and modules) used as sanpy.<name> are kept
+_lazyAttributes = {
+    "analysisDir": (".analysisDir", "analysisDir"),
+    "analysisPlot": (".analysisPlot", None),
+    "bAnalysisPlot": (".analysisPlot", "bAnalysisPlot"),
+    "atfStim": (".atfStim", None),
+    "bAbfText": (".bAbfText", "bAbfText"),
+    "bExport": (".bExport", "bExport"),
+    "kymAnalysis": (".kymAnalysis", "kymAnalysis"),
+}
+
+# 'from sanpy import *' gets the names imported above plus the lazy attributes (importing them)
+__all__ = [
+    "DO_KYMOGRAPH_ANALYSIS",
+    "D_BJ_MANUSCRIPT",
+    "MetaData",
+    "NumpyEncoder",
+    "addUserPath",
+    "analysisResult",
+    "analysisResultDict",
+    "analysisResultList",
+    "analysisUtil",
+    "analysisVersion",
+    "bAnalysis",
+    "bAnalysisResults",
+    "bAnalysisUtil",
+    "bAnalysis_",
+    "bDetection",
+    "defaultVal",
+    "detectionUtils",
+    "epochTable",
+    "fileLoader_abf",
+    "fileLoader_atf",
+    "fileLoader_base",
+    "fileLoader_csv",
+    "fileLoader_text",
+    "fileloaders",
+    "getBundledDir",
+    "getDefaultDict",
+    "getEddLines",
+    "getFileList",
+    "getFileLoaders",
+    "getHalfWidthLines",
+    "getLoggerFile",
+    "getNewUuid",
+    "get_logger",
+    "handle_exception",
+    "interfaceVersion",
+    "metaData",
+    "perfUtils",
+    "printDocs",
+    "recordingModes",
+    "sanpyLogger",
+    "throwOutAboveBelow",
+    "user_analysis",
+    "version",
+    # lazy attributes, see _lazyAttributes
+    "analysisDir",
+    "analysisPlot",
+    "bAnalysisPlot",
+    "atfStim",
+    "bAbfText",
+    "bExport",
+    "kymAnalysis",
+]
+
+
+def __getattr__(name):
+    """Import lazy attributes on first use (PEP 562)."""
+    if name not in _lazyAttributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    moduleName, attributeName = _lazyAttributes[name]
+    module = importlib.import_module(moduleName, __name__)
+    value = module if attributeName is None else getattr(module, attributeName)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazyAttributes))
+
+
+class _sanpyModule(types.ModuleType):
+    """Keep sanpy.<name> as the class when a submodule of the same name is imported.
+
+    analysisDir, bAbfText, bExport and kymAnalysis are both a submodule and the class in it.
+    When a submodule is first imported (e.g. 'import sanpy.kymAnalysis'), Python sets it as
+    an attribute of sanpy, which would replace the class. The eager 'from .kymAnalysis import ...'
+    used to bind the class after that, so sanpy.kymAnalysis was always the class.
+    This keeps it the class whatever the import order, the submodule is still in
+    sys.modules['sanpy.kymAnalysis'].
+    """
+
+    def __setattr__(self, name, value):
+        if isinstance(value, types.ModuleType) and _lazyAttributes.get(name, (None, None))[1] == name:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+# the class of a module can be changed (Python >= 3.5), see _sanpyModule
+sys.modules[__name__].__class__ = _sanpyModule
@@ -1,9 +1,11 @@
 import os
 import sys
+import glob
 import importlib
 import pathlib
 import shutil
-from typing import List, Union
+import threading
+from typing import Callable, List, Union
 import uuid
 
 import numpy as np
@@ -72,6 +74,59 @@ def addUserPath():
     return madeUserFolder
 
 
+def _getFolderKey(folder: str) -> tuple:
+    """Key that changes when .py files in folder are added, removed or edited."""
+    import sanpy  # DO_KYMOGRAPH_ANALYSIS changes which modules are discovered
+
+    if not os.path.isdir(folder):
+        return (sanpy.DO_KYMOGRAPH_ANALYSIS, folder, None)
+    files = sorted(glob.glob(os.path.join(folder, "*.py")))
+    fileStats = []
+    for file in files:
+        try:
+            fileStats.append((file, os.stat(file).st_mtime_ns))
+        except OSError:
+            continue
+    return (
+        sanpy.DO_KYMOGRAPH_ANALYSIS,
+        folder,
+        os.stat(folder).st_mtime_ns,
+        tuple(fileStats),
+    )
+
+
+class _folderCache:
+    """Value discovered from the .py files of a user folder, shared by all threads.
+
+    The value is only made once per process, again when the folder or one of
+    its files changes, see _getFolderKey().
+    Used for user file loaders and user analysis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = None  # (key, value)
+
+    @property
+    def value(self):
+        """The cached value, None if it was never made."""
+        return None if self._cache is None else self._cache[1]
+
+    def get(self, folder: str, makeValue: Callable, refresh: bool = False):
+        """Get the value for folder, call makeValue() if it changed.
+
+        Args:
+            folder: User folder with .py files
+            makeValue: Function with no arguments that discovers the value
+            refresh: If True then call makeValue() even if the folder did not change
+        """
+        with self._lock:
+            cacheKey = _getFolderKey(folder)
+            if refresh or self._cache is None or self._cache[0] != cacheKey:
+                self._cache = (cacheKey, makeValue())
+            return self._cache[1]
+
+
 def _getUserDocumentsFolder():
     """Get <user>/Documents folder."""
     userPath = pathlib.Path.home()
@@ -4,7 +4,14 @@
 
 import os
 import time
+import concurrent.futures
 import copy  # For copy.deepcopy() of bAnalysis
+import functools
+import itertools
+import json
+import threading
+import weakref
+from collections import OrderedDict
 # import uuid  # to generate unique key on bAnalysis spike detect
 import pathlib  # ned to use this (introduced in Python 3.4) to maname paths on Windows, stop using os.path
 
@@ -390,6 +397,48 @@ def _old_santana_file_finder(files):
     #print('n=', len(files))
     return retDict
 
+def _detectOneFile(path : str, detectionDict : dict, uuid : str = None):
+    """Load one file and run spike detection, used by analysisDir.detectAll().
+
+    This runs in a worker process. It fetches the file loaders itself,
+    user file loaders are not picklable.
+
+    Returns
+    -------
+    uuid : str
+        The uuid of the analysis, same as uuid parameter (if given)
+    dfAnalysis : pd.DataFrame
+        The analysis results, one row per spike. None on error.
+    errorStr : str
+        None if no error.
+    """
+    try:
+        fileLoaderDict = sanpy.fileloaders.getFileLoaders()
+        ba = sanpy.bAnalysis(path, fileLoaderDict=fileLoaderDict)
+        if ba.loadError:
+            return uuid, None, f'Error loading file "{path}"'
+        if uuid:
+            ba.uuid = uuid
+        ba.spikeDetect(detectionDict)
+        return ba.uuid, ba.spikeDict.asDataFrame(), None
+    except Exception as e:
+        # isolate errors in one file from the rest of the batch
+        return uuid, None, f'{type(e).__name__}: {e}'
+
+_headerIndexVersion = 1
+# bump to invalidate header index files written by older versions
+
+def _fileStat(path : str):
+    """Get (size, mtime) of a file, used to check header index entries are current."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _jsonDefault(obj):
+    """Convert numpy scalars for json.dump()."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
 def _listdir(path, theseFileTypes):
     """Recursively walk directory to specified depth
     
@@ -454,6 +503,135 @@ def stripSantanaTif(fileList : List[str]) -> List[str]:
         
     return retList
 
+def _hdfLocked(func):
+    """Decorator to hold analysisDir._hdfLock, the h5 file is also read by the prefetch thread."""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._hdfLock:
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class analysisPrefetcher:
+    """Load bAnalysis of files near the selected file in a background thread.
+
+    Loaded analyses wait in a least recently used cache, bounded in number of files
+    and memory, until analysisDir.getAnalysis() takes them. See analysisDir.prefetch().
+    """
+
+    def __init__(self, loadFunction, maxFiles: int = 8, maxBytes: int = 2**30):
+        """
+        Parameters
+        ----------
+        loadFunction : Callable[[str, str], bAnalysis]
+            Load one analysis from (path, uuid), called in the prefetch thread.
+        maxFiles : int
+            Maximum number of cached analyses.
+        maxBytes : int
+            Maximum memory of cached analyses, see bAnalysis.memoryBytes.
+        """
+        self._loadFunction = loadFunction
+        self.maxFiles = maxFiles
+        self.maxBytes = maxBytes
+
+        self._cache = OrderedDict()
+        # (path, uuid): bAnalysis, least recently used first
+
+        self._pending = OrderedDict()
+        # (path, uuid): Future of loads that are queued or running
+
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sanpyPrefetch"
+        )
+
+        self.numHits = 0
+        # take() found the analysis cached or loading
+        self.numMisses = 0
+        # take() did not find the analysis, it is loaded by the caller
+
+    def prefetch(self, keys: List[tuple]):
+        """Load (path, uuid) keys in order, cancel queued loads not in keys."""
+        keys = keys[: self.maxFiles]
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                # a running load finishes into the cache
+                if key not in keys and future.cancel():
+                    del self._pending[key]
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                elif key not in self._pending:
+                    self._pending[key] = self._executor.submit(self._load, key)
+
+    def take(self, key: tuple) -> Optional["sanpy.bAnalysis"]:
+        """Remove and return the analysis of (path, uuid), waits if it is loading.
+
+        Returns None if it was not prefetched.
+        """
+        with self._lock:
+            ba = self._cache.pop(key, None)
+            future = self._pending.get(key) if ba is None else None
+            if future is not None and future.cancel():
+                # still queued, the caller loads it now
+                del self._pending[key]
+                future = None
+        if future is not None:
+            future.result()
+            with self._lock:
+                ba = self._cache.pop(key, None)
+        with self._lock:
+            if ba is None:
+                self.numMisses += 1
+            else:
+                self.numHits += 1
+        return ba
+
+    def clear(self):
+        """Cancel queued loads and empty the cache."""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            for ba in self._cache.values():
+                ba.close()
+            self._cache.clear()
+
+    def getStats(self) -> dict:
+        """Get dict with keys (numHits, numMisses, numCached, cachedBytes, numPending)."""
+        with self._lock:
+            return {
+                "numHits": self.numHits,
+                "numMisses": self.numMisses,
+                "numCached": len(self._cache),
+                "cachedBytes": sum(ba.memoryBytes for ba in self._cache.values()),
+                "numPending": len(self._pending),
+            }
+
+    def _load(self, key: tuple):
+        path, uuid = key
+        try:
+            ba = self._loadFunction(path, uuid)
+        except Exception as e:
+            logger.error(f'Did not prefetch "{path}": {e}')
+            ba = None
+        with self._lock:
+            self._pending.pop(key, None)
+            if ba is not None and not ba.loadError:
+                self._cache[key] = ba
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used analyses over maxFiles or maxBytes, holding _lock."""
+        cacheBytes = sum(ba.memoryBytes for ba in self._cache.values())
+        while self._cache and (len(self._cache) > self.maxFiles or cacheBytes > self.maxBytes):
+            _key, ba = self._cache.popitem(last=False)
+            cacheBytes -= ba.memoryBytes
+            ba.close()
+
+
 class analysisDir:
     """Class to manage a list of files loaded from a folder.
     """
@@ -472,6 +650,12 @@ class analysisDir:
         fileLoaderDict : dict = None,
         autoLoad: bool = False,
         folderDepth: Optional[int] = None,
+        lazy: bool = False,
+        persistPool: bool = False,
+        prefetchFiles: int = 0,
+        prefetchMaxBytes: int = 2**30,
+        memoryBudgetBytes: Optional[int] = None,
+        useHeaderIndex: bool = True,
     ):
         """Load and manage a list of files in a folder path.
 
@@ -491,6 +675,24 @@ class analysisDir:
             If True then 
         folderDepth (int):
             Folder depth to recurse if loading folder path.
+        lazy (bool):
+            If True then load raw data of each sweep on demand, see bAnalysis.
+        persistPool (bool):
+            If True then save pooled analysis of saved files next to the h5 file,
+            see pool_build().
+        prefetchFiles (int):
+            Number of files before and after a selected row to load in the background,
+            see prefetch(). 0 to not prefetch.
+        prefetchMaxBytes (int):
+            Memory of prefetched files waiting to be selected, see analysisPrefetcher.
+        memoryBudgetBytes (int):
+            Memory of loaded files (bAnalysis.memoryBytes). When over budget, the least
+            recently used analyses that are not dirty are unloaded, see getAnalysis().
+            None to keep all files loaded.
+        useHeaderIndex (bool):
+            If True then save file table rows in headerIndexFile in the folder
+            and use them when the folder is loaded again, see loadFolder().
+            False to not write anything in the folder.
 
         Notes
         -----
@@ -521,9 +723,46 @@ class analysisDir:
 
         self.folderDepth = folderDepth
 
+        self.lazy = lazy
+        # passed to bAnalysis in getAnalysis()
+
+        self.persistPool = persistPool
+        # save/load pool cache in poolCacheFile
+
+        self._poolCache = None
+        # dict of pooled analysis keyed by bAnalysis uuid, see pool_build()
+
         self._isDirty = False
         # keep track if analysis was changed and prompt on quit
 
+        self._tableGeneration = 0
+        # changes when rows of the table change, see tableGeneration
+
+        self._changedRows = set()
+        # rows refreshed by _updateLoadedAnalyzed(rowIdx) since takeChangedRows()
+
+        self._hdfLock = threading.RLock()
+        # h5 file is read by the prefetch thread, see _hdfLocked
+
+        self.memoryBudgetBytes = memoryBudgetBytes
+        # see _evictAnalysis()
+
+        self._lastAccess = {}
+        # id(bAnalysis): access count of loaded analyses, see getAnalysis()
+        self._accessCount = itertools.count()
+
+        self._evicted = {}
+        # relPath: (weakref of bAnalysis, isAnalyzed) of rows unloaded by _evictAnalysis()
+
+        self._prefetchFiles = prefetchFiles
+        self._prefetcher = None
+        if prefetchFiles > 0:
+            self._prefetcher = analysisPrefetcher(
+                self.loadOneAnalysis,
+                maxFiles=4 * prefetchFiles,
+                maxBytes=prefetchMaxBytes,
+            )
+
         # self._poolDf = None
         """See pool_ functions"""
 
@@ -536,6 +775,18 @@ class analysisDir:
         # name of database file created/loaded from folder path
         self.dbFile = "sanpy_recording_db.csv"
 
+        self.poolCacheFile = "sanpy_pool_cache.h5"
+        # pooled analysis of saved files, see pool_build()
+
+        self.headerIndexFile = "sanpy_header_index.json"
+        # file table rows of each file keyed by (path, size, mtime), see loadFolder()
+
+        self.useHeaderIndex = useHeaderIndex
+        # load/save headerIndexFile
+
+        self._discoveredFileLoaderDict = None
+        # from sanpy.fileloaders.getFileLoaders() when fileLoaderDict is None
+
         self._df = self.loadHdf()
         if self._df is None:
             # did not load h5 file
@@ -557,12 +808,20 @@ class analysisDir:
         self._checkColumns()
         self._updateLoadedAnalyzed()
 
+    @property
+    def fileLoaderDict(self) -> dict:
+        """Get dict of file loaders, only discover them once if not specified."""
+        if self._fileLoaderDict is not None:
+            return self._fileLoaderDict
+        if self._discoveredFileLoaderDict is None:
+            self._discoveredFileLoaderDict = sanpy.fileloaders.getFileLoaders()
+        return self._discoveredFileLoaderDict
+
     @property
     def theseFileTypes(self):
         """Get list of file extensions we will load.
         """
-        if self._fileLoaderDict is not None:
-            return list(self._fileLoaderDict.keys())
+        return list(self.fileLoaderDict.keys())
 
     def findFileRow(self, filename):
         # filename = os.path.split(filePath)[1]
@@ -573,6 +832,24 @@ class analysisDir:
         else:
             logger.warning(f"Did not find file {filename} in {self._df['File'].tolist()}")
 
+    def findAnalysisRow(self, ba) -> Optional[int]:
+        """Find the row of a bAnalysis, None if it is not in the table.
+
+        Matches the loaded analysis, then its saved uuid, then its relPath if it was unloaded.
+        """
+        for rowIdx in self._df.index:
+            if self._df.at[rowIdx, "_ba"] is ba:
+                return rowIdx
+        rowList = self._df.index[self._df["uuid"] == ba.uuid].tolist()
+        if rowList:
+            return rowList[0]
+        for relPath, (baRef, _isAnalyzed) in self._evicted.items():
+            if baRef() is ba:
+                rowList = self._df.index[self._df["relPath"] == relPath].tolist()
+                if rowList:
+                    return rowList[0]
+        return None
+
     def __iter__(self):
         self._iterIdx = -1
         return self
@@ -607,6 +884,24 @@ class analysisDir:
     def isDirty(self):
         return self._isDirty
 
+    @property
+    def tableGeneration(self) -> int:
+        """Changes when rows are added, removed, sorted or all refreshed by _updateLoadedAnalyzed().
+
+        Used by the file table model to know when its display snapshot is out of date.
+        Rows refreshed one at a time do not change it, see takeChangedRows().
+        """
+        return self._tableGeneration
+
+    def takeChangedRows(self) -> set:
+        """Get and forget the rows (df index) refreshed by _updateLoadedAnalyzed(rowIdx).
+
+        Used by the file table model to update only those rows of its display snapshot.
+        """
+        changedRows = self._changedRows
+        self._changedRows = set()
+        return changedRows
+
     def __len__(self):
         return len(self._df)
 
@@ -681,6 +976,7 @@ class analysisDir:
     def sort_values(self, Ncol, order):
         logger.info(f"sorting by column {self.columns[Ncol]} with order:{order}")
         self._df = self._df.sort_values(self.columns[Ncol], ascending=not order)
+        self._tableGeneration += 1
         # print(self._df)
 
     @property
@@ -736,26 +1032,41 @@ class analysisDir:
 
         return fullFilePath
 
-    def saveHdf(self):
+    @_hdfLocked
+    def saveHdf(self) -> dict:
         """Save file table and any number of loaded and analyzed bAnalysis.
 
         Set file table 'uuid' column when we actually save a bAnalysis
 
+        Only dirty bAnalysis are written, each into its own uuid key.
+        The h5 file is only repacked when it is fragmented, see h5Util.repackIfFragmented().
+
         Important: Order matters
             (1) Save bAnalysis first, it updates uuid in file table.
             (2) Save file table with updated uuid
+
+        Returns
+        -------
+        dict
+            Keys are (numSaved, bytesWritten, seconds, repacked).
         """
         start = time.time()
 
+        self._reattachEvicted()
+
         df = self.getDataFrame()
 
-        # the compressed version from the last save
         hdfFile = os.path.splitext(self.dbFile)[0] + ".h5"
         hdfFilePath = pathlib.Path(self.path) / hdfFile
 
-        logger.info(f"Saving db (will be compressed) {hdfFilePath}")
+        logger.info(f"Saving db {hdfFilePath}")
+
+        dbKey = os.path.splitext(self.dbFile)[0]
+
+        startFileBytes = sanpy.h5Util.getFileBytes(hdfFilePath)
 
         # save each bAnalysis
+        savedUuids = []
         for row in range(len(df)):
             ba = df.at[row, "_ba"]
             if ba is not None:
@@ -764,6 +1075,7 @@ class analysisDir:
                     # we are now saved into h5 file, remember uuid to load
                     # print('xxx SETTING dir uuid')
                     df.at[row, "uuid"] = ba.uuid
+                    savedUuids.append(ba.uuid)
 
         # rebuild (L, A, S) columns
         self._updateLoadedAnalyzed()
@@ -771,27 +1083,53 @@ class analysisDir:
         #
         # save file database
         logger.info(f"    saving file db with {len(df)} rows")
-        print(df)
 
-        dbKey = os.path.splitext(self.dbFile)[0]
         df = df.drop("_ba", axis=1)  # don't ever save _ba, use it for runtime
 
         # hdfStore[dbKey] = df  # save it
-        df.to_hdf(hdfFilePath, dbKey)
+        df.to_hdf(hdfFilePath, key=dbKey)
 
         #
         self._isDirty = False  # if true, prompt to save on quit
 
+        bytesWritten = sanpy.h5Util.getFileBytes(hdfFilePath) - startFileBytes
+
         # rebuild the file to remove old changes and reduce size
-        # self._rebuildHdf()
-        sanpy.h5Util._repackHdf(hdfFilePath)
+        repacked = sanpy.h5Util.repackIfFragmented(hdfFilePath)
+
+        # pooled analysis of saved files now matches h5 file
+        if self._poolCache is not None:
+            for row in range(len(df)):
+                ba = self._df.at[row, "_ba"]
+                if ba is None or ba.uuid not in savedUuids:
+                    continue
+                poolEntry = self._poolCache.get(ba.uuid)
+                if poolEntry is None:
+                    continue
+                if poolEntry["generation"] == ba.analysisGeneration:
+                    poolEntry["saved"] = True
+                else:
+                    self._poolCache.pop(ba.uuid)
+            if self.persistPool:
+                self._savePoolCache()
 
         # list the keys in the file
         # sanpy.h5Util.listKeys(hdfFilePath)
 
         stop = time.time()
-        logger.info(f"Saving took {round(stop-start,2)} seconds")
+        seconds = round(stop - start, 2)
+        self.signalWindow(
+            f"Saved {len(savedUuids)} analysis, wrote {bytesWritten} bytes in {seconds} seconds"
+        )
+
+        return {
+            "numSaved": len(savedUuids),
+            "bytesWritten": bytesWritten,
+            "seconds": seconds,
+            "repacked": repacked,
+        }
 
+    @_hdfLocked
     def loadHdf(self, path=None, verbose=False):
         """Load the database key from an h5 file.
 
@@ -861,14 +1199,15 @@ class analysisDir:
                 logger.info(f"    Retreiving uuid from hdf file {uuid}")
 
             # load from abf
-            ba = sanpy.bAnalysis(path, fileLoaderDict=self._fileLoaderDict, verbose=verbose)
+            ba = sanpy.bAnalysis(path, fileLoaderDict=self.fileLoaderDict, verbose=verbose, lazy=self.lazy)
 
             # load analysis from h5 file, will fail if uuid is not in file
-            ba._loadHdf_pytables(hdfPath, uuid)
+            with self._hdfLock:
+                ba._loadHdf_pytables(hdfPath, uuid)
 
         if allowAutoLoad and ba is None:
             # load from path
-            ba = sanpy.bAnalysis(path, fileLoaderDict=self._fileLoaderDict, verbose=verbose)
+            ba = sanpy.bAnalysis(path, fileLoaderDict=self.fileLoaderDict, verbose=verbose, lazy=self.lazy)
             if verbose:
                 logger.info(f"    Loaded ba from path {path} and now ba:{ba}")
         #
@@ -879,6 +1218,7 @@ class analysisDir:
         hdfPath = os.path.join(self.path, hdfFile)
         return hdfPath
 
+    @_hdfLocked
     def _deleteFromHdf(self, uuid):
         """Delete uuid from h5 file.
 
@@ -903,16 +1243,31 @@ class analysisDir:
 
         #
         if removed:
+            if self._poolCache is not None:
+                self._poolCache.pop(uuid, None)
             # will rebuild on next save
             # self._rebuildHdf()
-            self._updateLoadedAnalyzed()
+            # callers refresh the table, see removeRowFromDatabase() and deleteRow()
             self._isDirty = True  # if true, prompt to save on quit
 
-    def loadFolder(self, path=None, loadData=False) -> pd.DataFrame:
+    def loadFolder(self, path=None, loadData=False, workers=None) -> pd.DataFrame:
         """Parse a folder and load all (abf, csv, ...).
         
         Only called if no h5 file.
 
+        The table row of each file is remembered in a header index file, keyed by
+        file (path, size, mtime). Only new or modified files are loaded, in a
+        pool of threads. See loadHeaderIndex().
+
+        Parameters
+        ----------
+        path : str
+            Folder path, if None then use self.path
+        loadData : bool
+            If True then load raw data of all files, the header index is not used
+        workers : int
+            Number of threads to load files, None for ThreadPoolExecutor default
+
         TODO: get rid of loading database from .csv (it is replaced by .h5 file)
         TODO: extend the logic to load from cloud (after we were instantiated)
         """
@@ -930,34 +1285,75 @@ class analysisDir:
         fileList = self.getFileList(path)
         _numFilesToLoad = len(fileList)
         start = time.time()
-        # build new db dataframe
-        listOfDict = []
+
+        # rows of unchanged files come from the header index, only probe the others
+        headerIndex = self.loadHeaderIndex()
+        rowDictList = [None] * _numFilesToLoad
+        baList = [None] * _numFilesToLoad
+        probeList = []
         for rowIdx, fullFilePath in enumerate(fileList):
-            
-            self.signalWindow(
-                f'Loading file {rowIdx+1} of {_numFilesToLoad} "{fullFilePath}"'
-            )
+            rowDict = None
+            if not loadData:
+                rowDict = self._getIndexedRow(headerIndex, fullFilePath)
+            if rowDict is None:
+                probeList.append(rowIdx)
+            else:
+                rowDictList[rowIdx] = rowDict
+
+        if probeList:
+            logger.info(f"Probing {len(probeList)} of {_numFilesToLoad} files not in header index")
 
+        def _probeFile(rowIdx):
+            fullFilePath = fileList[rowIdx]
+            try:
+                fileStat = _fileStat(fullFilePath)
+            except OSError:
+                fileStat = None
             # rowDict is what we are showing in the file table
             # abb debug vue, set loadData=True
             # loads bAnalysis
             ba, rowDict = self.getFileRow(fullFilePath, loadData=loadData)
+            return ba, rowDict, fileStat
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_probeFile, rowIdx): rowIdx for rowIdx in probeList}
+            for numProbed, future in enumerate(concurrent.futures.as_completed(futures)):
+                rowIdx = futures[future]
+                fullFilePath = fileList[rowIdx]
+                self.signalWindow(
+                    f'Loading file {numProbed+1} of {len(probeList)} "{fullFilePath}"'
+                )
+                ba, rowDict, fileStat = future.result()
+                if rowDict is None:
+                    logger.warning(f'error loading file {fullFilePath}')
+                    continue
+                if fileStat is not None:
+                    headerIndex[os.path.abspath(fullFilePath)] = {
+                        "size": fileStat[0],
+                        "mtime": fileStat[1],
+                        "row": rowDict,
+                    }
+                rowDictList[rowIdx] = dict(rowDict)
+                baList[rowIdx] = ba
+
+        if probeList and self.useHeaderIndex:
+            self.saveHeaderIndex(headerIndex)
 
+        # build new db dataframe
+        listOfDict = []
+        for rowIdx, rowDict in enumerate(rowDictList):
             if rowDict is None:
-                logger.warning(f'error loading file {fullFilePath}')
                 continue
-            
+
             # as we parse the folder, don't load ALL files (will run out of memory)
             if loadData:
-                rowDict["_ba"] = ba
+                rowDict["_ba"] = baList[rowIdx]
             else:
                 rowDict["_ba"] = None  # ba
 
             # do not assign uuid until bAnalysis is saved in h5 file
             # rowDict['uuid'] = ''
 
-            # logger.info(f'    row:{rowIdx} relPath:{relPath} fullFilePath:{fullFilePath}')
-
             listOfDict.append(rowDict)
 
         stop = time.time()
@@ -968,6 +1364,66 @@ class analysisDir:
         
         return df
 
+    def _getHeaderIndexPath(self):
+        return os.path.join(self.path, self.headerIndexFile)
+
+    def loadHeaderIndex(self) -> dict:
+        """Load the header index of files in folder.
+
+        Returns
+        -------
+        dict
+            Keys are absolute file path, values are dict with keys (size, mtime, row).
+            Empty if there is no header index, it is from an older version
+            or useHeaderIndex is False.
+        """
+        if not self.useHeaderIndex:
+            return {}
+        indexPath = self._getHeaderIndexPath()
+        if not os.path.isfile(indexPath):
+            return {}
+        try:
+            with open(indexPath, "r") as f:
+                headerIndex = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Did not load header index "{indexPath}" {e}')
+            return {}
+        if headerIndex.get("version") != _headerIndexVersion:
+            return {}
+        return headerIndex.get("files", {})
+
+    def saveHeaderIndex(self, headerIndex : dict):
+        """Save the header index of files in folder, see loadHeaderIndex()."""
+        indexPath = self._getHeaderIndexPath()
+        tmpIndexPath = indexPath + ".tmp"
+        indexDict = {
+            "version": _headerIndexVersion,
+            "files": headerIndex,
+        }
+        try:
+            with open(tmpIndexPath, "w") as f:
+                json.dump(indexDict, f, default=_jsonDefault)
+            os.replace(tmpIndexPath, indexPath)
+        except OSError as e:
+            # folder may be read only
+            logger.warning(f'Did not save header index "{indexPath}" {e}')
+
+    def _getIndexedRow(self, headerIndex : dict, path : str) -> Optional[dict]:
+        """Get file table row from header index, None if file is not indexed or has changed."""
+        indexEntry = headerIndex.get(os.path.abspath(path))
+        if indexEntry is None:
+            return None
+        try:
+            size, mtime = _fileStat(path)
+        except OSError:
+            return None
+        if indexEntry["size"] != size or indexEntry["mtime"] != mtime:
+            return None
+        rowDict = dict(indexEntry["row"])
+        # relative to the folder we have loaded
+        rowDict["relPath"] = self._getRelPath(path)
+        return rowDict
+
     def _checkColumns(self, verbose = False):
         """Check columns in loaded vs sanpyColumns (and vica versa).
         """
@@ -996,16 +1452,24 @@ class analysisDir:
         """Refresh Loaded (L) and Analyzed (A) columns.
 
         Arguments:
-            theRowIdx (int): Update just one row
+            theRowIdx (int): Update just one row, it is remembered for takeChangedRows()
 
         TODO: For kymograph, add rows (left, top, right, bottom) and update
         """
         if self._df is None:
             return
-        for rowIdx in range(len(self._df)):
-            if theRowIdx is not None and theRowIdx != rowIdx:
-                continue
-
+        if theRowIdx is None:
+            self._tableGeneration += 1
+            self._changedRows.clear()
+            rowList = range(len(self._df))
+        else:
+            self._changedRows.add(theRowIdx)
+            rowList = [theRowIdx]
+        for col in ["N", "E"]:
+            # empty rows are '', pandas may infer a str column that does not take int
+            if self._df[col].dtype != object:
+                self._df[col] = self._df[col].astype(object)
+        for rowIdx in rowList:
             ba = self._df.loc[rowIdx, "_ba"]  # Can be None
 
             # uuid = self._df.at[rowIdx, 'uuid']
@@ -1024,12 +1488,14 @@ class analysisDir:
             # analyzed
             if self.isAnalyzed(rowIdx):
                 theChar = "\u2022"  # FILLED BULLET
-                self._df.loc[rowIdx, "N"] = ba.numSpikes
-                _numErrors = ba.numErrors
-                if _numErrors is None:
-                    _numErrors = ''
-                # logger.warning(f'setting E to _numErrors {_numErrors}')
-                self._df.loc[rowIdx, "E"] = _numErrors
+                if ba is not None:
+                    # otherwise unloaded by _evictAnalysis(), keep N and E
+                    self._df.loc[rowIdx, "N"] = ba.numSpikes
+                    _numErrors = ba.numErrors
+                    if _numErrors is None:
+                        _numErrors = ''
+                    # logger.warning(f'setting E to _numErrors {_numErrors}')
+                    self._df.loc[rowIdx, "E"] = _numErrors
             # elif uuid:
             #    #theChar = '\u25CB'
             #    theChar = '\u25e6'  # white bullet
@@ -1048,7 +1514,7 @@ class analysisDir:
             self._df.loc[rowIdx, "S"] = theChar
             #
             # start(s) and stop(s) from ba detectionDict
-            if self.isAnalyzed(rowIdx):
+            if ba is not None and self.isAnalyzed(rowIdx):
                 # set table to values we just detected with
                 startSec = ba.getDetectionDict()["startSeconds"]
                 stopSec = ba.getDetectionDict()["stopSeconds"]
@@ -1115,7 +1581,12 @@ class analysisDir:
         # print('qqq', rowIdx, ba, type(ba))
         # sanpy.bAnalysis_.bAnalysis
         # if isinstance(ba, sanpy.bAnalysis):
-        if ba is not None:
+        if ba is None:
+            # analysis unloaded by _evictAnalysis() is still analyzed
+            evicted = self._evicted.get(self._df.loc[rowIdx, "relPath"])
+            if evicted is not None:
+                isAnalyzed = evicted[1]
+        else:
             try:
                 isAnalyzed = ba.isAnalyzed()
             except(AttributeError) as e:
@@ -1135,6 +1606,7 @@ class analysisDir:
 
     def hasDirty(self):
         """Return true if any bAnalysis in list has been analyzed but not saved (e.g. is dirty)"""
+        self._reattachEvicted()
         haveDirty = False
         numRows = len(self._df)
         for rowIdx in range(numRows):
@@ -1170,9 +1642,14 @@ class analysisDir:
             relPath = self._df.loc[rowIdx, "relPath"]
             filePath = self.getPathFromRelPath(relPath)
 
-            ba = self.loadOneAnalysis(
-                filePath, uuid, allowAutoLoad=allowAutoLoad, verbose=verbose
-            )
+            # still used after _evictAnalysis(), e.g. by the interface
+            ba = self._takeEvicted(relPath)
+            if ba is None and self._prefetcher is not None and (allowAutoLoad or uuid):
+                ba = self._prefetcher.take((filePath, uuid))
+            if ba is None:
+                ba = self.loadOneAnalysis(
+                    filePath, uuid, allowAutoLoad=allowAutoLoad, verbose=verbose
+                )
             # load
             """
             logger.info(f'Loading bAnalysis from row {rowIdx} "{filePath}"')
@@ -1213,10 +1690,116 @@ class analysisDir:
 
                 #
                 # update stats of table load/analyzed columns
-                self._updateLoadedAnalyzed()
+                self._updateLoadedAnalyzed(rowIdx)
+
+        if ba is not None and not ba.loadError and ba.fileLoader.sweepY_filtered is None:
+            # results from detectAll() are attached without filtering the recording
+            ba._getFilteredRecording()
+
+        if ba is not None and self.memoryBudgetBytes is not None:
+            self._lastAccess[id(ba)] = next(self._accessCount)
+            self._evictAnalysis(keepRow=rowIdx)
 
         return ba
 
+    def _evictAnalysis(self, keepRow=None):
+        """Unload least recently used analyses until loaded files fit in memoryBudgetBytes.
+
+        Dirty analyses (not saved) and keepRow are never unloaded.
+        An unloaded row is loaded again by getAnalysis(), from the h5 file if it was saved.
+        """
+        loadedBytes = 0
+        evictable = []  # (last access, row, bAnalysis)
+        lastAccess = {}
+        for row, ba in self._df["_ba"].items():
+            if ba is None or ba == "":
+                continue
+            loadedBytes += ba.memoryBytes
+            lastAccess[id(ba)] = self._lastAccess.get(id(ba), -1)
+            if row != keepRow and not ba.isDirty():
+                evictable.append((lastAccess[id(ba)], row, ba))
+        # forget analyses that are no longer loaded
+        self._lastAccess = lastAccess
+
+        if loadedBytes <= self.memoryBudgetBytes:
+            return
+
+        evictable.sort(key=lambda oneEvictable: oneEvictable[0])
+        numEvicted = 0
+        for _lastAccess, row, ba in evictable:
+            if loadedBytes <= self.memoryBudgetBytes:
+                break
+            loadedBytes -= ba.memoryBytes
+            relPath = self._df.loc[row, "relPath"]
+            self._evicted[relPath] = (weakref.ref(ba), ba.isAnalyzed())
+            self._lastAccess.pop(id(ba), None)
+            self._df.at[row, "_ba"] = None
+            # the file is opened again if the analysis is still in use, see _takeEvicted()
+            ba.close()
+            numEvicted += 1
+            self._updateLoadedAnalyzed(row)
+
+        logger.info(f"Unloaded {numEvicted} files over memory budget of {self.memoryBudgetBytes} bytes")
+
+    def _takeEvicted(self, relPath) -> Optional[sanpy.bAnalysis]:
+        """Get the analysis unloaded by _evictAnalysis() if it is still in memory."""
+        evicted = self._evicted.pop(relPath, None)
+        if evicted is None:
+            return None
+        return evicted[0]()  # None if it was garbage collected
+
+    def _reattachEvicted(self):
+        """Load again unloaded analyses that were changed after _evictAnalysis(), so they are saved."""
+        for relPath, (baRef, _isAnalyzed) in list(self._evicted.items()):
+            ba = baRef()
+            if ba is None or not ba.isDirty():
+                continue
+            rowList = self._df.index[self._df["relPath"] == relPath].tolist()
+            if not rowList:
+                continue
+            del self._evicted[relPath]
+            self._df.at[rowList[0], "_ba"] = ba
+            self._updateLoadedAnalyzed(rowList[0])
+
+    def prefetch(self, rowIdx):
+        """Load files in the rows before and after rowIdx in a background thread.
+
+        Call after getAnalysis(rowIdx) when the user selects a row, the next
+        getAnalysis() of a neighbouring row does not wait for the file to load.
+        Queued loads of rows that are no longer neighbours are cancelled.
+
+        Parameters
+        ----------
+        rowIdx (int):
+            Row index from table, neighbours are in the current (sorted) row order
+        """
+        if self._prefetcher is None:
+            return
+        rowPosition = self._df.index.get_loc(rowIdx)
+        keys = []
+        for offset in range(1, self._prefetchFiles + 1):
+            for position in [rowPosition + offset, rowPosition - offset]:
+                if position < 0 or position >= len(self._df):
+                    continue
+                row = self._df.index[position]
+                ba = self._df.loc[row, "_ba"]
+                if ba is not None and ba != "":
+                    # already loaded
+                    continue
+                relPath = self._df.loc[row, "relPath"]
+                uuid = self._df.loc[row, "uuid"]
+                keys.append((self.getPathFromRelPath(relPath), uuid))
+        self._prefetcher.prefetch(keys)
+
+    def getPrefetchStats(self) -> Optional[dict]:
+        """Get hits and misses of prefetched files, see analysisPrefetcher.getStats().
+
+        None if not prefetching.
+        """
+        if self._prefetcher is None:
+            return None
+        return self._prefetcher.getStats()
+
     def _setColumnType(self, df):
         """Needs to be called every time a df is created.
         Ensures proper type of columns following sanpyColumns[key]['type']
@@ -1286,7 +1869,7 @@ class analysisDir:
         # loadData is false, load header
         ba = sanpy.bAnalysis(path,
                              loadData=loadData,
-                             fileLoaderDict=self._fileLoaderDict)
+                             fileLoaderDict=self.fileLoaderDict)
 
         if ba.loadError:
             logger.error(f'Error loading bAnalysis file "{path}"')
@@ -1350,13 +1933,21 @@ class analysisDir:
         for k,v in ba.metaData.items():
             rowDict[k] = v
 
+        relPath = self._getRelPath(path)
+
+        rowDict["relPath"] = relPath
+
+        #logger.info(f'2) xxx relPath: "{relPath}"')
+        # logger.info('qqq')
+        # print(rowDict)
+
+        return ba, rowDict
+
+    def _getRelPath(self, path : str) -> str:
+        """Get path relative to the folder we have loaded."""
         # remove the path to the folder we have loaded
         relPath = path.replace(self.path, "")
         
-        # logger.info(f'xxx self.path: "{self.path}"')
-        # logger.info(f'xxx path: "{path}"')
-        # logger.info(f'xxx relPath: "{relPath}"')
-        
         if relPath.startswith("/"):
             # so we can use os.path.join()
             relPath = relPath[1:]
@@ -1364,14 +1955,7 @@ class analysisDir:
         if relPath.startswith("\\"):
             # so we can use os.path.join()
             relPath = relPath[1:]
-
-        rowDict["relPath"] = relPath
-
-        #logger.info(f'2) xxx relPath: "{relPath}"')
-        # logger.info('qqq')
-        # print(rowDict)
-
-        return ba, rowDict
+        return relPath
 
     def getFileList(self,
                     path: str = None,
@@ -1519,10 +2103,15 @@ class analysisDir:
                     
         #
         self._df = df
+        self._tableGeneration += 1
 
     def unloadRow(self, rowIdx):
+        ba = self._df.loc[rowIdx, "_ba"]
+        if isinstance(ba, sanpy.bAnalysis):
+            ba.close()
         self._df.loc[rowIdx, "_ba"] = None
-        self._updateLoadedAnalyzed()
+        self._evicted.pop(self._df.loc[rowIdx, "relPath"], None)
+        self._updateLoadedAnalyzed(rowIdx)
 
     def removeRowFromDatabase(self, rowIdx):
         # delete from h5 file
@@ -1531,8 +2120,9 @@ class analysisDir:
 
         # clear uuid
         self._df.at[rowIdx, "uuid"] = ""
+        self._evicted.pop(self._df.at[rowIdx, "relPath"], None)
 
-        self._updateLoadedAnalyzed()
+        self._updateLoadedAnalyzed(rowIdx)
 
     def deleteRow(self, rowIdx):
         df = self._df
@@ -1648,6 +2238,10 @@ class analysisDir:
 
     def pool_build(self, uniqueColumn=None, allowAutoLoad=False, includeNo=True, verbose=False):
         """Build one df with all analysis. Use this in plot tool plugin.
+
+        The df of each file is cached by bAnalysis uuid and analysisGeneration,
+        only files whose analysis changed are pooled again. If persistPool, the df
+        of saved files is also cached on disk and those files are not loaded.
         
         Parameters
         ----------
@@ -1660,7 +2254,7 @@ class analysisDir:
         if verbose:
             logger.info("")
         
-        masterDf = None
+        dfList = []
         
         # for row in range(self.numFiles):
         for rowIdx, rowDict in self._df.iterrows():
@@ -1669,57 +2263,28 @@ class analysisDir:
                     logger.info(f'  rowIdx:{rowIdx} Include is "no"')
                 continue
 
-            ba = self.getAnalysis(rowIdx, allowAutoLoad=allowAutoLoad)
-            if ba is None:
+            oneDf = self._getPooledAnalysis(rowIdx, allowAutoLoad=allowAutoLoad, verbose=verbose)
+            if oneDf is None:
                 continue
-            
-            if not ba.isAnalyzed():
-                if verbose:
-                    logger.info(f"  rowIdx:{rowIdx} not analyzed")
-                continue
-                
-            oneDf = ba.asDataFrame(regenerateAnalysisDataFrame=True)
-            
-            if oneDf is not None:
-
-                self.signalWindow(f'Adding "{ba.fileLoader.filename}"', verbose=verbose)
-                
-                oneDf["File Number"] = int(rowIdx)
-                
-                # 20240114
-                oneDf['File Path'] = ba.fileLoader.filepath
-
-                uniqueName = os.path.splitext(ba.fileLoader.filename)[0]
-                if uniqueColumn is not None:
-                    uniqueName = rowDict[uniqueColumn] + '-' + uniqueName
-                oneDf["Unique Name"] = uniqueName
-
-                # logger.warning('TEMPORARY WHILE WORKING ON KYM POOLING !!!!!!!!!!!!!!!!!!!!!!!!!')
-                # logger.warning('randomly assigning sex to male, female, unknown')
-                # sexList = ['male', 'female', 'unknown']
-                # oneDf['Sex'] = random.choice(sexList)
-                oneDf_thresholdVal = oneDf['thresholdVal'].to_numpy()  # take off potential
-                oneDf_thresholdVal_mean = np.nanmean(oneDf_thresholdVal)
-                if oneDf_thresholdVal_mean > 0.5685522031727147:  # mean of all thresholdVal
-                    # print(f'oneDf_thresholdVal_mean:{oneDf_thresholdVal_mean} male')
-                    oneDf['Sex'] ='male'  # pandas dataframe columns are Capitalized !!!!!
-                else:
-                    oneDf['Sex'] = 'female'
-                    # print(f'oneDf_thresholdVal_mean:{oneDf_thresholdVal_mean} female')
-
-                # print('FINAL SEX IS !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!')
-                # print(oneDf['sex'])
-                # drop some redundant analysis results (not in file metadata)
-                
-                if masterDf is None:
-                    masterDf = oneDf
-                else:
-                    masterDf = pd.concat([masterDf, oneDf], ignore_index=True)
+
+            self.signalWindow(f'Adding "{rowDict["File"]}"', verbose=verbose)
+
+            oneDf = oneDf.copy()
+            oneDf["File Number"] = int(rowIdx)
+
+            uniqueName = os.path.splitext(os.path.split(oneDf['File Path'].iloc[0])[1])[0]
+            if uniqueColumn is not None:
+                uniqueName = rowDict[uniqueColumn] + '-' + uniqueName
+            oneDf["Unique Name"] = uniqueName
+
+            dfList.append(oneDf)
         #
-        if masterDf is None:
+        if not dfList:
+            masterDf = None
             if verbose:
                 logger.error("Did not find any analysis.")
         else:
+            masterDf = pd.concat(dfList, ignore_index=True)
             # add an index column (for plotting)
             masterDf['index'] = [x for x in range(len(masterDf))]
             if verbose:
@@ -1740,10 +2305,235 @@ class analysisDir:
             #         print('  -->> male')
 
         # print(masterDf.head())
-        #self._poolDf = masterDf
 
         return masterDf
 
+    def _getPooledAnalysis(self, rowIdx, allowAutoLoad=False, verbose=False) -> Optional[pd.DataFrame]:
+        """Get the pooled df of one file (row), from the pool cache if analysis did not change.
+
+        Do not modify the returned df, it is in the cache.
+        """
+        poolCache = self._getPoolCache()
+
+        rowUuid = self._df.loc[rowIdx, "uuid"]  # if we have a uuid bAnalysis is saved in h5
+        ba = self._df.loc[rowIdx, "_ba"]
+        if ba is None or ba == "":
+            # not loaded, use pooled analysis of saved file
+            poolEntry = poolCache.get(rowUuid) if rowUuid else None
+            if poolEntry is not None and poolEntry["saved"]:
+                return poolEntry["df"]
+
+        ba = self.getAnalysis(rowIdx, allowAutoLoad=allowAutoLoad)
+        if ba is None:
+            return None
+        
+        if not ba.isAnalyzed():
+            if verbose:
+                logger.info(f"  rowIdx:{rowIdx} not analyzed")
+            return None
+
+        isSaved = not ba.detectionDirty and rowUuid == ba.uuid
+
+        poolEntry = poolCache.get(ba.uuid)
+        if poolEntry is not None:
+            if poolEntry["generation"] == ba.analysisGeneration:
+                return poolEntry["df"]
+            if poolEntry["saved"] and isSaved:
+                # loaded from h5 and not changed
+                poolEntry["generation"] = ba.analysisGeneration
+                return poolEntry["df"]
+
+        oneDf = ba.asDataFrame(regenerateAnalysisDataFrame=True)
+        if oneDf is None:
+            return None
+        oneDf = oneDf.copy()
+
+        # 20240114
+        oneDf['File Path'] = ba.fileLoader.filepath
+
+        # logger.warning('TEMPORARY WHILE WORKING ON KYM POOLING !!!!!!!!!!!!!!!!!!!!!!!!!')
+        # logger.warning('randomly assigning sex to male, female, unknown')
+        # sexList = ['male', 'female', 'unknown']
+        # oneDf['Sex'] = random.choice(sexList)
+        oneDf_thresholdVal = oneDf['thresholdVal'].to_numpy()  # take off potential
+        oneDf_thresholdVal_mean = np.nanmean(oneDf_thresholdVal)
+        if oneDf_thresholdVal_mean > 0.5685522031727147:  # mean of all thresholdVal
+            # print(f'oneDf_thresholdVal_mean:{oneDf_thresholdVal_mean} male')
+            oneDf['Sex'] ='male'  # pandas dataframe columns are Capitalized !!!!!
+        else:
+            oneDf['Sex'] = 'female'
+            # print(f'oneDf_thresholdVal_mean:{oneDf_thresholdVal_mean} female')
+
+        poolCache[ba.uuid] = {
+            "generation": ba.analysisGeneration,
+            "saved": isSaved,
+            "df": oneDf,
+        }
+        return oneDf
+
+    def _getPoolCache(self) -> dict:
+        """Get the pool cache, load it from poolCacheFile if persistPool.
+
+        Keys are bAnalysis uuid, values are dict with keys:
+            generation: bAnalysis.analysisGeneration of df, None if loaded from disk
+            saved: True if df matches the analysis saved in h5 file
+            df: pooled df of one file
+        """
+        if self._poolCache is None:
+            self._poolCache = self._loadPoolCache() if self.persistPool else {}
+        return self._poolCache
+
+    def _getPoolCachePath(self):
+        return os.path.join(self.path, self.poolCacheFile)
+
+    def _loadPoolCache(self) -> dict:
+        """Load pooled analysis of saved files, empty if h5 file changed since it was saved."""
+        poolCachePath = self._getPoolCachePath()
+        hdfPath = self._getHdfFile()
+        if not os.path.isfile(poolCachePath) or not os.path.isfile(hdfPath):
+            return {}
+
+        poolCache = {}
+        try:
+            with pd.HDFStore(poolCachePath, mode="r") as store:
+                dfHdfStat = store["hdfStat"]
+                if tuple(dfHdfStat.iloc[0]) != _fileStat(hdfPath):
+                    logger.info("h5 file changed, not using pool cache")
+                    return {}
+                for key in store.keys():
+                    uuid = key.strip("/")
+                    if uuid == "hdfStat":
+                        continue
+                    poolCache[uuid] = {
+                        "generation": None,
+                        "saved": True,
+                        "df": store[key],
+                    }
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f'Did not load pool cache "{poolCachePath}" {e}')
+            return {}
+        logger.info(f"Loaded pooled analysis of {len(poolCache)} files")
+        return poolCache
+
+    def _savePoolCache(self):
+        """Save pooled analysis of saved files, see _loadPoolCache()."""
+        poolCachePath = self._getPoolCachePath()
+        tmpPoolCachePath = os.path.splitext(poolCachePath)[0] + "_tmp.h5"
+        hdfPath = self._getHdfFile()
+        try:
+            hdfStat = _fileStat(hdfPath)
+            with warnings.catch_warnings():
+                # object columns are pickled
+                warnings.simplefilter("ignore", category=pd.errors.PerformanceWarning)
+                with pd.HDFStore(tmpPoolCachePath, mode="w") as store:
+                    store["hdfStat"] = pd.DataFrame([hdfStat], columns=["size", "mtime"])
+                    for uuid, poolEntry in self._poolCache.items():
+                        if poolEntry["saved"]:
+                            store[uuid] = poolEntry["df"]
+            os.replace(tmpPoolCachePath, poolCachePath)
+        except (OSError, ValueError) as e:
+            # folder may be read only
+            logger.warning(f'Did not save pool cache "{poolCachePath}" {e}')
+
+    def detectAll(self, detectionDict : dict, workers : Optional[int] = None, verbose=True) -> dict:
+        """Run spike detection on all files, one file per worker process.
+
+        Workers send back only the analysis results (and uuid), each row
+        in the table then gets a bAnalysis holding these results. Rows that
+        were not loaded get a lazy bAnalysis that does not hold the raw
+        recording, the recording is filtered when the row is used, see getAnalysis().
+
+        Parameters
+        ----------
+        detectionDict : dict
+            Detection parameters, see sanpy.bDetection.getDetectionDict()
+        workers : int
+            Number of worker processes, if None then use os.cpu_count().
+            If 1 then detect in this process.
+
+        Returns
+        -------
+        dict
+            Error string for each row index that failed.
+        """
+        start = time.time()
+
+        rowPaths = {}
+        for rowIdx in range(len(self._df)):
+            relPath = self._df.loc[rowIdx, "relPath"]
+            rowPaths[rowIdx] = self.getPathFromRelPath(relPath)
+        numFiles = len(rowPaths)
+
+        errorDict = {}
+        numDone = 0
+
+        def _insertResults(rowIdx, results):
+            nonlocal numDone
+            numDone += 1
+            uuid, dfAnalysis, errorStr = results
+            filename = os.path.split(rowPaths[rowIdx])[1]
+            if errorStr is None:
+                errorStr = self._setDetectionResults(rowIdx, uuid, detectionDict, dfAnalysis)
+            if errorStr is not None:
+                logger.error(f'row {rowIdx} "{filename}" {errorStr}')
+                errorDict[rowIdx] = errorStr
+            self.signalWindow(f'Detected {numDone} of {numFiles} "{filename}"', verbose=verbose)
+
+        if workers == 1:
+            for rowIdx, path in rowPaths.items():
+                uuid = self._df.loc[rowIdx, "uuid"]
+                _insertResults(rowIdx, _detectOneFile(path, detectionDict, uuid))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {}
+                for rowIdx, path in rowPaths.items():
+                    uuid = self._df.loc[rowIdx, "uuid"]
+                    future = pool.submit(_detectOneFile, path, detectionDict, uuid)
+                    futures[future] = rowIdx
+                for future in concurrent.futures.as_completed(futures):
+                    rowIdx = futures[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # e.g. worker process died
+                        results = (None, None, f'{type(e).__name__}: {e}')
+                    _insertResults(rowIdx, results)
+
+        self._updateLoadedAnalyzed()
+
+        if self.memoryBudgetBytes is not None:
+            self._evictAnalysis()
+
+        stop = time.time()
+        logger.info(f"Detected {numFiles - len(errorDict)} of {numFiles} files in {round(stop-start,2)} seconds")
+
+        return errorDict
+
+    def _setDetectionResults(self, rowIdx : int, uuid : str, detectionDict : dict, dfAnalysis : pd.DataFrame):
+        """Insert detection results from detectAll() into the bAnalysis of a row.
+
+        If the row is not loaded, the file is opened lazy and is not filtered
+        so the raw recording of each file is not held in memory.
+
+        Returns
+        -------
+        str
+            None on success, otherwise an error string.
+        """
+        ba = self._df.loc[rowIdx, "_ba"]
+        if ba is None or ba == "":
+            relPath = self._df.loc[rowIdx, "relPath"]
+            filePath = self.getPathFromRelPath(relPath)
+            ba = sanpy.bAnalysis(filePath, loadData=False, fileLoaderDict=self.fileLoaderDict, lazy=True)
+            if ba.loadError:
+                return f'Error loading file "{filePath}"'
+            self._df.at[rowIdx, "_ba"] = ba
+        if uuid:
+            # keep the uuid we are saved under in the h5 file
+            ba.uuid = uuid
+        ba._setDetectionResults(detectionDict, dfAnalysis)
+        return None
+
     def signalWindow(self, str, verbose=True):
         """Update status bar of SanPy window.
 
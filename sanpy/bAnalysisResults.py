@@ -1,6 +1,7 @@
+import copy
 import json
-import os
-from typing import Dict, List, Tuple
+import numbers
+from typing import List
 
 import numpy as np  # needed to convert np types to JSON types in save
 import pandas as pd
@@ -580,10 +581,17 @@ class NumpyEncoder(json.JSONEncoder):
 
 class analysisResultList:
     """Class encapsulating a list of analysis results.
-    
+
     Each row is an analysisResultDict for one spike.
 
     These are keys in bAnalysis_ spike dict and columns in output reports
+
+    Results are stored column wise (struct of arrays), one np.ndarray per key.
+    Results of type 'list' (errors, halfHeights, widths) are stored in a side table,
+    one python list per spike.
+
+    Use self[spikeIdx][key] to get/set one spike (see analysisResult)
+    and getColumn(key) to get all spikes.
     """
 
     def __init__(self):
@@ -592,10 +600,206 @@ class analysisResultList:
         # TODO: put xxx in a function getAnalysisResltDict()
         self._dDict = analysisResultDict
 
-        # list of analysisResultDict
-        self._myList = []
+        self._numRows = 0
+
+        # allocated rows in each np.ndarray column, grows by doubling
+        self._capacity = 0
+
+        # key -> np.ndarray (numeric, bool, object) or list (ragged)
+        self._columns = {}
+
+        # key -> default value for new rows
+        self._defaults = {}
+
+        # float columns where all values (that are not nan) were set as int
+        # these are returned as int
+        self._intColumns = set()
+
+        for k, v in analysisResultDict.items():
+            self._addColumn(k, v["default"], isRagged=v["type"] == "list")
+
+    def _addColumn(self, key: str, default, isRagged: bool = False):
+        """Add a new column, all existing rows get default."""
+        self._defaults[key] = default
+        if isRagged:
+            self._columns[key] = [copy.copy(default) for _ in range(self._numRows)]
+        elif default is None or (
+            isinstance(default, (int, float, np.integer, np.floating))
+            and not isinstance(default, (bool, np.bool_))
+        ):
+            if default is None:
+                self._defaults[key] = np.nan
+            self._columns[key] = np.full(self._capacity, self._defaults[key], dtype=float)
+            self._intColumns.add(key)
+        elif isinstance(default, (bool, np.bool_)):
+            self._columns[key] = np.full(self._capacity, default, dtype=bool)
+        else:
+            self._columns[key] = np.full(self._capacity, default, dtype=object)
+
+    def _promoteToObject(self, key: str):
+        """Convert a numeric/bool column to object so it can hold any value."""
+        col = self._columns[key]
+        newCol = np.empty(self._capacity, dtype=object)
+        if key in self._intColumns:
+            newCol[: self._numRows] = self.getValues(key).tolist()
+            self._intColumns.discard(key)
+        else:
+            newCol[: self._numRows] = col[: self._numRows].tolist()
+        self._columns[key] = newCol
+
+    def _reserve(self, numRows: int):
+        """Make sure np.ndarray columns can hold numRows."""
+        if numRows <= self._capacity:
+            return
+        newCapacity = max(numRows, 2 * self._capacity, 16)
+        for k, col in self._columns.items():
+            if isinstance(col, list):
+                continue
+            newCol = np.empty(newCapacity, dtype=col.dtype)
+            newCol[: self._numRows] = col[: self._numRows]
+            self._columns[k] = newCol
+        self._capacity = newCapacity
+
+    def _appendRows(self, numRows: int):
+        """Append numRows spikes with default values."""
+        start = self._numRows
+        stop = start + numRows
+        self._reserve(stop)
+        for k, col in self._columns.items():
+            default = self._defaults[k]
+            if isinstance(col, list):
+                col.extend(copy.copy(default) for _ in range(numRows))
+            else:
+                col[start:stop] = default
+        self._numRows = stop
+
+    def _getValue(self, key: str, rowIdx: int):
+        col = self._columns[key]  # raises KeyError
+        if isinstance(col, list):
+            return col[rowIdx]
+        value = col[rowIdx]
+        if col.dtype == bool:
+            return bool(value)
+        if key in self._intColumns and value == value:
+            return int(value)
+        return value
+
+    def _setValue(self, key: str, rowIdx: int, value):
+        if key not in self._columns.keys():
+            if value is None or isinstance(value, numbers.Number):
+                self._addColumn(key, np.nan)
+            else:
+                self._addColumn(key, np.nan, isRagged=isinstance(value, list))
+        col = self._columns[key]
+        if isinstance(col, list):
+            col[rowIdx] = value
+            return
+        if col.dtype == float:
+            if value is None:
+                value = np.nan
+            if isinstance(value, (bool, np.bool_)) or not isinstance(
+                value, numbers.Number
+            ):
+                self._promoteToObject(key)
+            elif not isinstance(value, (int, np.integer)) and value == value:
+                self._intColumns.discard(key)
+        elif col.dtype == bool:
+            if not isinstance(value, (bool, np.bool_)):
+                self._promoteToObject(key)
+        self._columns[key][rowIdx] = value
+
+    def setColumn(self, key: str, values, rowIdx=None, isInt: bool = None):
+        """Set values of one analysis result for all (or some) spikes.
 
-        self._iterIdx = -1
+        Args:
+            key: Name of the analysis result, added if it does not exist.
+            values: Scalar, np.ndarray or list with one value per spike.
+            rowIdx: Optional spike index (int np.ndarray, bool mask, or slice), default is all spikes.
+            isInt: If True, float values (with nan where not defined) are returned as int by self[i][key].
+                If None, this is inferred from the type of values.
+        """
+        allRows = rowIdx is None
+        if rowIdx is None:
+            rowIdx = slice(0, self._numRows)
+
+        if key not in self._columns.keys():
+            isRagged = isinstance(values, list) and (
+                len(values) == 0 or isinstance(values[0], list)
+            )
+            self._addColumn(key, np.nan, isRagged=isRagged)
+
+        col = self._columns[key]
+        if isinstance(col, list):
+            rows = range(self._numRows)[rowIdx] if isinstance(rowIdx, slice) else np.arange(self._numRows)[rowIdx]
+            for row, value in zip(rows, values):
+                col[row] = value
+            return
+
+        values = np.asarray(values)
+        if col.dtype == float:
+            if values.dtype.kind in "iuf":
+                if values.dtype.kind in "iu":
+                    isInt = True
+                elif isInt is None:
+                    isInt = bool(np.isnan(values).all())
+                if isInt and allRows:
+                    self._intColumns.add(key)
+                elif not isInt:
+                    self._intColumns.discard(key)
+            else:
+                self._promoteToObject(key)
+        elif col.dtype == bool and values.dtype.kind != "b":
+            self._promoteToObject(key)
+
+        self._columns[key][: self._numRows][rowIdx] = values
+
+    def getColumn(self, key: str):
+        """Get all values of one analysis result.
+
+        Returns a view (not a copy) into the underlying np.ndarray.
+        Int results are stored as float (with nan) , see getValues().
+        Returns a list for ragged results like 'errors' and 'widths'.
+        """
+        col = self._columns[key]
+        if isinstance(col, list):
+            return col
+        return col[: self._numRows]
+
+    def getValues(self, key: str, rowIdx=None) -> np.ndarray:
+        """Get values of one analysis result as np.ndarray.
+
+        Int results are returned as int np.ndarray if they are all defined (not nan).
+
+        Args:
+            rowIdx: Optional spike index (int np.ndarray, bool mask, or slice)
+        """
+        col = self._columns[key]
+        if isinstance(col, list):
+            rows = np.arange(self._numRows)
+            if rowIdx is not None:
+                rows = rows[rowIdx]
+            values = np.empty(len(rows), dtype=object)
+            for i, row in enumerate(rows):
+                values[i] = col[row]
+        else:
+            values = col[: self._numRows]
+            if rowIdx is not None:
+                values = values[rowIdx]
+        if key in self._intColumns and not np.isnan(values).any():
+            values = values.astype(np.int64)
+        return values
+
+    def sweepMask(self, sweep) -> np.ndarray:
+        """Boolean mask of spikes in sweep, all spikes if sweep is None or 'All'."""
+        if sweep is None or sweep == "All":
+            return np.ones(self._numRows, dtype=bool)
+        return self.getColumn("sweep") == sweep
+
+    def epochMask(self, epoch) -> np.ndarray:
+        """Boolean mask of spikes in epoch, all spikes if epoch is None or 'All'."""
+        if epoch is None or epoch == "All":
+            return np.ones(self._numRows, dtype=bool)
+        return self.getColumn("epoch") == epoch
 
     def setFromListDict(self, listOfDict: List[dict]):
         """Set analysis results from a list of dict.
@@ -607,131 +811,144 @@ class analysisResultList:
 
         This is assuming we re-create self every time we do spike detection
         """
+        self.setFromDataFrame(pd.DataFrame(listOfDict))
 
-        # do not do this, we are an analysisResultList as a list of analysisResult
-        # self._myList = listOfDict
+    def setFromDataFrame(self, df: pd.DataFrame):
+        """Set analysis results from a DataFrame, one row per spike.
 
-        self._myList = []
-        for oneDict in listOfDict:
-            oneAnalysisResult = analysisResult(theDict=oneDict)
-            self._myList.append(oneAnalysisResult)
+        Used when loading sanpy.bAnalysis from h5 file.
+        """
+        self.__init__()
+        self._appendRows(len(df))
+        for key in df.columns:
+            values = df[key].to_numpy()
+            isRagged = key in self._columns.keys() and isinstance(self._columns[key], list)
+            if isRagged or values.dtype.kind not in "biuf":
+                if not isRagged and key not in self._columns.keys():
+                    self._addColumn(key, np.nan)
+                    self._promoteToObject(key)
+                self.setColumn(key, values.tolist())
+            else:
+                # int results with nan are saved as float
+                isInt = None
+                if key in self._dDict.keys() and self._dDict[key]["type"] == "int":
+                    isInt = values.dtype.kind != "f" or bool(
+                        np.all(np.isnan(values) | (values == np.round(values)))
+                    )
+                self.setColumn(key, values, isInt=isInt)
 
     def analysisDate(self):
         if len(self) > 0:
-            return self._myList[0]["analysisDate"]
+            return self[0]["analysisDate"]
         else:
             return None
 
     def analysisTime(self):
         if len(self) > 0:
-            return self._myList[0]["analysisTime"]
+            return self[0]["analysisTime"]
         else:
             return None
 
-    def _old_save(self, saveBase):
-        savePath = saveBase + "-analysis.json"
-
-        analysisList = self.asList()
-
-        # print(analysisList[0].print())
-        print(self._myList[0])
-
-        with open(savePath, "w") as f:
-            json.dump(analysisList, f, cls=NumpyEncoder, indent=4)
-
-    def _old_load(self, loadBase):
-        loadPath = loadBase + "-analysis.json"
-
-        if not os.path.isfile(loadPath):
-            logger.error(f"Did not find file: {loadPath}")
-            return
-
-        with open(loadPath, "r") as f:
-            self._myList = json.load(f)
-
-    def appendDefault(self):
-        """Append a spike to analysis.
+    def appendDefault(self, numRows: int = 1):
+        """Append a spike (or numRows spikes) to analysis.
 
         Used in bAnalysis spike detection.
         """
-        oneResult = analysisResult()
-        self._myList.append(oneResult)
+        self._appendRows(numRows)
 
-    def appendAnalysis(self, analysisResultList):
-        for analysisResult in analysisResultList:
-            # analysisResult is for one spike
-            self._myList.append(analysisResult)
+    def appendAnalysis(self, analysisResultList: "analysisResultList"):
+        """Append all spikes in another analysisResultList."""
+        numRows = len(analysisResultList)
+        if numRows == 0:
+            return
+        start = self._numRows
+        self._appendRows(numRows)
+        rowIdx = slice(start, start + numRows)
+        for k, col in analysisResultList._columns.items():
+            if k not in self._columns.keys():
+                if isinstance(col, list):
+                    self._addColumn(k, [], isRagged=True)
+                else:
+                    self._addColumn(k, np.nan)
+                    if col.dtype != float:
+                        self._promoteToObject(k)
+            if isinstance(col, list):
+                self._columns[k][start:] = col
+            else:
+                self.setColumn(
+                    k,
+                    col[:numRows],
+                    rowIdx=rowIdx,
+                    isInt=k in analysisResultList._intColumns,
+                )
 
     def addAnalysisResult(self, theKey, theDefault=None):
-        # go through list and add to each [i] dict
-        for spike in self:
-            spike.addNewKey(theKey, theDefault=theDefault)
+        """Add a new analysis result (column) to all spikes."""
+        if theKey in self._columns.keys():
+            return
+        if theDefault is None:
+            theDefault = float("nan")
+        self._addColumn(theKey, theDefault, isRagged=isinstance(theDefault, list))
+        if not isinstance(self._columns[theKey], list):
+            self._columns[theKey][: self._numRows] = theDefault
 
     def asList(self):
         """
-        Return underlying list.
+        Return a list of dict, one dict per spike.
         """
-        # return [spike.asDict() for spike in self._myList]
-        return [x.asDict() for x in self._myList]
+        return [x.asDict() for x in self]
 
     def asDataFrame(self):
+        """Get all spikes as a DataFrame, one row per spike.
+
+        Numeric and bool columns are not copied.
         """
-        Note: underlying _myList is a list of analysisResult
-        """
-        return pd.DataFrame(self.asList())
+        if self._numRows == 0:
+            return pd.DataFrame()
+        data = {}
+        for k, col in self._columns.items():
+            if isinstance(col, list):
+                data[k] = pd.Series(col, dtype=object)
+            elif k in self._intColumns:
+                data[k] = self.getValues(k)
+            else:
+                data[k] = col[: self._numRows]
+        return pd.DataFrame(data, copy=False)
+
+    def keys(self):
+        return self._columns.keys()
 
     def __getitem__(self, key):
         """
         Allow [] indexing with self[int].
         """
         try:
-            # return self._dDict[key]['currentValue']
-            return self._myList[key]
+            rowIdx = range(self._numRows)[key]
+            return analysisResult(self, rowIdx)
         except IndexError as e:
             logger.error(f"{e}")
             # logger.error(f'possible keys are: {self._myList.keys()}')
 
     def __len__(self):
         """Allow len() with len(this)"""
-        return len(self._myList)
+        return self._numRows
 
     def __iter__(self):
         """Allow iteration with "for item in self"
         """
-        _iterIdx = -1
-        return self
-
-    def __next__(self):
-        """Allow iteration with "for item in self"
-        """
-        self._iterIdx += 1
-        if self._iterIdx >= len(self._myList):
-            self._iterIdx = -1  # reset to initial value
-            raise StopIteration
-        else:
-            return self._myList[self._iterIdx]
+        return (analysisResult(self, rowIdx) for rowIdx in range(self._numRows))
 
 
 class analysisResult:
-    def __init__(self, theDict=None):
-        """Create an anlysis item (for one spike)
+    def __init__(self, resultList: analysisResultList, rowIdx: int):
+        """One spike in an analysisResultList, behaves like a dict.
 
         Args:
-            theDict: Pre-existing dict when we load form h5 file
+            resultList: The analysisResultList holding the values.
+            rowIdx: Spike index into resultList
         """
-        # this is the raw definition of analysis results (See above)
-        # pull from this to create key/value self.rDict
-        # self._dDict = analysisResultDict
-        defaultDict = analysisResultDict
-        # this is simple key/value pairs as we will in detection
-        self._rDict = {}
-        for k, v in defaultDict.items():
-            default = v["default"]
-            self._rDict[k] = default
-
-        if theDict is not None:
-            for k, v in theDict.items():
-                self[k] = v  # calls __setitem__()
+        self._resultList = resultList
+        self._rowIdx = rowIdx
 
     # this was interfering with converting to DataFrame ???
     """
@@ -748,7 +965,7 @@ class analysisResult:
 
     def print(self):
         printList = []
-        for k, v in self._rDict.items():
+        for k, v in self.items():
             if isinstance(v, list):
                 for item in v:
                     for k2, v2 in item.items():
@@ -768,14 +985,14 @@ class analysisResult:
             theDefault = float("nan")
 
         # check if key exists
-        keyExists = theKey in self._rDict.keys()
+        keyExists = theKey in self.keys()
         addedKey = False
         if keyExists:
             # key exists, don't modify
             # logger.warning(f'The key "{theKey}" already exists and has value "{self._rDict[theKey]}"')
             pass
         else:
-            self._rDict[theKey] = theDefault
+            self[theKey] = theDefault
             addedKey = True
 
         #
@@ -783,38 +1000,33 @@ class analysisResult:
 
     def asDict(self):
         """
-        Returns underlying dictionary
+        Returns a dictionary of all values
         """
-        return self._rDict
+        return {k: self[k] for k in self.keys()}
 
     def __getitem__(self, key):
         # to mimic a dictionary
         ret = None
         try:
-            # return self._dDict[key]['currentValue']
-            ret = self._rDict[key]
+            ret = self._resultList._getValue(key, self._rowIdx)
         except KeyError as e:
             logger.error(f'Error getting key "{key}"')
-            logger.error(f'possible keys are: {self._rDict.keys()}')
+            logger.error(f"possible keys are: {self.keys()}")
             raise
         #
         return ret
 
     def __setitem__(self, key, value):
         # to mimic a dictionary
-        try:
-            # self._dDict[key]['currentValue'] = value
-            self._rDict[key] = value
-        except KeyError as e:
-            logger.error(f"{e}")
+        self._resultList._setValue(key, self._rowIdx, value)
 
     def items(self):
         # to mimic a dictionary
-        return self._rDict.items()
+        return self.asDict().items()
 
     def keys(self):
         # to mimic a dictionary
-        return self._rDict.keys()
+        return self._resultList.keys()
 
 
 def test():
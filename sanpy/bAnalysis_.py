@@ -3,12 +3,16 @@ import sys
 import math
 import time
 import datetime
+import functools
+import itertools
+import concurrent.futures
 import copy
 import json
+import threading
 from collections import OrderedDict
 import warnings  # to catch np.polyfit -->> RankWarning: Polyfit may be poorly conditioned
 
-from typing import Union, Dict, List, Tuple, Optional
+from typing import Union, Dict, List, Tuple, Optional, Callable
 
 # import h5py
 
@@ -23,9 +27,10 @@ import pyabf  # see: https://github.com/swharden/pyABF
 import sanpy
 import sanpy.bDetection
 import sanpy.user_analysis.baseUserAnalysis  # to stop circular imports
-import sanpy.h5Util
 import sanpy.fileloaders
 import sanpy.bAnalysisResults
+import sanpy.detectionUtils
+import sanpy.perfUtils
 import sanpy._util
 
 from sanpy.fileloaders import recordingModes
@@ -35,6 +40,23 @@ from sanpy.fileloaders import recordingModes
 from sanpy.sanpyLogger import get_logger
 logger = get_logger(__name__)
 
+_analysisGenerations = itertools.count()
+# see bAnalysis.analysisGeneration
+
+_detectResultAttributes = [
+    "_detectionDict",
+    "_isAnalyzed",
+    "dateAnalyzed",
+    "spikeDict",
+    "_spikeIndex",
+    "spikeClips",
+    "spikeClips_x",
+    "spikeClips_x2",
+    "_dfReportForScatter",
+    "dfError",
+]
+# set by spike detection, see bAnalysis.getSpikeDetectResults()
+
 class bAnalysis:
     """
     The bAnalysis class represents a whole-cell recording and provides functions for analysis.
@@ -69,6 +91,7 @@ class bAnalysis:
         fileLoaderDict: dict = None,
         stimulusFileFolder: str = None,
         verbose: bool = False,
+        lazy: bool = False,
     ):
         """
         Args:
@@ -80,6 +103,8 @@ class bAnalysis:
                 Do this if running in a script.
                 If running an SanPy app, we pass the dict
             stimulusFileFolder:
+            lazy: If true, file loaders that support it (abf) load each sweep on demand
+                from a memory map of the file rather than loading all sweeps.
         """
 
         """
@@ -115,17 +140,27 @@ class bAnalysis:
         )
         # class to store all analysis results
 
+        self._spikeIndex: dict = None
+        # map (sweep, epoch) to np.ndarray of spike index, see _getSpikeIndex()
+
         # self._spikesPerSweep : int = None
 
         self.spikeClips = []  # created in self.spikeDetect()
         self.spikeClips_x = []  #
         self.spikeClips_x2 = []  #
+        self._spikeClipsIdx = []  # index of the spike of each clip, see _makeSpikeClips()
 
         self.dfError = None  # dataframe with a list of detection errors
         self._dfReportForScatter = None  # dataframe to be used by scatterplotwidget
 
         self._detectionDirty = False
 
+        self._analysisGeneration = next(_analysisGenerations)
+        # changes every time analysis changes, see analysisGeneration
+
+        self._perfTimer = sanpy.perfUtils.perfTimer()
+        # seconds in each stage of load, detection and save, see perfReport
+
         # will be overwritten by existing uuid in self._loadFromDf()
         self.uuid = sanpy._util.getNewUuid()
 
@@ -146,7 +181,7 @@ class bAnalysis:
             if fileLoaderDict is None:
                 fileLoaderDict = (
                     sanpy.fileloaders.getFileLoaders()
-                )  # EXPENSIVE, to do, pass in from app
+                )  # cached after the first call
             # print('2 fileLoaderDict:', fileLoaderDict)
 
             # print('1 fileLoaderDict:')
@@ -159,7 +194,9 @@ class bAnalysis:
                 if verbose:
                     logger.info(f"Loading file with extension: {_ext}")
                 constructorObject = fileLoaderDict[_ext]["constructor"]
-                self._fileLoader = constructorObject(filepath)
+                loadStartTime = time.perf_counter()
+                self._fileLoader = constructorObject(filepath, lazy=lazy)
+                self._perfTimer.record("load", time.perf_counter() - loadStartTime)
                 # may 2, 2023
                 if self._fileLoader._loadError:
                     logger.error(f'load error in file loader for ext: "{_ext}"')
@@ -206,7 +243,8 @@ class bAnalysis:
 
         # get default derivative
         if loadData and not self.loadError:
-            self._rebuildFiltered()
+            with sanpy.perfUtils.timing(self._perfTimer):
+                self._rebuildFiltered()
 
         self._detectionDirty = False
 
@@ -249,6 +287,22 @@ class bAnalysis:
         return self._dfReportForScatter
         # return self.spikeDict.asDataFrame()
 
+    @property
+    def perfReport(self) -> dict:
+        """Get seconds in each stage of the last load, detection and save.
+
+        Keys are stage (span) names like 'load', 'filter', 'threshold', 'halfWidth' and 'save',
+        values are dict with keys (seconds, count). Stages that did not run are not included.
+        See sanpy.perfUtils.
+        """
+        return self._perfTimer.asDict()
+
+    def getPerfReport(self, asDataFrame: bool = False) -> Union[dict, pd.DataFrame]:
+        """Get perfReport, optionally as a DataFrame with columns (span, seconds, count)."""
+        if asDataFrame:
+            return self._perfTimer.asDataFrame()
+        return self.perfReport
+
     def getDetectionDict(self, asCopy: bool = False):
         """Get the detection dictionary that was used for detect()."""
         if asCopy:
@@ -281,6 +335,8 @@ class bAnalysis:
             logger.info(f"NOT SAVING, is not dirty {self}")
             return False
 
+        saveStartTime = time.perf_counter()
+
         # always save as csv
         self.saveAnalysis_tocsv()
 
@@ -307,18 +363,20 @@ class bAnalysis:
         with pd.HDFStore(hdfPath) as hdfStore:
             if self._detectionDict is not None:
                 key = uuid + "/" + "detectionDict"
-                dfDetection.to_hdf(hdfStore, key)  # default mode='a'
+                hdfStore.put(key, dfDetection)
 
             # always save meta data
             key = uuid + "/" + "metaDataDict"
-            dfMetaData.to_hdf(hdfStore, key)  # default mode='a'
+            hdfStore.put(key, dfMetaData)
             
             # logger.warning('=== saving dfMetaData')
             # print(dfMetaData)
 
             if len(self.spikeDict) > 0:
                 key = uuid + "/" + "analysisList"
-                dfAnalysis.to_hdf(hdfStore, key)
+                hdfStore.put(key, dfAnalysis)
+
+        self._perfTimer.record("save", time.perf_counter() - saveStartTime)
 
         # we saved, detection is not dirty
         self._detectionDirty = False
@@ -450,10 +508,8 @@ class bAnalysis:
 
             # convert to a list of dict
             if loadedAnalysis:
-                analysisList = dfAnalysis.to_dict(
-                    "records", into=OrderedDict
-                )  # list of dict
-                self.spikeDict.setFromListDict(analysisList)
+                self.spikeDict.setFromDataFrame(dfAnalysis)
+                self._spikeIndex = None
                 # pprint(analysisList[0])
 
                 # recreate spike analysis dataframe
@@ -466,6 +522,8 @@ class bAnalysis:
                 # dec 2022
                 self._isAnalyzed = True
 
+                self._analysisGeneration = next(_analysisGenerations)
+
             # logger.info(
             #     f"    loaded {len(detectionDict.keys())} detection keys and {len(self.spikeDict)} spikes"
             # )
@@ -476,6 +534,41 @@ class bAnalysis:
     def detectionDirty(self):
         return self._detectionDirty
 
+    @property
+    def analysisGeneration(self) -> int:
+        """Get a number that changes every time the analysis or metadata changes.
+
+        Unique across all bAnalysis, used to cache results derived from the analysis.
+        See analysisDir.pool_build().
+        """
+        return self._analysisGeneration
+
+    @property
+    def memoryBytes(self) -> int:
+        """Get bytes of the recording and spike clips held in memory.
+
+        See analysisDir.prefetch().
+        """
+        memoryBytes = 0
+        if self.fileLoader is not None:
+            memoryBytes += self.fileLoader.memoryBytes
+        if isinstance(self.spikeClips, np.ndarray):
+            memoryBytes += self.spikeClips.nbytes
+        return memoryBytes
+
+    def close(self):
+        """Close files held open by the file loader, see fileLoader_base.close().
+
+        Called when the analysis is unloaded, e.g. analysisDir.unloadRow().
+        """
+        if self.fileLoader is not None:
+            self.fileLoader.close()
+
+    def _setDetectionDirty(self):
+        """Analysis or metadata changed and needs to be saved."""
+        self._detectionDirty = True
+        self._analysisGeneration = next(_analysisGenerations)
+
     @property
     def numSpikes(self):
         """Get the total number of detected spikes (all sweeps).
@@ -568,16 +661,13 @@ class bAnalysis:
         # logger.info(f'spikeList: {spikeList} stat:{stat}')
         
         retList = []
-        # count = 0
-        for idx, spike in enumerate(self.spikeDict):
-            # logger.info(f'  idx:{idx}')
-            if idx in spikeList:
-                try:
-                    val = spike[stat]
-                    retList.append(val)
-                    # count += 1
-                except KeyError as e:
-                    logger.error(e)
+        spikeIdx = [idx for idx in sorted(set(spikeList)) if 0 <= idx < self.numSpikes]
+        for idx in spikeIdx:
+            try:
+                val = self.spikeDict[idx][stat]
+                retList.append(val)
+            except KeyError as e:
+                logger.error(e)
         # logger.info(f'  retList: {retList}')
         return retList
 
@@ -614,7 +704,10 @@ class bAnalysis:
             self.spikeDict[spike]["modDate"] = modDate
             self.spikeDict[spike]["modTime"] = modTime
 
-        self._detectionDirty = True
+        # stat might be 'sweep' or 'epoch'
+        self._spikeIndex = None
+
+        self._setDetectionDirty()
 
         logger.info(f'set spikes {spikeList} stat "{stat}" to value "{value}"')
 
@@ -738,12 +831,6 @@ class bAnalysis:
             Returns a np.array is asArray is True
         """
 
-        def clean(val):
-            """Convert None to float('nan')"""
-            if val is None:
-                val = float("nan")
-            return val
-
         x = []  # None
         y = []  # None
         error = False
@@ -765,62 +852,98 @@ class bAnalysis:
             epochNumber = "All"
 
         if not error:
-            # original
-            # x = [clean(spike[statName1]) for spike in self.spikeDict]
-            
+            spikeIdx = self._getSpikeIndex(sweepNumber, epochNumber)
+
             if getFullList:
                 # April 15, 2023, trying to fix bug in scatter plugin when we are
                 # using sweep and epoch
-                # strategy is to return all spikes, just nan out the ones we 
+                # strategy is to return all spikes, just nan out the ones we
                 # are not interested in
-                x = []
-                for spike in self.spikeDict:
-                    _include = \
-                        (sweepNumber == "All" or spike["sweep"] == sweepNumber) \
-                            and (epochNumber == "All" or spike["epoch"] == epochNumber)
-                    if _include:
-                        x.append(clean(spike[statName1]))
-                    else:
-                        x.append(float("nan"))
-            
+                # copy, getValues() can return a view into spikeDict
+                x = self._cleanStat(self.spikeDict.getValues(statName1)).copy()
+                if len(spikeIdx) < len(x):
+                    if x.dtype.kind in "iub":
+                        x = x.astype(float)
+                    mask = np.ones(len(x), dtype=bool)
+                    mask[spikeIdx] = False
+                    x[mask] = float("nan")
             else:
                 # only current sweep and epoch
-                # (1) was this
-                # was causing errors with kym diam analysis
-                x = [
-                    clean(spike[statName1])
-                    for spike in self.spikeDict
-                    if (sweepNumber == "All" or spike["sweep"] == sweepNumber)
-                    and (epochNumber == "All" or spike["epoch"] == epochNumber)
-                ]
-                # for _idx, spike in enumerate(self.spikeDict):
-                #     if (sweepNumber == "All" or spike["sweep"] == sweepNumber) and (epochNumber == "All" or spike["epoch"] == epochNumber):
-                #         try:
-                #             val = spike[statName1]
-                #         except (KeyError) as e:
-                #             logger.error(f'did not find key "{statName1}" at spike {_idx}')
-                #         clean(val)
+                x = self._cleanStat(self.spikeDict.getValues(statName1, spikeIdx))
 
             if statName2 is not None:
-                # original
-                # y = [clean(spike[statName2]) for spike in self.spikeDict]
-                # only current spweek
-                y = [
-                    clean(spike[statName2])
-                    for spike in self.spikeDict
-                    if sweepNumber == "All" or spike["sweep"] == sweepNumber
-                ]
+                # only current sweep
+                spikeIdx2 = self._getSpikeIndex(sweepNumber, "All")
+                y = self._cleanStat(self.spikeDict.getValues(statName2, spikeIdx2))
+
+            if not asArray:
+                x = x.tolist()
+                if statName2 is not None:
+                    y = y.tolist()
 
         if asArray:
-            x = np.array(x)
+            x = np.asarray(x)
             if statName2 is not None:
-                y = np.array(y)
+                y = np.asarray(y)
 
         if statName2 is not None:
             return x, y
         else:
             return x
 
+    def _getSpikeIndex(self, sweepNumber="All", epochNumber="All") -> np.ndarray:
+        """Get the (sorted) index of spikes in one sweep and epoch.
+
+        The index is built once per detection (see _buildSpikeIndex)
+        and is cleared when spikes change in setSpikeStat().
+
+        Parameters
+        ----------
+        sweepNumber : int or 'All'
+        epochNumber : int or 'All'
+        """
+        if self._spikeIndex is None:
+            self._spikeIndex = self._buildSpikeIndex()
+        try:
+            return self._spikeIndex[(sweepNumber, epochNumber)]
+        except KeyError:
+            # no spikes in sweep/epoch
+            return np.zeros(0, dtype=np.int64)
+
+    def _buildSpikeIndex(self) -> dict:
+        """Map (sweep, epoch) to np.ndarray of spike index, 'All' matches any."""
+
+        def _group(values, spikeIdx):
+            # stable sort keeps spike order within each group
+            order = np.argsort(values[spikeIdx], kind="stable")
+            sortedValues = values[spikeIdx][order]
+            groupValues, groupStart = np.unique(sortedValues, return_index=True)
+            groups = np.split(spikeIdx[order], groupStart[1:])
+            return dict(zip(groupValues.tolist(), groups))
+
+        spikeIdx = np.arange(len(self.spikeDict))
+        theRet = {("All", "All"): spikeIdx}
+        if len(spikeIdx) == 0:
+            return theRet
+
+        sweeps = self.spikeDict.getValues("sweep")
+        epochs = self.spikeDict.getValues("epoch")
+
+        for epoch, epochIdx in _group(epochs, spikeIdx).items():
+            theRet[("All", epoch)] = epochIdx
+        for sweep, sweepIdx in _group(sweeps, spikeIdx).items():
+            theRet[(sweep, "All")] = sweepIdx
+            for epoch, epochIdx in _group(epochs, sweepIdx).items():
+                theRet[(sweep, epoch)] = epochIdx
+        return theRet
+
+    def _cleanStat(self, values: np.ndarray) -> np.ndarray:
+        """Convert None to float('nan')"""
+        if values.dtype == object:
+            values = values.copy()
+            values[np.equal(values, None)] = float("nan")
+        return values
+
     def getSpikeTimes(self, sweepNumber=None, epochNumber='All'):
         """Get spike times (points) for current sweep"""
         # theRet = [spike['thresholdPnt'] for spike in self.spikeDict if spike['sweep']==self.currentSweep]
@@ -850,7 +973,7 @@ class bAnalysis:
         return self.spikeDict[spikeNumber]
 
     def _rebuildFiltered(self):
-        if self.fileLoader.sweepX is None:
+        if self.fileLoader._sweepY is None:
             # no data
             logger.warning("not getting derivative ... sweepX was none?")
             return
@@ -910,130 +1033,31 @@ class bAnalysis:
         Backup spike time using deminishing SD and diff b/w vm at pnt[i]-pnt[i-1]
         Used when detecting with just mV threshold (not dv/dt)
 
+        See sanpy.detectionUtils.backupSpikeVm()
+
         Args:
             spikeTimes (list of float):
             medianFilter (int): bin width
         """
-        # realSpikeTimePnts = [np.nan] * self.numSpikes
-        realSpikeTimePnts = [np.nan] * len(spikeTimes)
-
-        medianFilter = 5
-        sweepY = self.fileLoader.sweepY
-        if medianFilter > 0:
-            myVm = scipy.signal.medfilt(sweepY, medianFilter)
-        else:
-            myVm = sweepY
-
-        #
-        # TODO: this is going to fail if spike is at start/stop of recorrding
-        #
-
-        maxNumPntsToBackup = 20  # todo: add _ms
-        bin_ms = 1
-        bin_pnts = round(bin_ms * self.fileLoader.dataPointsPerMs)
-        half_bin_pnts = math.floor(bin_pnts / 2)
-        for idx, spikeTimePnts in enumerate(spikeTimes):
-            foundRealThresh = False
-            thisMean = None
-            thisSD = None
-            backupNumPnts = 0
-            atBinPnt = spikeTimePnts
-            while not foundRealThresh:
-                thisWin = myVm[atBinPnt - half_bin_pnts : atBinPnt + half_bin_pnts]
-                if thisMean is None:
-                    thisMean = np.mean(thisWin)
-                    thisSD = np.std(thisWin)
-
-                nextStart = atBinPnt - 1 - bin_pnts - half_bin_pnts
-                nextStop = atBinPnt - 1 - bin_pnts + half_bin_pnts
-                nextWin = myVm[nextStart:nextStop]
-                nextMean = np.mean(nextWin)
-                nextSD = np.std(nextWin)
-
-                meanDiff = thisMean - nextMean
-                # logic
-                sdMult = 0.7  # 2
-                if (meanDiff < nextSD * sdMult) or (
-                    backupNumPnts == maxNumPntsToBackup
-                ):
-                    # second clause will force us to terminate (this recording has a very slow rise time)
-                    # bingo!
-                    foundRealThresh = True
-                    # not this xxx but the previous
-                    moveForwardPnts = 4
-                    backupNumPnts = backupNumPnts - 1  # the prev is thresh
-                    if backupNumPnts < moveForwardPnts:
-                        logger.warning(
-                            f"spike {idx} backupNumPnts:{backupNumPnts} < moveForwardPnts:{moveForwardPnts}"
-                        )
-                        # print('  -->> not adjusting spike time')
-                        realBackupPnts = backupNumPnts - 0
-                        realPnt = spikeTimePnts - (realBackupPnts * bin_pnts)
-
-                    else:
-                        realBackupPnts = backupNumPnts - moveForwardPnts
-                        realPnt = spikeTimePnts - (realBackupPnts * bin_pnts)
-                    #
-                    realSpikeTimePnts[idx] = realPnt
-
-                # increment
-                thisMean = nextMean
-                thisSD = nextSD
-
-                atBinPnt -= bin_pnts
-                backupNumPnts += 1
-                """
-                if backupNumPnts>maxNumPntsToBackup:
-                    print(f'  WARNING: _backupSpikeVm() exiting spike {idx} ... reached maxNumPntsToBackup:{maxNumPntsToBackup}')
-                    print('  -->> not adjusting spike time')
-                    foundRealThresh = True # set this so we exit the loop
-                    realSpikeTimePnts[idx] = spikeTimePnts
-                """
-
-        #
-        return realSpikeTimePnts
+        return sanpy.detectionUtils.backupSpikeVm(
+            self.fileLoader.sweepY, spikeTimes, self.fileLoader.dataPointsPerMs
+        )
 
     def _throwOutRefractory(self, spikeTimes0, goodSpikeErrors, refractory_ms=20):
         """
         spikeTimes0: spike times to consider
         goodSpikeErrors: list of errors per spike, can be None
         refractory_ms:
-        """
-        before = len(spikeTimes0)
-
-        # if there are doubles, throw-out the second one
-        # refractory_ms = 20 #10 # remove spike [i] if it occurs within refractory_ms of spike [i-1]
-        lastGood = 0  # first spike [0] will always be good, there is no spike [i-1]
-        for i in range(len(spikeTimes0)):
-            if i == 0:
-                # first spike is always good
-                continue
-            dPoints = spikeTimes0[i] - spikeTimes0[lastGood]
-            if dPoints < self.fileLoader.dataPointsPerMs * refractory_ms:
-                # remove spike time [i]
-                spikeTimes0[i] = 0
-            else:
-                # spike time [i] was good
-                lastGood = i
-        # regenerate spikeTimes0 by throwing out any spike time that does not pass 'if spikeTime'
-        # spikeTimes[i] that were set to 0 above (they were too close to the previous spike)
-        # will not pass 'if spikeTime', as 'if 0' evaluates to False
-        if goodSpikeErrors is not None:
-            goodSpikeErrors = [
-                goodSpikeErrors[idx]
-                for idx, spikeTime in enumerate(spikeTimes0)
-                if spikeTime
-            ]
-        spikeTimes0 = [spikeTime for spikeTime in spikeTimes0 if spikeTime]
-
-        # TODO: put back in and log if detection ['verbose']
-        after = len(spikeTimes0)
-        if self._detectionDict["verbose"]:
-            logger.info(
-                f"From {before} to {after} spikes with refractory_ms:{refractory_ms}"
-            )
 
-        return spikeTimes0, goodSpikeErrors
+        See sanpy.detectionUtils.throwOutRefractory()
+        """
+        return sanpy.detectionUtils.throwOutRefractory(
+            spikeTimes0,
+            goodSpikeErrors,
+            refractory_ms,
+            self.fileLoader.dataPointsPerMs,
+            verbose=self._detectionDict["verbose"],
+        )
 
     def _getHalfWidth(
         self,
@@ -1178,281 +1202,178 @@ class bAnalysis:
         Can't use self.getSpikeStat() because it is not created yet.
             We are in the middle of analysis
         """
-        sec = self.fileLoader.pnt2Sec_(pnt)  # pnt / self.dataPointsPerMs / 1000
-        sec = round(sec, 4)
-
-        # print(f'  spikeNumber: {spikeNumber} {type(spikeNumber)}')
-        # print('    sweep:', self.getSpikeStat([spikeNumber], 'sweep'))
-
-        eDict = {
-            "Spike": spikeNumber,
-            "Seconds": sec,
-            "Sweep": '',  # self.getSpikeStat([spikeNumber], 'sweep')[0],
-            "Epoch": '',  # self.getSpikeStat([spikeNumber], 'epoch')[0],
-            "Type": _type,
-            "Details": detailStr,
-        }
-        return eDict
+        return sanpy.detectionUtils.getSpikeErrorDict(
+            spikeNumber, pnt, _type, detailStr, self.fileLoader.dataPointsPerMs
+        )
 
     def _spikeDetect_dvdt(self, dDict: dict, sweepNumber: int, verbose: bool = False):
         """
         Search for threshold crossings (dvdtThreshold) in first derivative (dV/dt) of membrane potential (Vm)
-        append each threshold crossing (e.g. a spike) in self.spikeTimes list
-
-        Returns:
-            self.spikeTimes (pnts): the time before each threshold crossing when dv/dt crosses 15% of its max
-            self.filteredVm:
-            self.filtereddVdt:
-        """
+        in the current sweep.
 
-        #
-        # analyze full recording
-        filteredDeriv = self.fileLoader.filteredDeriv
-        Is = np.where(filteredDeriv > dDict["dvdtThreshold"])[0]
-        Is = np.concatenate(([0], Is))
-        Ds = Is[:-1] - Is[1:] + 1
-        spikeTimes0 = Is[np.where(Ds)[0] + 1]
+        See sanpy.detectionUtils.spikeDetect_dvdt()
 
-        #
-        # reduce spike times based on start/stop
-        # logger.error('THIS IS a BUg if start sec is none then set to 0 !!!')
-        # THIS IS ABUG ... FIX
-        if dDict["startSeconds"] is not None and dDict["stopSeconds"] is not None:
-            startPnt = self.fileLoader.dataPointsPerMs * (
-                dDict["startSeconds"] * 1000
-            )  # seconds to pnt
-            stopPnt = self.fileLoader.dataPointsPerMs * (
-                dDict["stopSeconds"] * 1000
-            )  # seconds to pnt
-            tmpSpikeTimes = [
-                spikeTime
-                for spikeTime in spikeTimes0
-                if (spikeTime >= startPnt and spikeTime <= stopPnt)
-            ]
-            spikeTimes0 = tmpSpikeTimes
-
-        #
-        # throw out all spikes that are below a threshold Vm (usually below -20 mV)
-        peakWindow_pnts = self.fileLoader.ms2Pnt_(dDict["peakWindow_ms"])
-        # peakWindow_pnts = self.dataPointsPerMs * dDict['peakWindow_ms']
-        # peakWindow_pnts = round(peakWindow_pnts)
-        goodSpikeTimes = []
-        sweepY = self.fileLoader.sweepY
-        for spikeTime in spikeTimes0:
-            # wu-lab-stanford data
-            try:
-                peakVal = np.max(sweepY[spikeTime : spikeTime + peakWindow_pnts])
-                if peakVal > dDict["mvThreshold"]:
-                    goodSpikeTimes.append(spikeTime)
-            except (ValueError) as e:
-                logger.error(e)
-                logger.error(f'   spikeTime:{spikeTime} peakWindow_pnts:{peakWindow_pnts}')
-                logger.error(f'   _dataPointsPerMs: {self.fileLoader._dataPointsPerMs}')
-        spikeTimes0 = goodSpikeTimes
+        Returns:
+            spikeTimes (pnts): the time before each threshold crossing when dv/dt crosses 15% of its max
+            spikeErrorList:
+        """
+        return sanpy.detectionUtils.spikeDetect_dvdt(
+            self.fileLoader.sweepY,
+            self.fileLoader.filteredDeriv,
+            dDict,
+            self.fileLoader.dataPointsPerMs,
+        )
 
-        #
-        # throw out spike that are not upward deflections of Vm
-        """
-        prePntUp = 7 # pnts
-        goodSpikeTimes = []
-        for spikeTime in spikeTimes0:
-            preAvg = np.average(self.abf.sweepY[spikeTime-prePntUp:spikeTime-1])
-            postAvg = np.average(self.abf.sweepY[spikeTime+1:spikeTime+prePntUp])
-            #print(preAvg, postAvg)
-            if preAvg < postAvg:
-                goodSpikeTimes.append(spikeTime)
-        spikeTimes0 = goodSpikeTimes
+    def _spikeDetect_vm(self, dDict: dict, sweepNumber: int, verbose: bool = False):
         """
+        spike detect using Vm threshold and NOT dvdt in the current sweep.
 
-        #
-        # if there are doubles, throw-out the second one
-        spikeTimeErrors = None
-        spikeTimes0, ignoreSpikeErrors = self._throwOutRefractory(
-            spikeTimes0, spikeTimeErrors, refractory_ms=dDict["refractory_ms"]
-        )
+        See sanpy.detectionUtils.spikeDetect_vm()
 
-        # logger.warning('REMOVED SPIKE TOP AS % OF DVDT')
-        # return spikeTimes0, [None] * len(spikeTimes0)
+        Returns:
+            spikeTimes (pnts): threshold crossing of each spike
+            spikeErrorList:
+        """
+        return sanpy.detectionUtils.spikeDetect_vm(
+            self.fileLoader.sweepY,
+            self.fileLoader.sweepY_filtered,
+            dDict,
+            self.fileLoader.dataPointsPerMs,
+        )
 
-        #
-        # for each threshold crossing, search backwards in dV/dt for a % of maximum (about 10 ms)
-        # dvdt_percentOfMax = 0.1
-        # window_ms = 2
-        window_pnts = dDict["dvdtPreWindow_ms"] * self.fileLoader.dataPointsPerMs
-        # abb 20210130 lcr analysis
-        window_pnts = round(window_pnts)
-        spikeTimes1 = []
-        spikeErrorList1 = []
-        filteredDeriv = self.fileLoader.filteredDeriv
-        for i, spikeTime in enumerate(spikeTimes0):
-            # get max in derivative
-
-            preDerivClip = filteredDeriv[
-                spikeTime - window_pnts : spikeTime
-            ]  # backwards
-            postDerivClip = filteredDeriv[
-                spikeTime : spikeTime + window_pnts
-            ]  # forwards
-
-            if len(preDerivClip) == 0:
-                print(
-                    "FIX ERROR: spikeDetect_dvdt()",
-                    "spike",
-                    i,
-                    "at pnt",
-                    spikeTime,
-                    "window_pnts:",
-                    window_pnts,
-                    "dvdtPreWindow_ms:",
-                    dDict["dvdtPreWindow_ms"],
-                    "len(preDerivClip)",
-                    len(preDerivClip),
-                )  # preDerivClip = np.flip(preDerivClip)
-
-            # look for % of max in dvdt
-            try:
-                # peakPnt = np.argmax(preDerivClip)
-                peakPnt = np.argmax(postDerivClip)
-                # peakPnt += spikeTime-window_pnts
-                peakPnt += spikeTime
-                peakVal = filteredDeriv[peakPnt]
-
-                percentMaxVal = (
-                    peakVal * dDict["dvdt_percentOfMax"]
-                )  # value we are looking for in dv/dt
-                preDerivClip = np.flip(preDerivClip)  # backwards
-                tmpWhere = np.where(preDerivClip < percentMaxVal)
-                # print('tmpWhere:', type(tmpWhere), tmpWhere)
-                tmpWhere = tmpWhere[0]
-                if len(tmpWhere) > 0:
-                    threshPnt2 = np.where(preDerivClip < percentMaxVal)[0][0]
-                    threshPnt2 = (spikeTime) - threshPnt2
-                    # print('i:', i, 'spikeTime:', spikeTime, 'peakPnt:', peakPnt, 'threshPnt2:', threshPnt2)
-                    threshPnt2 -= 1  # backup by 1 pnt
-                    spikeTimes1.append(threshPnt2)
-                    spikeErrorList1.append(None)
+    def spikeDetect(
+        self,
+        detectionDict: dict,
+        workers: Optional[int] = None,
+        useProcesses: bool = False,
+        chunkSize: Optional[int] = None,
+        progressCallback: Optional[Callable[[int, int], None]] = None,
+        cancelEvent: Optional[threading.Event] = None,
+        legacy: bool = False,
+    ) -> bool:
+        """Run spike detection for all sweeps.
 
-                else:
-                    errorType = "dvdt Percent"
-                    errStr = f"Did not find dvdt_percentOfMax: {dDict['dvdt_percentOfMax']} peak dV/dt is {round(peakVal,2)}"
-                    eDict = self._getErrorDict(
-                        i, spikeTime, errorType, errStr
-                    )  # spikeTime is in pnts
-                    spikeErrorList1.append(eDict)
-                    # always append, do not REJECT spike if we can't find % in dv/dt
-                    spikeTimes1.append(spikeTime)
-            except (IndexError, ValueError) as e:
-                ##
-                print(
-                    "   FIX ERROR: bAnalysis.spikeDetect_dvdt() looking for dvdt_percentOfMax"
-                )
-                print("      ", "IndexError for spike", i, spikeTime)
-                print("      ", e)
-                # always append, do not REJECT spike if we can't find % in dv/dt
-                spikeTimes1.append(spikeTime)
+        Each spike is a row and has 'sweep'
 
-        return spikeTimes1, spikeErrorList1
+        Each sweep is detected independently (see _detectSweep) and
+        results are merged in sweep order.
 
-    def _spikeDetect_vm(self, dDict: dict, sweepNumber: int, verbose: bool = False):
-        """
-        spike detect using Vm threshold and NOT dvdt
-        append each threshold crossing (e.g. a spike) in self.spikeTimes list
+        Args:
+            detectionDict: From sanpy.bDetection
+            workers: If > 1, detect sweeps in parallel with a pool of this many workers.
+                Ignored when legacy is True.
+            useProcesses: If True use a process pool, otherwise a thread pool.
+                Detecting in chunks always uses a thread pool.
+            chunkSize: If not None, detect each sweep in blocks of this many points
+                so long recordings do not need to be in memory (see _detectSweepChunked).
+                Results are the same. If None, lazy file loaders use _defaultChunkSize.
+            progressCallback: Called with (numDetected, numSweeps) after each sweep is detected.
+            cancelEvent: If set (from another thread), detection stops before the next sweep.
+            legacy: If True, analyze spikes one at a time with the original (slow) loop,
+                see _spikeDetect2(). Results are the same.
 
         Returns:
-            self.spikeTimes (pnts): the time before each threshold crossing when dv/dt crosses 15% of its max
-            self.filteredVm:
-            self.filtereddVdt:
-        """
-
-        filteredVm = self.fileLoader.sweepY_filtered
-        Is = np.where(filteredVm > dDict["mvThreshold"])[0]  # returns boolean array
-        Is = np.concatenate(([0], Is))
-        Ds = Is[:-1] - Is[1:] + 1
-        spikeTimes0 = Is[np.where(Ds)[0] + 1]
-
-        #
-        # reduce spike times based on start/stop
-        if dDict["startSeconds"] is not None and dDict["stopSeconds"] is not None:
-            startPnt = self.fileLoader.dataPointsPerMs * (
-                dDict["startSeconds"] * 1000
-            )  # seconds to pnt
-            stopPnt = self.fileLoader.dataPointsPerMs * (
-                dDict["stopSeconds"] * 1000
-            )  # seconds to pnt
-            tmpSpikeTimes = [
-                spikeTime
-                for spikeTime in spikeTimes0
-                if (spikeTime >= startPnt and spikeTime <= stopPnt)
-            ]
-            spikeTimes0 = tmpSpikeTimes
+            False if detection was cancelled, the analysis is not changed.
+
+        The seconds in each stage are in perfReport and, if set with
+        sanpy.perfUtils.setPerfLogFile(), appended to a json lines file.
+        """
+        detectResults = self.getSpikeDetectResults(
+            detectionDict,
+            workers=workers,
+            useProcesses=useProcesses,
+            chunkSize=chunkSize,
+            progressCallback=progressCallback,
+            cancelEvent=cancelEvent,
+            legacy=legacy,
+        )
+        if detectResults is None:
+            return False
+        self.setSpikeDetectResults(detectResults)
+        return True
 
-        spikeErrorList = [None] * len(spikeTimes0)
+    def getSpikeDetectResults(
+        self,
+        detectionDict: dict,
+        workers: Optional[int] = None,
+        useProcesses: bool = False,
+        chunkSize: Optional[int] = None,
+        progressCallback: Optional[Callable[[int, int], None]] = None,
+        cancelEvent: Optional[threading.Event] = None,
+        legacy: bool = False,
+    ) -> Optional[dict]:
+        """Run spike detection without changing this analysis, see spikeDetect() for args.
+
+        Detection (and user analysis) runs on a shallow copy with its own shallow copy
+        of the file loader. Filtering and setSweep() in detection do not change the
+        file loader of this analysis, so this can run in a worker thread while the
+        analysis is plotted. Swap in the results and the filtered recording with
+        setSpikeDetectResults(), e.g. back in the GUI thread.
 
-        #
-        # throw out all spikes that are below a threshold Vm (usually below -20 mV)
-        # spikeTimes0 = [spikeTime for spikeTime in spikeTimes0 if self.abf.sweepY[spikeTime] > self.mvThreshold]
-        # 20190623 - already done in this vm threshold funtion
-        """
-        peakWindow_ms = 10
-        peakWindow_pnts = self.abf.dataPointsPerMs * peakWindow_ms
-        goodSpikeTimes = []
-        for spikeTime in spikeTimes0:
-            peakVal = np.max(self.abf.sweepY[spikeTime:spikeTime+peakWindow_pnts])
-            if peakVal > self.mvThreshold:
-                goodSpikeTimes.append(spikeTime)
-        spikeTimes0 = goodSpikeTimes
+        Returns:
+            Dict of analysis attributes, None if detection was cancelled.
         """
+        self._perfTimer.clear(keep=["load"])
 
-        #
-        # throw out spike that are NOT upward deflections of Vm
-        tmpLastGoodSpike_pnts = None
-        # minISI_pnts = 5000 # at 20 kHz this is 0.25 sec
-        minISI_ms = 75  # 250
-        minISI_pnts = self.fileLoader.ms2Pnt_(minISI_ms)
-
-        prePntUp = 10  # pnts
-        goodSpikeTimes = []
-        goodSpikeErrors = []
-        sweepY = self.fileLoader.sweepY
-        for tmpIdx, spikeTime in enumerate(spikeTimes0):
-            tmpFuckPreClip = sweepY[
-                spikeTime - prePntUp : spikeTime
-            ]  # not including the stop index
-            tmpFuckPostClip = sweepY[
-                spikeTime + 1 : spikeTime + prePntUp + 1
-            ]  # not including the stop index
-            preAvg = np.average(tmpFuckPreClip)
-            postAvg = np.average(tmpFuckPostClip)
-            if postAvg > preAvg:
-                # tmpSpikeTimeSec = self.fileLoader.pnt2Sec_(spikeTime)
-                if (
-                    tmpLastGoodSpike_pnts is not None
-                    and (spikeTime - tmpLastGoodSpike_pnts) < minISI_pnts
-                ):
-                    continue
-                goodSpikeTimes.append(spikeTime)
-                goodSpikeErrors.append(spikeErrorList[tmpIdx])
-                tmpLastGoodSpike_pnts = spikeTime
-            else:
-                tmpSpikeTimeSec = self.fileLoader.pnt2Sec_(spikeTime)
+        baDetect = copy.copy(self)
+        # recordings are shared, the filtered recording and current sweep are not
+        baDetect._fileLoader = copy.copy(self.fileLoader)
+        with sanpy.perfUtils.timing(self._perfTimer), sanpy.perfUtils.span("detect"):
+            isDetected = baDetect._spikeDetect(
+                detectionDict, workers, useProcesses, chunkSize, progressCallback, cancelEvent,
+                legacy=legacy,
+            )
+        # cancelled while detecting the last sweep or in user analysis
+        if cancelEvent is not None and cancelEvent.is_set():
+            isDetected = False
+        if not isDetected:
+            logger.info(f"Cancelled spike detection of {self.fileLoader.filename}")
+            return None
 
-        # todo: add this to spikeDetect_dvdt()
-        goodSpikeTimes, goodSpikeErrors = self._throwOutRefractory(
-            goodSpikeTimes, goodSpikeErrors, refractory_ms=dDict["refractory_ms"]
+        if sanpy.perfUtils.getPerfLogFile() is not None:
+            sanpy.perfUtils.writePerfLog({
+                "file": self.fileLoader.filepath,
+                "numSweeps": self.fileLoader.numSweeps,
+                "numPoints": len(self.fileLoader.sweepX),
+                "numSpikes": baDetect.numSpikes,
+                "detectionType": detectionDict["detectionType"],
+                "workers": workers,
+                "chunkSize": chunkSize,
+                "perfReport": self.perfReport,
+            })
+
+        detectResults = {name: getattr(baDetect, name) for name in _detectResultAttributes}
+        detectResults["filteredRecording"] = (
+            baDetect.fileLoader._filteredY,
+            baDetect.fileLoader._filteredDeriv,
         )
-        spikeTimes0 = goodSpikeTimes
-        spikeErrorList = goodSpikeErrors
+        return detectResults
 
-        #
-        return spikeTimes0, spikeErrorList
+    def setSpikeDetectResults(self, detectResults: dict):
+        """Swap in the results of getSpikeDetectResults(), the analysis needs to be saved.
 
-    def spikeDetect(self, detectionDict: dict):
-        """Run spike detection for all sweeps.
+        The file loader gets the recording filtered with the new detection parameters.
+        """
+        detectResults = dict(detectResults)
+        filteredY, filteredDeriv = detectResults.pop("filteredRecording")
+        self.fileLoader._setFilteredRecording(filteredY, filteredDeriv)
+        self.__dict__.update(detectResults)
+        self._setDetectionDirty()
 
-        Each spike is a row and has 'sweep'
+    def _spikeDetect(
+        self,
+        detectionDict: dict,
+        workers: Optional[int],
+        useProcesses: bool,
+        chunkSize: Optional[int],
+        progressCallback: Optional[Callable[[int, int], None]] = None,
+        cancelEvent: Optional[threading.Event] = None,
+        legacy: bool = False,
+    ) -> bool:
+        """Run spike detection for all sweeps, see spikeDetect().
 
-        Args:
-            detectionDict: From sanpy.bDetection
+        Returns:
+            False if cancelled with cancelEvent.
         """
 
         rememberSweep = (
@@ -1476,14 +1397,144 @@ class bAnalysis:
         self._isAnalyzed = True
 
         self.spikeDict = sanpy.bAnalysisResults.analysisResultList()
+        self._spikeIndex = None
         # we are filling this in, one dict for each spike
         # self.spikeDict = [] # we are filling this in, one dict for each spike
 
         # self._spikesPerSweep = [0] * self.fileLoader.numSweeps
 
-        for sweepNumber in self.fileLoader.sweepList:
-            # self.setSweep(sweep)
-            self._spikeDetect2(sweepNumber)
+        # filter all sweeps once, in case dDict has new filter values
+        self._getFilteredRecording()
+
+        now = datetime.datetime.now()
+        dateStr = now.strftime("%Y%m%d")
+        timeStr = now.strftime("%H:%M:%S")
+        self.dateAnalyzed = dateStr
+
+        numSweeps = self.fileLoader.numSweeps
+
+        def _isCancelled():
+            return cancelEvent is not None and cancelEvent.is_set()
+
+        def _sweepDetected(numDetected):
+            if progressCallback is not None:
+                progressCallback(numDetected, numSweeps)
+
+        if legacy:
+            for numDetected, sweepNumber in enumerate(self.fileLoader.sweepList, start=1):
+                if _isCancelled():
+                    self.fileLoader.setSweep(rememberSweep)
+                    return False
+                self._spikeDetect2(sweepNumber, dateStr, timeStr)
+                _sweepDetected(numDetected)
+        else:
+            fileLoader = self.fileLoader
+            filteredY = fileLoader._filteredY
+            filteredDeriv = fileLoader._filteredDeriv
+            if chunkSize is None and fileLoader.isLazy:
+                chunkSize = _defaultChunkSize
+            if chunkSize is not None and not self._canDetectInChunks(detectionDict):
+                chunkSize = None
+
+            if chunkSize is not None:
+                detectFunction = _detectSweepChunked
+                sweepArgs = [
+                    (
+                        sweepNumber,
+                        functools.partial(
+                            fileLoader.getDetectionBlock,
+                            sweepNumber,
+                            medianFilter=detectionDict["medianFilter"],
+                            SavitzkyGolay_pnts=detectionDict["SavitzkyGolay_pnts"],
+                            SavitzkyGolay_poly=detectionDict["SavitzkyGolay_poly"],
+                        ),
+                        len(fileLoader._sweepY),
+                        chunkSize,
+                        detectionDict,
+                        fileLoader.dataPointsPerMs,
+                        fileLoader.getEpochTable(sweepNumber),
+                        fileLoader.filename,
+                        dateStr,
+                        timeStr,
+                    )
+                    for sweepNumber in fileLoader.sweepList
+                ]
+                # blocks are read from the file loader, it can not go to another process
+                useProcesses = False
+            else:
+                detectFunction = _detectSweep
+                sweepArgs = [
+                    (
+                        sweepNumber,
+                        fileLoader.sweepX,
+                        fileLoader._sweepY[:, sweepNumber],
+                        filteredY[:, sweepNumber],
+                        filteredDeriv[:, sweepNumber],
+                        detectionDict,
+                        fileLoader.dataPointsPerMs,
+                        fileLoader.getEpochTable(sweepNumber),
+                        fileLoader.filename,
+                        dateStr,
+                        timeStr,
+                    )
+                    for sweepNumber in fileLoader.sweepList
+                ]
+            if workers is not None and workers > 1 and len(sweepArgs) > 1:
+                if useProcesses:
+                    poolExecutor = concurrent.futures.ProcessPoolExecutor
+                else:
+                    poolExecutor = concurrent.futures.ThreadPoolExecutor
+                # not a with block, its exit would wait for running sweeps after a cancel
+                pool = poolExecutor(max_workers=workers)
+                cancelled = False
+                try:
+                    # results in sweep order, with the time in each stage
+                    futures = [
+                        pool.submit(sanpy.perfUtils.timedCall, detectFunction, *oneSweepArgs)
+                        for oneSweepArgs in sweepArgs
+                    ]
+                    sweepResults = []
+                    for future in futures:
+                        if _isCancelled():
+                            cancelled = True
+                            return False
+                        spikeDict, spans = future.result()
+                        self._perfTimer.merge(spans)
+                        sweepResults.append(spikeDict)
+                        _sweepDetected(len(sweepResults))
+                finally:
+                    # after a cancel, queued sweeps are dropped and running sweeps are not waited for
+                    pool.shutdown(wait=not cancelled, cancel_futures=True)
+            else:
+                sweepResults = []
+                for oneSweepArgs in sweepArgs:
+                    if _isCancelled():
+                        return False
+                    sweepResults.append(detectFunction(*oneSweepArgs))
+                    _sweepDetected(len(sweepResults))
+
+            for spikeDict in sweepResults:
+                # spike number is across all sweeps
+                spikeDict.setColumn(
+                    "spikeNumber", self.numSpikes + np.arange(len(spikeDict))
+                )
+                self.spikeDict.appendAnalysis(spikeDict)
+
+        self._spikeIndex = None
+
+        # spike clips
+        self.spikeClips = None
+        self.spikeClips_x = None
+        self.spikeClips_x2 = None
+
+        # run all user analysis ... what if this fails ???
+        sanpy.user_analysis.baseUserAnalysis.runAllUserAnalysis(self)
+
+        # generate a df holding stats (used by scatterplotwidget)
+        self.regenerateAnalysisDataFrame()
+
+        # generate error report
+        self.dfError = self.getErrorReport()
 
         #
         self.fileLoader.setSweep(rememberSweep)
@@ -1495,11 +1546,58 @@ class bAnalysis:
                 f"Detected {len(self.spikeDict)} spikes in {round(stopTime-startTime,3)} seconds"
             )
 
-    def _spikeDetect2(self, sweepNumber: int):
-        """Detect all spikes in one sweep.
+        return True
+
+    def _canDetectInChunks(self, detectionDict: dict) -> bool:
+        """True if detecting in chunks gives the same results as detecting whole sweeps.
+
+        With mdp_ms or avgWindow_ms under 2 points, spike analysis mixes sweep and window points.
+        """
+        dataPointsPerMs = self.fileLoader.dataPointsPerMs
+        for key in ["mdp_ms", "avgWindow_ms"]:
+            if round(detectionDict[key] * dataPointsPerMs) < 2:
+                logger.warning(f"Not detecting in chunks, {key} is less than 2 points")
+                return False
+        return True
+
+    def _setDetectionResults(self, detectionDict: dict, dfAnalysis: pd.DataFrame):
+        """Set spike detection results that were computed elsewhere.
+
+        Used by analysisDir.detectAll() where detection runs in a worker process
+        and only the analysis results (one row per spike) come back.
+
+        Args:
+            detectionDict: The detection parameters used in the worker.
+            dfAnalysis: Result of spikeDict.asDataFrame() in the worker.
+        """
+        self._detectionDict = detectionDict
+
+        self.spikeDict = sanpy.bAnalysisResults.analysisResultList()
+        if dfAnalysis is not None and len(dfAnalysis) > 0:
+            self.spikeDict.setFromDataFrame(dfAnalysis)
+        self._spikeIndex = None
+
+        self.spikeClips = None
+        self.spikeClips_x = None
+        self.spikeClips_x2 = None
+
+        self.regenerateAnalysisDataFrame()
+        self.dfError = self.getErrorReport()
+
+        self.dateAnalyzed = datetime.datetime.now().strftime("%Y%m%d")
+        self._isAnalyzed = True
+
+        # bAnalysis needs to be saved
+        self._setDetectionDirty()
+
+    def _spikeDetect2(self, sweepNumber: int, dateStr: str, timeStr: str):
+        """Detect all spikes in one sweep with the original per-spike loop.
 
          Populate bAnalysisResult.py.
 
+        Only used when spikeDetect() is called with legacy=True,
+        otherwise see _detectSweep().
+
         Notes
         -----
         First spike in a sweep cannot have interval statistics like freq or isi
@@ -1513,83 +1611,64 @@ class bAnalysis:
         # a list of dict of sanpy.bAnalysisResults.analysisResult (one dict per spike)
         spikeDict = sanpy.bAnalysisResults.analysisResultList()
 
-        verbose = dDict["verbose"]
-
         #
         self.fileLoader.setSweep(sweepNumber)
         #
 
-        # in case dDict has new filter values
-        self._getFilteredRecording()
+        results = sanpy.detectionUtils.detectSpikeTimes(
+            self.fileLoader.sweepY,
+            self.fileLoader.sweepY_filtered,
+            self.fileLoader.filteredDeriv,
+            dDict,
+            self.fileLoader.dataPointsPerMs,
+        )
+        if results is None:
+            return
+        spikeTimes, spikeErrorList, newSpikePeakPnt, newSpikePeakVal = results
 
-        #
-        # spike detect
-        detectionType = dDict["detectionType"]
+        self._spikeFeatures_legacy(
+            spikeDict,
+            sweepNumber,
+            spikeTimes,
+            spikeErrorList,
+            newSpikePeakPnt,
+            newSpikePeakVal,
+            dateStr,
+            timeStr,
+        )
 
-        # detect all spikes either with dvdt or mv
-        if detectionType == sanpy.bDetection.detectionTypes["mv"].value:
-            # detect using mV threshold
-            spikeTimes, spikeErrorList = self._spikeDetect_vm(dDict, sweepNumber)
+        # SUPER important, previously our self.spikeDict was simple list of dict
+        # now it is a list of class xxx
+        self.spikeDict.appendAnalysis(spikeDict)
 
-            # TODO: get rid of this and replace with foot
-            # backup childish vm threshold
-            if dDict["doBackupSpikeVm"]:
-                spikeTimes = self._backupSpikeVm(
-                    spikeTimes, sweepNumber, dDict["medianFilter"]
-                )
-        elif detectionType == sanpy.bDetection.detectionTypes["dvdt"].value:
-            # detect using dv/dt threshold AND min mV
-            spikeTimes, spikeErrorList = self._spikeDetect_dvdt(dDict, sweepNumber)
-        else:
-            logger.error(f'Unknown detection type "{detectionType}"')
-            return
+    @sanpy.perfUtils.timed("features")
+    def _spikeFeatures_legacy(
+        self,
+        spikeDict: "sanpy.bAnalysisResults.analysisResultList",
+        sweepNumber: int,
+        spikeTimes: List[int],
+        spikeErrorList: List[dict],
+        newSpikePeakPnt: List[int],
+        newSpikePeakVal: List[float],
+        dateStr: str,
+        timeStr: str,
+    ):
+        """Analyze each spike in one sweep, one spike at a time.
 
-        #
-        # backup thrshold to zero crossing in dvdt
-        if 0:
-            tmp_window_ms = dDict["dvdtPreWindow_ms"]
-            tmp_window_pnts = self.fileLoader.ms2Pnt_(tmp_window_ms)
-            spikeTimes = self._getFeet(spikeTimes, tmp_window_pnts)
+        This is the original (slow) per-spike loop, use it with
+        spikeDetect(..., legacy=True). See _spikeFeatures_vectorized().
+        """
+        dDict = self._detectionDict
+        verbose = dDict["verbose"]
+        detectionType = dDict["detectionType"]
 
-        #
-        # set up
         sweepX = self.fileLoader.sweepX  # sweepNumber is not optional
         filteredVm = self.fileLoader.sweepY_filtered  # sweepNumber is not optional
         filteredDeriv = self.fileLoader.filteredDeriv
-        # sweepC = self.fileLoader.sweepC
-
-        #
-        now = datetime.datetime.now()
-        dateStr = now.strftime("%Y%m%d")
-        timeStr = now.strftime("%H:%M:%S")
-        self.dateAnalyzed = dateStr
-
-        #
-        # look in a window after each threshold crossing to get AP peak
-        peakWindow_pnts = self.fileLoader.ms2Pnt_(dDict["peakWindow_ms"])
 
         #
         # look in a window after each peak to get 'fast ahp'
         fastAhpWindow_pnts = self.fileLoader.ms2Pnt_(dDict["fastAhpWindow_ms"])
-        
-        #
-        # throw out spikes that have peak BELOW onlyPeaksAbove_mV
-        # throw out spikes that have peak ABOVE onlyPeaksBelow_mV
-        onlyPeaksAbove_mV = dDict["onlyPeaksAbove_mV"]
-        onlyPeaksBelow_mV = dDict["onlyPeaksBelow_mV"]
-        (
-            spikeTimes,
-            spikeErrorList,
-            newSpikePeakPnt,
-            newSpikePeakVal,
-        ) = sanpy.analysisUtil.throwOutAboveBelow(
-            filteredVm,
-            spikeTimes,
-            spikeErrorList,
-            peakWindow_pnts,
-            onlyPeaksAbove_mV=onlyPeaksAbove_mV,
-            onlyPeaksBelow_mV=onlyPeaksBelow_mV,
-        )
 
         #
         # small window to average Vm to calculate MDP (itself in a window before spike)
@@ -1632,8 +1711,10 @@ class bAnalysis:
             epochLevel = float("nan")
             epochTable = self.fileLoader.getEpochTable(sweepNumber)
             if epochTable is not None:
-                epoch = epochTable.findEpoch(spikeTime)
-                epochLevel = epochTable.getLevel(epoch)
+                _epoch = epochTable.findEpoch(spikeTime)
+                if _epoch is not None:
+                    epoch = _epoch
+                    epochLevel = epochTable.getLevel(epoch)
             spikeDict[i]["epoch"] = epoch
             spikeDict[i]["epochLevel"] = epochLevel
 
@@ -2062,49 +2143,7 @@ class bAnalysis:
                 verbose=verbose,
             )
 
-        #
-        # look between threshold crossing to get minima
-        # we will ignore the first and last spike
-
-        #
-        # spike clips
-        self.spikeClips = None
-        self.spikeClips_x = None
-        self.spikeClips_x2 = None
-
-        # SUPER important, previously our self.spikeDict was simple list of dict
-        # now it is a list of class xxx
-        # print('=== addind', len(spikeDict))
-        self.spikeDict.appendAnalysis(spikeDict)
-        # print('   now have', len(self.spikeDict))
-        # print(self.spikeDict)
-
-        # keep track of spikes per sweep (expensive to calculate)
-        # self._spikesPerSweep[sweepNumber] = len(spikeDict)
-
-        # run all user analysis ... what if this fails ???
-        sanpy.user_analysis.baseUserAnalysis.runAllUserAnalysis(self)
-
-        #
-        # generate a df holding stats (used by scatterplotwidget)
-        # startSeconds = dDict['startSeconds']
-        # stopSeconds = dDict['stopSeconds']
-        # if self.numSpikes > 0:
-        #     # exportObject = sanpy.bExport(self)
-        #     # self.dfReportForScatter = exportObject.report(startSeconds, stopSeconds)
-        #     self._dfReportForScatter = self.spikeDict.asDataFrame()
-        # else:
-        #     self.dfReportForScatter = None
-        self.regenerateAnalysisDataFrame()
-
-        # generate error report
-        self.dfError = self.getErrorReport()
-
-        # bAnalysis needs to be saved
-        self._detectionDirty = True
-
-        ## done
-
+    @sanpy.perfUtils.timed("dataFrame")
     def regenerateAnalysisDataFrame(self):
         if self.numSpikes > 0:
             # exportObject = sanpy.bExport(self)
@@ -2285,8 +2324,8 @@ class bAnalysis:
             theseTime_sec (list of float): [NOT USED] List of seconds to make clips from.
 
         Returns:
-            spikeClips_x2: ms
-            self.spikeClips (list): List of spike clips
+            spikeClips_x2: ms, read only 2d view of spikeClips_x, one row per clip
+            self.spikeClips (np.ndarray): 2d array of spike clips, one row per clip
         """
 
         verbose = self._detectionDict["verbose"]
@@ -2315,70 +2354,35 @@ class bAnalysis:
         #    clipWidth_pnts += 1 # Make odd even
         postClipWidth_pnts = self.fileLoader.ms2Pnt_(postSpikeClipWidth_ms)
 
-        # halfClipWidth_pnts = int(clipWidth_pnts/2)
-
-        # print('  makeSpikeClips() clipWidth_pnts:', clipWidth_pnts, 'halfClipWidth_pnts:', halfClipWidth_pnts)
-        # make one x axis clip with the threshold crossing at 0
-        # was this, in ms
-        # self.spikeClips_x = [(x-halfClipWidth_pnts)/self.dataPointsPerMs for x in range(clipWidth_pnts)]
-
-        # in ms
-        self.spikeClips_x = [
-            (x - preClipWidth_pnts) / self.fileLoader.dataPointsPerMs
-            for x in range(preClipWidth_pnts)
-        ]
-        self.spikeClips_x += [
-            (x) / self.fileLoader.dataPointsPerMs for x in range(postClipWidth_pnts)
-        ]
-
-        # 20190714, added this to make all clips same length, much easier to plot in MultiLine
-        numPointsInClip = len(self.spikeClips_x)
-
-        self.spikeClips = []
-        self.spikeClips_x2 = []
+        # in ms, one x axis for all clips with the threshold crossing at 0
+        self.spikeClips_x = (
+            np.arange(-preClipWidth_pnts, postClipWidth_pnts)
+            / self.fileLoader.dataPointsPerMs
+        )
 
         sweepY = self.fileLoader.sweepY_filtered
 
         # when there are no spikes getStat() will not return anything
         # For 'All' sweeps, we need to know column
-        sweepNum = self.getStat("sweep", sweepNumber=sweepNumber)
-
-        # logger.info(f'sweepY: {sweepY.shape} {len(sweepY.shape)}')
-        # logger.info(f'theseTime_pnts: {theseTime_pnts}')
+        sweepNum = None
+        if len(sweepY.shape) > 1:
+            sweepNum = self.getStat("sweep", sweepNumber=sweepNumber)
+
+        self.spikeClips, self._spikeClipsIdx = _getClips(
+            sweepY,
+            theseTime_pnts,
+            preClipWidth_pnts,
+            postClipWidth_pnts,
+            sweeps=sweepNum,
+        )
 
-        for idx, spikeTime in enumerate(theseTime_pnts):
-            sweep = sweepNum[idx]
+        if verbose and len(self._spikeClipsIdx) < len(theseTime_pnts):
+            logger.warning(
+                f"Did not add clips for {len(theseTime_pnts) - len(self._spikeClipsIdx)} spikes too close to start or end of recording"
+            )
 
-            if len(sweepY.shape) == 1:
-                # 1D case where recording has only oone sweep
-                # currentClip = sweepY[spikeTime-halfClipWidth_pnts:spikeTime+halfClipWidth_pnts]
-                currentClip = sweepY[
-                    spikeTime - preClipWidth_pnts : spikeTime + postClipWidth_pnts
-                ]
-            else:
-                # 2D case where recording has multiple sweeps
-                # currentClip = sweepY[spikeTime-halfClipWidth_pnts:spikeTime+halfClipWidth_pnts, sweep]
-                try:
-                    currentClip = sweepY[
-                        spikeTime - preClipWidth_pnts : spikeTime + preClipWidth_pnts,
-                        sweep,
-                    ]
-                except IndexError as e:
-                    logger.error(e)
-                    print(f"sweep: {sweep}")
-                    print(f"sweepY.shape: {sweepY.shape}")
-
-            if len(currentClip) == numPointsInClip:
-                self.spikeClips.append(currentClip)
-                self.spikeClips_x2.append(
-                    self.spikeClips_x
-                )  # a 2D version to make pyqtgraph multiline happy
-            else:
-                # pass
-                if verbose:
-                    logger.warning(
-                        f"Did not add clip for spike index: {idx} at time: {spikeTime} len(currentClip): {len(currentClip)} != numPointsInClip: {numPointsInClip}"
-                    )
+        # a 2D version to make pyqtgraph multiline happy, a view (no copy) of spikeClips_x
+        self.spikeClips_x2 = np.broadcast_to(self.spikeClips_x, self.spikeClips.shape)
 
         #
         return self.spikeClips_x2, self.spikeClips
@@ -2392,9 +2396,10 @@ class bAnalysis:
         postSpikeClipWidth_ms=None,
         sweepNumber=None,
         epochNumber='All',
-        ignoreMinMax=False  # added 20230418
+        ignoreMinMax=False,  # added 20230418
+        returnStd=False,
     ):
-        """Get 2d list of spike clips, spike clips x, and 1d mean spike clip.
+        """Get 2d array of spike clips, spike clips x, and 1d mean spike clip.
 
         Args:
             theMin (float): Start seconds.
@@ -2402,13 +2407,15 @@ class bAnalysis:
             spikeSelection (list): List of spike numbers
             preSpikeClipWidth_ms (float):
             postSpikeClipWidth_ms (float):
+            returnStd (bool): Also return the standard deviation of the clips
 
         Requires: self.spikeDetect() and self._makeSpikeClips()
 
         Returns:
-            theseClips (list): List of clip
-            theseClips_x (list): ms
-            meanClip (list)
+            theseClips (np.ndarray): 2d array of clips, one row per clip
+            theseClips_x (np.ndarray): ms, 2d read only view, all rows are the same
+            meanClip (np.ndarray)
+            stdClip (np.ndarray): Only if returnStd
         """
 
         if self.numSpikes == 0:
@@ -2424,10 +2431,6 @@ class bAnalysis:
 
         # new interface, spike detect no longer auto generates these
         # need to do this every time because we get here when sweepNumber changes
-        # if self.spikeClips is None:
-        #    self._makeSpikeClips(spikeClipWidth_ms=spikeClipWidth_ms, sweepNumber=sweepNumber)
-        # TODO: don't make all clips
-        # self._makeSpikeClips(spikeClipWidth_ms=spikeClipWidth_ms, sweepNumber=sweepNumber)
         self._makeSpikeClips(
             preSpikeClipWidth_ms=preSpikeClipWidth_ms,
             postSpikeClipWidth_ms=postSpikeClipWidth_ms,
@@ -2435,40 +2438,34 @@ class bAnalysis:
             epochNumber=epochNumber
         )
 
-        # make a list of clips within start/stop (Seconds)
-        theseClips = []
-        theseClips_x = []
-        tmpMeanClips = []  # for mean clip
-        meanClip = []
-        
         # spikeTimes are in pnts
         spikeTimes = self.getSpikeTimes(sweepNumber=sweepNumber, epochNumber=epochNumber)
 
         logger.info(f'spikeTimes:{len(spikeTimes)} sweepNumber:{sweepNumber} epochNumber:{epochNumber}')
 
-        # if len(spikeTimes) != len(self.spikeClips):
-        #    logger.error(f'len spikeTimes {len(spikeTimes)} !=  spikeClips {len(self.spikeClips)}')
+        # make a list of clips within start/stop (Seconds)
+        # index of the spike of each clip, spikes too close to start/stop do not have a clip
+        clipIdx = self._spikeClipsIdx
+        if doSpikeSelection:
+            doThisSpike = np.isin(clipIdx, spikeSelection)
+        elif ignoreMinMax:
+            doThisSpike = np.ones(len(clipIdx), dtype=bool)
+        else:
+            spikeSec = self.fileLoader.pnt2Sec_(np.asarray(spikeTimes)[clipIdx])
+            doThisSpike = (spikeSec >= theMin) & (spikeSec <= theMax)
 
-        # self.spikeClips is a list of clips
-        for idx, clip in enumerate(self.spikeClips):
-            doThisSpike = False
-            if doSpikeSelection:
-                doThisSpike = idx in spikeSelection
-            else:
-                spikeTime = spikeTimes[idx]
-                spikeTime = self.fileLoader.pnt2Sec_(spikeTime)
-                if ignoreMinMax or (spikeTime >= theMin and spikeTime <= theMax):
-                    doThisSpike = True
-            if doThisSpike:
-                theseClips.append(clip)
-                theseClips_x.append(
-                    self.spikeClips_x2[idx]
-                )  # remember, all _x are the same
-                if len(self.spikeClips_x) == len(clip):
-                    tmpMeanClips.append(clip)  # for mean clip
-        if len(tmpMeanClips):
-            meanClip = np.mean(tmpMeanClips, axis=0)
+        theseClips = self.spikeClips[doThisSpike]
+        theseClips_x = self.spikeClips_x2[: len(theseClips)]  # remember, all _x are the same
 
+        meanClip = []
+        stdClip = []
+        if len(theseClips):
+            meanClip = np.mean(theseClips, axis=0)
+            if returnStd:
+                stdClip = np.std(theseClips, axis=0)
+
+        if returnStd:
+            return theseClips, theseClips_x, meanClip, stdClip
         return theseClips, theseClips_x, meanClip
 
     # def numErrors(self):
@@ -2477,6 +2474,7 @@ class bAnalysis:
     #     else:
     #         return len(self.dfError)
 
+    @sanpy.perfUtils.timed("errorReport")
     def getErrorReport(self):
         """Generate an error report, one row per error.
         
@@ -2495,13 +2493,10 @@ class bAnalysis:
 
         #  20230422 spikeDict is not working as an iterable
         # use it as a list instead
-        numSpikes = len(self.spikeDict)
-        #for spike in self.spikeDict:
-        for _spikeNumber in range(numSpikes):
-            spike = self.spikeDict[_spikeNumber]
-            # spike is sanpy.bAnalysisResults.analysisResult
-            #print('spike:', spike)
-            for error in spike["errors"]:
+        sweeps = self.spikeDict.getValues("sweep")
+        epochs = self.spikeDict.getValues("epoch")
+        for _spikeNumber, spikeErrors in enumerate(self.spikeDict.getColumn("errors")):
+            for error in spikeErrors:
                 # spike["errors"] is a list of dict
                 # error is dict from _getErrorDict
                 if error is None or error == np.nan or error == "nan":
@@ -2517,8 +2512,8 @@ class bAnalysis:
                 #     logger.error(f"_spikeNumber:{_spikeNumber} sweep:{_sweep}")
                 #     #print(self.getOneSpikeDict(_spikeNumber))
                 
-                error['Sweep'] = self.getSpikeStat([_spikeNumber], 'sweep')[0]
-                error['Epoch'] = self.getSpikeStat([_spikeNumber], 'epoch')[0]
+                error['Sweep'] = sweeps[_spikeNumber]
+                error['Epoch'] = epochs[_spikeNumber]
 
                 dictList.append(error)
 
@@ -2575,10 +2570,11 @@ class bAnalysis:
         self.detectionClass._dDict = dDict
 
         analysisList = loadedDict["analysis"]
-        self.spikeDict._myList = analysisList
+        self.spikeDict.setFromListDict(analysisList)
 
         self._detectionDirty = False
         self._isAnalyzed = True
+        self._analysisGeneration = next(_analysisGenerations)
 
     def saveAnalysis_tocsv(self, path : str = None, verbose=False):
         """Save analysis to csv.
@@ -2767,6 +2763,338 @@ class bAnalysis:
         return ret
 
 
+def _getClips(
+    sweepY: np.ndarray,
+    spikeTimes,
+    prePnts: int,
+    postPnts: int,
+    sweeps=None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get a clip of sweepY around each spike time.
+
+    Clips are gathered in one step from a sliding window view of sweepY (no copy of
+    the windows), only the returned clips are allocated.
+    Spikes whose clip would extend past the start or end of sweepY are skipped.
+
+    Args:
+        sweepY: 1D recording, or 2D with one column per sweep.
+        spikeTimes: Spike times (points).
+        prePnts: Number of points in clip before each spike.
+        postPnts: Number of points in clip after (and including) each spike.
+        sweeps: For 2D sweepY, the sweep (column) of each spike.
+
+    Returns:
+        clips: 2D array of clips, one row per clip.
+        clipIdx: Index into spikeTimes of each clip.
+    """
+    numPointsInClip = prePnts + postPnts
+    startPnts = np.asarray(spikeTimes, dtype=np.int64).reshape(-1) - prePnts
+    clipIdx = np.flatnonzero(
+        (startPnts >= 0) & (startPnts + numPointsInClip <= sweepY.shape[0])
+    )
+    if numPointsInClip <= 0 or sweepY.shape[0] < numPointsInClip:
+        return np.empty((0, max(numPointsInClip, 0)), dtype=sweepY.dtype), clipIdx[:0]
+
+    # windows is (numWindows, [numSweeps,] numPointsInClip)
+    windows = np.lib.stride_tricks.sliding_window_view(sweepY, numPointsInClip, axis=0)
+    if sweepY.ndim == 1:
+        clips = windows[startPnts[clipIdx]]
+    else:
+        sweeps = np.asarray(sweeps, dtype=np.int64).reshape(-1)
+        clips = windows[startPnts[clipIdx], sweeps[clipIdx]]
+    return clips, clipIdx
+
+
+_defaultChunkSize = 2**21
+# number of points per block when detecting a lazy recording in chunks, see bAnalysis.spikeDetect()
+
+
+def _detectSweep(
+    sweepNumber: int,
+    sweepX: np.ndarray,
+    sweepY: np.ndarray,
+    filteredVm: np.ndarray,
+    filteredDeriv: np.ndarray,
+    dDict: dict,
+    dataPointsPerMs: float,
+    epochTable: "sanpy.fileloaders.epochTable",
+    filename: str,
+    dateStr: str,
+    timeStr: str,
+) -> "sanpy.bAnalysisResults.analysisResultList":
+    """Detect and analyze all spikes in one sweep.
+
+    This is a pure function of the sweep data, it does not use bAnalysis
+    or the file loader current sweep. Used by bAnalysis.spikeDetect(), possibly
+    in a thread or process pool.
+
+    Args:
+        sweepNumber: Sweep to detect
+        sweepX: Time (s)
+        sweepY: Raw recording of the sweep
+        filteredVm: Filtered recording of the sweep
+        filteredDeriv: Filtered derivative of the sweep
+        dDict: Detection dictionary, from sanpy.bDetection
+        dataPointsPerMs:
+        epochTable: Epoch table of the sweep, can be None
+        filename: File name for each spike in the results
+        dateStr: Analysis date
+        timeStr: Analysis time
+
+    Returns:
+        Analysis results with one row per spike. 'spikeNumber' is within the sweep.
+    """
+    results = sanpy.detectionUtils.detectSpikeTimes(
+        sweepY, filteredVm, filteredDeriv, dDict, dataPointsPerMs
+    )
+    if results is None:
+        return sanpy.bAnalysisResults.analysisResultList()
+    spikeTimes, spikeErrorList, newSpikePeakPnt, newSpikePeakVal = results
+
+    features, featureErrors = sanpy.detectionUtils.getSpikeFeatures(
+        filteredVm,
+        filteredDeriv,
+        sweepX,
+        spikeTimes,
+        newSpikePeakPnt,
+        dDict,
+        dataPointsPerMs,
+    )
+
+    return _getSweepResults(
+        sweepNumber,
+        spikeTimes,
+        spikeErrorList,
+        newSpikePeakPnt,
+        newSpikePeakVal,
+        features,
+        featureErrors,
+        dDict,
+        dataPointsPerMs,
+        epochTable,
+        filename,
+        dateStr,
+        timeStr,
+    )
+
+
+def _detectSweepChunked(
+    sweepNumber: int,
+    getBlock: Callable[[int, int], tuple],
+    numPoints: int,
+    chunkSize: int,
+    dDict: dict,
+    dataPointsPerMs: float,
+    epochTable: "sanpy.fileloaders.epochTable",
+    filename: str,
+    dateStr: str,
+    timeStr: str,
+) -> "sanpy.bAnalysisResults.analysisResultList":
+    """Detect and analyze all spikes in one sweep, one block of points at a time.
+
+    Gives the same results as _detectSweep() but only one block (plus its overlap)
+    is in memory. Each spike belongs to the block with its threshold crossing,
+    see sanpy.detectionUtils.detectSpikeTimesInBlock().
+
+    Args:
+        sweepNumber: Sweep to detect
+        getBlock: Function taking (start, stop) and returning
+            (sweepX, sweepY, filteredVm, filteredDeriv) for those points of the sweep,
+            see fileLoader_base.getDetectionBlock().
+        numPoints: Number of points in the sweep
+        chunkSize: Number of points in each block
+        Others are the same as _detectSweep()
+    """
+    overlap = sanpy.detectionUtils.getChunkOverlap(dDict, dataPointsPerMs)
+    chunkSize = max(int(chunkSize), 1)
+
+    state = {}  # carried between blocks
+    spikeTimes = []
+    spikeErrorList = []
+    peakPnts = []
+    peakVals = []
+    blockFeatures = []
+    featureErrors = []
+    for blockStart in range(0, numPoints, chunkSize):
+        blockStop = min(blockStart + chunkSize, numPoints)
+        pntOffset = max(0, blockStart - overlap)
+        sweepX, sweepY, filteredVm, filteredDeriv = getBlock(
+            pntOffset, min(numPoints, blockStop + overlap)
+        )
+
+        results = sanpy.detectionUtils.detectSpikeTimesInBlock(
+            sweepY,
+            filteredVm,
+            filteredDeriv,
+            dDict,
+            dataPointsPerMs,
+            blockStart,
+            blockStop,
+            pntOffset,
+            state,
+        )
+        if results is None:
+            return sanpy.bAnalysisResults.analysisResultList()
+        blockSpikeTimes, blockErrors, blockPeakPnts, blockPeakVals = results
+        if len(blockSpikeTimes) == 0:
+            continue
+
+        features, errors = sanpy.detectionUtils.getSpikeFeatures(
+            filteredVm,
+            filteredDeriv,
+            sweepX,
+            blockSpikeTimes,
+            blockPeakPnts,
+            dDict,
+            dataPointsPerMs,
+            pntOffset=pntOffset,
+        )
+
+        spikeTimes += [spikeTime + pntOffset for spikeTime in blockSpikeTimes]
+        spikeErrorList += blockErrors
+        peakPnts += [peakPnt + pntOffset for peakPnt in blockPeakPnts]
+        peakVals += blockPeakVals
+        blockFeatures.append(features)
+        featureErrors += errors
+
+    if blockFeatures:
+        features = {
+            k: np.concatenate([oneBlock[k] for oneBlock in blockFeatures])
+            for k in blockFeatures[0].keys()
+        }
+        # isi and cycle length across block boundaries
+        sanpy.detectionUtils.setInterSpikeFeatures(features, dataPointsPerMs)
+    else:
+        features, featureErrors = sanpy.detectionUtils.getSpikeFeatures(
+            np.zeros(0), np.zeros(0), np.zeros(0), [], [], dDict, dataPointsPerMs
+        )
+
+    return _getSweepResults(
+        sweepNumber,
+        spikeTimes,
+        spikeErrorList,
+        peakPnts,
+        peakVals,
+        features,
+        featureErrors,
+        dDict,
+        dataPointsPerMs,
+        epochTable,
+        filename,
+        dateStr,
+        timeStr,
+    )
+
+
+@sanpy.perfUtils.timed("results")
+def _getSweepResults(
+    sweepNumber: int,
+    spikeTimes,
+    spikeErrorList,
+    newSpikePeakPnt,
+    newSpikePeakVal,
+    features: dict,
+    featureErrors,
+    dDict: dict,
+    dataPointsPerMs: float,
+    epochTable: "sanpy.fileloaders.epochTable",
+    filename: str,
+    dateStr: str,
+    timeStr: str,
+) -> "sanpy.bAnalysisResults.analysisResultList":
+    """Analysis results of one sweep, one row per spike.
+
+    Spike times and features are from sanpy.detectionUtils, see _detectSweep().
+    """
+    spikeDict = sanpy.bAnalysisResults.analysisResultList()
+
+    verbose = dDict["verbose"]
+    detectionType = dDict["detectionType"]
+    halfHeights = dDict["halfHeights"]
+
+    numSpikes = len(spikeTimes)
+    spikeDict.appendDefault(numSpikes)
+
+    spikeDict.setColumn("analysisDate", dateStr)
+    spikeDict.setColumn("analysisTime", timeStr)
+    spikeDict.setColumn("analysisVersion", sanpy.analysisVersion)
+    spikeDict.setColumn("interfaceVersion", sanpy.interfaceVersion)
+    spikeDict.setColumn("file", filename)
+    spikeDict.setColumn("detectionType", detectionType)
+    spikeDict.setColumn("cellType", dDict["cellType"])
+    spikeDict.setColumn("sex", dDict["sex"])
+    spikeDict.setColumn("condition", dDict["condition"])
+    spikeDict.setColumn("sweep", sweepNumber)
+
+    if epochTable is not None:
+        # spikes not in an epoch keep the default (nan)
+        epochs = epochTable.findEpochs(np.asarray(spikeTimes, dtype=np.int64))
+        inEpoch = epochs >= 0
+        spikeDict.setColumn("epoch", epochs[inEpoch], rowIdx=inEpoch)
+        spikeDict.setColumn("epochLevel", epochTable.getLevels(epochs[inEpoch]), rowIdx=inEpoch)
+
+    # keep track of per sweep spike and total spike
+    spikeDict.setColumn("sweepSpikeNumber", np.arange(numSpikes))
+    # absolute spike number is set when sweeps are merged, see bAnalysis.spikeDetect()
+    spikeDict.setColumn("spikeNumber", np.arange(numSpikes))
+    spikeDict.setColumn("include", True)
+    spikeDict.setColumn("userType", 0)
+
+    spikeDict.setColumn("dvdtThreshold", dDict["dvdtThreshold"])
+    spikeDict.setColumn("mvThreshold", dDict["mvThreshold"])
+    spikeDict.setColumn("medianFilter", dDict["medianFilter"])
+    spikeDict.setColumn("halfHeights", [halfHeights] * numSpikes)
+
+    for k, v in features.items():
+        if k.startswith("risingPnt_") or k.startswith("fallingPnt_"):
+            continue
+        # results in points are int, they are nan when not defined
+        isInt = k.endswith(("Pnt", "Pnt0", "Pnt1", "_pnt", "_pnts"))
+        spikeDict.setColumn(k, v, isInt=isInt)
+    spikeDict.setColumn("thresholdPnt", np.asarray(spikeTimes, dtype=np.int64))
+    spikeDict.setColumn("peakPnt", np.asarray(newSpikePeakPnt, dtype=np.int64))
+    spikeDict.setColumn("peakVal", np.asarray(newSpikePeakVal, dtype=float))
+
+    widthsList = []
+    errorsList = []
+    for i, spikeTime in enumerate(spikeTimes):
+        widths = []
+        for halfHeight in halfHeights:
+            widthMs = features[f"widths_{halfHeight}"][i]
+            widthDict = {
+                "halfHeight": halfHeight,
+                "risingPnt": None,
+                "fallingPnt": None,
+                "widthPnts": None,
+                "widthMs": widthMs,
+            }
+            if not math.isnan(widthMs):
+                widthDict["risingPnt"] = int(features[f"risingPnt_{halfHeight}"][i])
+                widthDict["fallingPnt"] = int(features[f"fallingPnt_{halfHeight}"][i])
+                widthDict["widthPnts"] = widthDict["fallingPnt"] - widthDict["risingPnt"]
+            widths.append(widthDict)
+        widthsList.append(widths)
+
+        # errors from spikeDetect_dvdt() or spikeDetect_mv() come first
+        errors = []
+        tmpError = spikeErrorList[i]
+        if tmpError is not None:
+            errors.append(tmpError)
+        for errorType, errorStr in featureErrors[i]:
+            eDict = sanpy.detectionUtils.getSpikeErrorDict(
+                i, spikeTime, errorType, errorStr, dataPointsPerMs
+            )
+            errors.append(eDict)
+            if verbose:
+                logger.error(f"  spike:{i} error:{eDict}")
+        errorsList.append(errors)
+
+    spikeDict.setColumn("widths", widthsList)
+    spikeDict.setColumn("errors", errorsList)
+
+    return spikeDict
+
+
 class NumpyEncoder(json.JSONEncoder):
     """Special json encoder for numpy types"""
 
@@ -1,4 +1,5 @@
 from pprint import pprint
+import math
 
 from typing import List, Union, Optional  # Callable, Iterator, Optional
 import warnings  # to catch np.polyfit -->> RankWarning: Polyfit may be poorly conditioned
@@ -7,6 +8,7 @@ import numpy as np
 import scipy.signal
 
 import sanpy
+import sanpy.perfUtils
 
 from sanpy.sanpyLogger import get_logger
 
@@ -73,34 +75,20 @@ def getThreshold_vm(y, threshold: float):
     return thresholdPoints
 
 
+@sanpy.perfUtils.timed("refractory")
 def reduceByRefractory(spikeTimes: List[int], refractoryPnts: int):
     """If there are fast-spikes, throw-out the second one.
 
     Args:
     spikeTimes: list of spike time threshold crossing
     refractoryPnts:
-    """
-
-    # refractory_ms = 20 #10 # remove spike [i] if it occurs within refractory_ms of spike [i-1]
 
-    spikeTimes = spikeTimes.copy()  # make a copy of the list, we are modifying it
-
-    lastGood = 0  # first spike [0] will always be good, there is no spike [i-1]
-    for i in range(len(spikeTimes)):
-        if i == 0:
-            # first spike is always good
-            continue
-        dPoints = spikeTimes[i] - spikeTimes[lastGood]
-        if dPoints < refractoryPnts:
-            # remove spike time [i]
-            spikeTimes[i] = 0
-        else:
-            # spike time [i] was good
-            lastGood = i
+    See keepAfterRefractory()
+    """
+    keepIdx, _ = keepAfterRefractory(spikeTimes, refractoryPnts)
 
-    # regenerate spikeTimes0 by throwing out any spike time that does not pass 'if spikeTime'
-    # spikeTimes[i] that were set to 0 above (they were too close to the previous spike)
-    newSpikeTimes = [spikeTime for spikeTime in spikeTimes if spikeTime]
+    # a spike time of 0 is never kept, it does not pass 'if spikeTime'
+    newSpikeTimes = [spikeTimes[idx] for idx in keepIdx if spikeTimes[idx]]
     return newSpikeTimes
 
 
@@ -614,6 +602,989 @@ def getEarlyDiastolicDurationRate(
     return retSpikeDict, errorList
 
 
+# max number of samples gathered at once by getSpikeFeatures(), spikes are processed
+# in chunks so (numSpikes x windowPnts) never exceeds this
+_maxWindowElements = 2**22
+
+
+def _ms2Pnt(ms: float, dataPointsPerMs: float) -> int:
+    """Same as fileLoader.ms2Pnt_()"""
+    return int(round(ms * dataPointsPerMs))
+
+
+def _getWindows(y: np.ndarray, starts: np.ndarray, stops: np.ndarray, fill: float, width: int = 0):
+    """Gather ragged windows y[starts[i]:stops[i]] into one 2D array.
+
+    Windows are padded on the right with `fill`, choose fill so it never wins
+    the reduction (e.g. +inf for argmin).
+
+    Args:
+        y (np.ndarray): 1D signal
+        starts (np.ndarray): start point of each window (>= 0)
+        stops (np.ndarray): stop point of each window (exclusive), clipped to len(y)
+        width (int): Pad windows to at least this length. Sums over rows depend on the
+            padded length, use a fixed width so they do not depend on the other windows.
+
+    Returns:
+        windows (np.ndarray): shape (numWindows, max window length)
+        lengths (np.ndarray): the number of valid points in each window
+    """
+    n = len(y)
+    starts = np.clip(starts, 0, n)
+    stops = np.clip(stops, 0, n)
+    lengths = np.maximum(stops - starts, 0)
+    maxLength = int(lengths.max()) if len(lengths) > 0 else 0
+    maxLength = max(maxLength, width)
+    if maxLength == 0:
+        return np.full((len(starts), 0), fill), lengths
+    offsets = np.arange(maxLength)
+    windows = y[np.minimum(starts[:, None] + offsets, n - 1)]
+    windows[offsets >= lengths[:, None]] = fill
+    return windows, lengths
+
+
+def _firstTrue(mask: np.ndarray):
+    """Index of first True in each row of a 2D boolean array, -1 if none."""
+    if mask.shape[1] == 0:
+        return np.full(mask.shape[0], -1)
+    firstIdx = np.argmax(mask, axis=1)
+    firstIdx[~mask.any(axis=1)] = -1
+    return firstIdx
+
+
+def getSpikeFeatures(
+    filteredVm: np.ndarray,
+    filteredDeriv: np.ndarray,
+    sweepX: np.ndarray,
+    spikeTimes,
+    peakPnts,
+    dDict: dict,
+    dataPointsPerMs: float,
+    pntOffset: int = 0,
+):
+    """Vectorized per-spike analysis for one sweep.
+
+    Computes the same features as the per-spike loop in bAnalysis._spikeDetect2()
+    using windowed reductions over all spikes at once. Spikes are processed in chunks
+    to bound memory (see _maxWindowElements).
+
+    Args:
+        filteredVm (np.ndarray): Filtered membrane potential for one sweep
+        filteredDeriv (np.ndarray): Filtered dV/dt for one sweep
+        sweepX (np.ndarray): Time (s) for one sweep
+        spikeTimes (list[int]): Threshold crossing of each spike (pnts)
+        peakPnts (list[int]): AP peak of each spike (pnts)
+        dDict (dict): Detection dictionary
+        dataPointsPerMs (float):
+        pntOffset (int): Sweep point of the first point in filteredVm, when analyzing one block of a sweep.
+            Points in the results are sweep points, spikeTimes and peakPnts are not.
+
+    Returns:
+        features (dict): Keys are analysis results, values are np.ndarray (float) with one value per spike, nan when not defined.
+            Half-widths are in keys 'risingPnt_<halfHeight>', 'fallingPnt_<halfHeight>' and 'widths_<halfHeight>'.
+        errors (list): For each spike, list of (errorType, errorStr) in the order of the per-spike loop.
+    """
+    n = len(filteredVm)
+    spikeTimes = np.asarray(spikeTimes, dtype=np.int64)
+    peakPnts = np.asarray(peakPnts, dtype=np.int64)
+    numSpikes = len(spikeTimes)
+
+    fastAhpWindow_pnts = _ms2Pnt(dDict["fastAhpWindow_ms"], dataPointsPerMs)
+    mdp_pnts = _ms2Pnt(dDict["mdp_ms"], dataPointsPerMs)
+    avgWindow_pnts = math.floor(_ms2Pnt(dDict["avgWindow_ms"], dataPointsPerMs) / 2)
+    dvdtPostWindow_pnts = _ms2Pnt(dDict["dvdtPostWindow_ms"], dataPointsPerMs)
+    hwWindowPnts = round(dDict["halfWidthWindow_ms"] * dataPointsPerMs)
+    halfHeights = dDict["halfHeights"]
+    lowestEddRate = dDict["lowEddRate_warning"]
+
+    features = {}
+
+    def _nanArray():
+        return np.full(numSpikes, np.nan)
+
+    for key in [
+        "fastAhpPnt", "fastAhpSec", "fastAhpValue",
+        "preMinPnt", "preMinVal",
+        "preLinearFitPnt0", "preLinearFitPnt1", "earlyDiastolicDuration_ms",
+        "preLinearFitVal0", "preLinearFitVal1", "earlyDiastolicDurationRate",
+        "preSpike_dvdt_max_pnt", "preSpike_dvdt_max_val", "preSpike_dvdt_max_val2",
+        "postSpike_dvdt_min_pnt", "postSpike_dvdt_min_val", "postSpike_dvdt_min_val2",
+        "diastolicDuration_ms",
+        "isi_pnts", "isi_ms", "spikeFreq_hz", "cycleLength_pnts", "cycleLength_ms",
+    ]:
+        features[key] = _nanArray()
+    for halfHeight in halfHeights:
+        features[f"risingPnt_{halfHeight}"] = _nanArray()
+        features[f"fallingPnt_{halfHeight}"] = _nanArray()
+        features[f"widths_{halfHeight}"] = _nanArray()
+
+    errors = [[] for _ in range(numSpikes)]
+    if numSpikes == 0:
+        return features, errors
+
+    thresholdVal = filteredVm[spikeTimes]
+    peakVal = filteredVm[peakPnts]
+    features["thresholdPnt"] = spikeTimes.astype(float)
+    features["thresholdSec"] = ((spikeTimes + pntOffset) / dataPointsPerMs) / 1000
+    features["thresholdVal"] = thresholdVal
+    features["thresholdVal_dvdt"] = filteredDeriv[spikeTimes]
+    features["peakPnt"] = peakPnts.astype(float)
+    features["peakSec"] = ((peakPnts + pntOffset) / dataPointsPerMs) / 1000
+    features["peakVal"] = peakVal
+    features["peakHeight"] = peakVal - thresholdVal
+    features["timeToPeak_ms"] = (features["peakSec"] - features["thresholdSec"]) * 1000
+
+    # size chunks by the widest window we will gather
+    maxWindow = max(
+        1,
+        fastAhpWindow_pnts,
+        mdp_pnts,
+        2 * avgWindow_pnts,
+        dvdtPostWindow_pnts,
+        hwWindowPnts,
+        int((peakPnts - spikeTimes).max()) + 1,
+    )
+    chunkSize = max(1, _maxWindowElements // maxWindow)
+
+    # local preMinPnt, used for edd and diastolic duration even when we fail to find the mdp
+    localPreMinPnt = np.zeros(numSpikes, dtype=np.int64)
+
+    # time each stage, see bAnalysis.perfReport
+    laps = sanpy.perfUtils.lapTimer()
+
+    for chunkStart in range(0, numSpikes, chunkSize):
+        s = slice(chunkStart, min(chunkStart + chunkSize, numSpikes))
+        t = spikeTimes[s]
+        peak = peakPnts[s]
+        chunkErrors = errors[s]
+        numChunk = len(t)
+
+        #
+        # fast ahp, only when the full window fits in the sweep
+        hasAhp = (peak + fastAhpWindow_pnts < n) & (fastAhpWindow_pnts > 0)
+        if hasAhp.any():
+            ahpWin, _ = _getWindows(
+                filteredVm, peak[hasAhp], peak[hasAhp] + fastAhpWindow_pnts, np.inf
+            )
+            ahpIdx = np.argmin(ahpWin, axis=1)
+            fastAhpPnt = peak[hasAhp] + ahpIdx
+            features["fastAhpPnt"][s][hasAhp] = fastAhpPnt
+            features["fastAhpSec"][s][hasAhp] = (fastAhpPnt + pntOffset) / dataPointsPerMs / 1000
+            features["fastAhpValue"][s][hasAhp] = filteredVm[fastAhpPnt]
+            ahpError = np.zeros(numChunk, dtype=bool)
+            ahpError[hasAhp] = ahpIdx == fastAhpWindow_pnts - 1
+            for i in np.nonzero(ahpError)[0]:
+                chunkErrors[i].append(
+                    (
+                        "Fast AHP was detected at end of fast AHP window",
+                        "Consider increasing the fast AHP window with fastAhpWindow_ms",
+                    )
+                )
+        laps.lap("ahp")
+
+        #
+        # pre spike min (mdp)
+        startPnt = t - mdp_pnts
+        underRun = startPnt < 0
+        startPnt[underRun] = 0
+        for i in np.nonzero(underRun)[0]:
+            chunkErrors[i].append(
+                (
+                    "Pre spike min under-run (mdp)",
+                    "Went past startPnt 0 searching for pre-spike min",
+                )
+            )
+
+        preWin, preLengths = _getWindows(filteredVm, startPnt, t, np.inf)
+        emptyPre = preLengths == 0
+        preMinPnt = np.zeros(numChunk, dtype=np.int64)
+        if preWin.shape[1] > 0:
+            preMinPnt = np.argmin(preWin, axis=1)
+        # on error the legacy code falls back to startPnt (before adding startPnt below)
+        preMinPnt[emptyPre] = startPnt[emptyPre]
+        for i in np.nonzero(emptyPre)[0]:
+            chunkErrors[i].append(
+                (
+                    "Pre spike min 0 (mdp)",
+                    f"Did not find preMinPnt mdp_pnts:{mdp_pnts} startPnt:{startPnt[i]+pntOffset} spikeTimes[i]:{t[i]+pntOffset}",
+                )
+            )
+
+        if avgWindow_pnts < 1:
+            # preMinPnt stays relative to startPnt
+            for i in range(numChunk):
+                chunkErrors[i].append(("mdp error", "avgWindow_pnts"))
+        else:
+            preMinPnt = preMinPnt + startPnt
+
+            # the pre min is an average around the real minima, follow python slicing
+            avgStart = preMinPnt - avgWindow_pnts
+            avgStart[avgStart < 0] += n
+            avgStart = np.clip(avgStart, 0, n)
+            avgStop = np.clip(preMinPnt + avgWindow_pnts, 0, n)
+            preMinVal = np.full(numChunk, np.nan)
+            fullAvg = (avgStop - avgStart) == 2 * avgWindow_pnts
+            if fullAvg.any():
+                avgWin, _ = _getWindows(
+                    filteredVm, avgStart[fullAvg], avgStop[fullAvg], np.nan
+                )
+                preMinVal[fullAvg] = avgWin.mean(axis=1)
+            for i in np.nonzero(~fullAvg & (avgStop > avgStart))[0]:
+                preMinVal[i] = np.average(filteredVm[avgStart[i] : avgStop[i]])
+
+            # search backward from spike to find when vm reaches preMinVal (avg)
+            searchWin, searchLengths = _getWindows(filteredVm, preMinPnt, t, np.inf)
+            below = searchWin < preMinVal[:, None]
+            lastBelow = _firstTrue(below[:, ::-1])
+            found = lastBelow >= 0
+            # index (from start of window) of last point below preMinVal
+            lastBelow = searchWin.shape[1] - 1 - lastBelow
+            newPreMinPnt = np.clip(preMinPnt, 0, n) + lastBelow + 1
+            preMinPnt[found] = newPreMinPnt[found]
+
+            features["preMinPnt"][s][found] = preMinPnt[found]
+            features["preMinVal"][s][found] = preMinVal[found]
+            for i in np.nonzero(~found)[0]:
+                chunkErrors[i].append(
+                    (
+                        "Pre spike min (mdp)",
+                        "Did not find preMinVal: " + str(round(preMinVal[i], 3)),
+                    )
+                )
+
+        localPreMinPnt[s] = preMinPnt
+        laps.lap("mdp")
+
+        #
+        # early diastolic duration, linear fit on 10% - 50% of the time from preMinPnt to spike
+        timeInterval_pnts = t - preMinPnt
+        preLinearFitPnt0 = preMinPnt + np.round(timeInterval_pnts * 0.1).astype(np.int64)
+        preLinearFitPnt1 = preMinPnt + np.round(timeInterval_pnts * 0.5).astype(np.int64)
+        features["preLinearFitPnt0"][s] = preLinearFitPnt0
+        features["preLinearFitPnt1"][s] = preLinearFitPnt1
+        features["earlyDiastolicDuration_ms"][s] = (
+            preLinearFitPnt1 - preLinearFitPnt0
+        ) / dataPointsPerMs
+        features["preLinearFitVal0"][s] = filteredVm[np.clip(preLinearFitPnt0, -n, n - 1)]
+        features["preLinearFitVal1"][s] = filteredVm[np.clip(preLinearFitPnt1, -n, n - 1)]
+
+        # slope of least squares line fit to (sweepX, filteredVm)
+        fitLengths = np.maximum(
+            np.clip(preLinearFitPnt1, 0, n) - np.clip(preLinearFitPnt0, 0, n), 0
+        )
+        canFit = fitLengths >= 2
+        eddRate = np.full(numChunk, np.nan)
+        if canFit.any():
+            # the fit is at most mdp_pnts long
+            xFit, _ = _getWindows(
+                sweepX, preLinearFitPnt0[canFit], preLinearFitPnt1[canFit], np.nan, mdp_pnts
+            )
+            yFit, fitN = _getWindows(
+                filteredVm, preLinearFitPnt0[canFit], preLinearFitPnt1[canFit], np.nan, mdp_pnts
+            )
+            xMean = np.nansum(xFit, axis=1) / fitN
+            yMean = np.nansum(yFit, axis=1) / fitN
+            xDiff = xFit - xMean[:, None]
+            eddRate[canFit] = np.nansum(
+                xDiff * (yFit - yMean[:, None]), axis=1
+            ) / np.nansum(xDiff**2, axis=1)
+        features["earlyDiastolicDurationRate"][s] = eddRate
+        for i in range(numChunk):
+            if fitLengths[i] == 0:
+                # np.polyfit() raises TypeError
+                chunkErrors[i].append(
+                    (
+                        "Fit EDD",
+                        "Early diastolic duration rate fit - preMinPnt == spikePnt",
+                    )
+                )
+            elif fitLengths[i] == 1:
+                # np.polyfit() warns RankWarning
+                chunkErrors[i].append(
+                    ("Fit EDD", "Early diastolic duration rate fit - RankWarning")
+                )
+            elif eddRate[i] <= lowestEddRate:
+                chunkErrors[i].append(
+                    (
+                        "Fit EDD",
+                        f"Early diastolic duration rate fit - Too low {round(eddRate[i],3)}<={lowestEddRate}",
+                    )
+                )
+        laps.lap("edd")
+
+        #
+        # maxima in dv/dt before spike (between TOP and peak)
+        dvdtWin, dvdtLengths = _getWindows(filteredDeriv, t, peak + 1, -np.inf)
+        hasDvdt = dvdtLengths > 0
+        if hasDvdt.any():
+            dvdtMaxPnt = t[hasDvdt] + np.argmax(dvdtWin[hasDvdt], axis=1)
+            features["preSpike_dvdt_max_pnt"][s][hasDvdt] = dvdtMaxPnt
+            features["preSpike_dvdt_max_val"][s][hasDvdt] = filteredVm[dvdtMaxPnt]
+            features["preSpike_dvdt_max_val2"][s][hasDvdt] = filteredDeriv[dvdtMaxPnt]
+        for i in np.nonzero(~hasDvdt)[0]:
+            chunkErrors[i].append(
+                ("Pre Spike dvdt", "Searching for dvdt max - ValueError")
+            )
+
+        #
+        # minima in dv/dt after spike
+        dvdtWin, dvdtLengths = _getWindows(
+            filteredDeriv, peak, peak + dvdtPostWindow_pnts, np.inf
+        )
+        hasDvdt = dvdtLengths > 0
+        if hasDvdt.any():
+            dvdtMinPnt = peak[hasDvdt] + np.argmin(dvdtWin[hasDvdt], axis=1)
+            features["postSpike_dvdt_min_pnt"][s][hasDvdt] = dvdtMinPnt
+            features["postSpike_dvdt_min_val"][s][hasDvdt] = filteredVm[dvdtMinPnt]
+            features["postSpike_dvdt_min_val2"][s][hasDvdt] = filteredDeriv[dvdtMinPnt]
+        laps.lap("dvdt")
+
+        #
+        # half-widths, search falling phase then use falling vm to search rising phase
+        fallingWin, _ = _getWindows(filteredVm, peak, peak + hwWindowPnts, np.inf)
+        risingWin, _ = _getWindows(filteredVm, t, peak, -np.inf)
+        spikeHeight = peakVal[s] - thresholdVal[s]
+        halfWidthWindow_ms = hwWindowPnts / dataPointsPerMs
+        hwErrors = [[] for _ in range(numChunk)]
+        for halfHeight in halfHeights:
+            thisVm = thresholdVal[s] + spikeHeight * (halfHeight * 0.01)
+            fallingIdx = _firstTrue(fallingWin < thisVm[:, None])
+            hasFalling = fallingIdx >= 0
+            fallingPnt = peak + fallingIdx
+            fallingVal = filteredVm[np.clip(fallingPnt, 0, n - 1)]
+            risingIdx = _firstTrue(risingWin > fallingVal[:, None])
+            hasRising = hasFalling & (risingIdx >= 0)
+            risingPnt = t + risingIdx
+
+            features[f"risingPnt_{halfHeight}"][s][hasRising] = risingPnt[hasRising]
+            features[f"fallingPnt_{halfHeight}"][s][hasRising] = fallingPnt[hasRising]
+            features[f"widths_{halfHeight}"][s][hasRising] = (
+                fallingPnt[hasRising] - risingPnt[hasRising]
+            ) / dataPointsPerMs
+
+            for i in np.nonzero(~hasRising)[0]:
+                tmpErrorType = "falling point" if not hasFalling[i] else "rising point"
+                peakSec = (peak[i] + pntOffset) / dataPointsPerMs / 1000
+                hwErrors[i].append(
+                    (
+                        "Spike Width",
+                        f'Half width {halfHeight} error in "{tmpErrorType}" '
+                        f"with halfWidthWindow_ms:{halfWidthWindow_ms} "
+                        f"searching for Vm:{round(thisVm[i],2)} from peak sec {round(peakSec,2)}",
+                    )
+                )
+        for i in range(numChunk):
+            chunkErrors[i].extend(hwErrors[i])
+        laps.lap("halfWidth")
+
+    # diastolic duration was defined as the interval between MDP and TOP
+    features["diastolicDuration_ms"] = (spikeTimes - localPreMinPnt) / dataPointsPerMs
+
+    if pntOffset != 0:
+        for k in _pntFeatures + [
+            f"{pntKey}_{halfHeight}"
+            for pntKey in ["risingPnt", "fallingPnt"]
+            for halfHeight in halfHeights
+        ]:
+            features[k] = features[k] + pntOffset
+
+    setInterSpikeFeatures(features, dataPointsPerMs)
+
+    return features, errors
+
+
+_pntFeatures = [
+    "thresholdPnt", "peakPnt", "fastAhpPnt", "preMinPnt",
+    "preLinearFitPnt0", "preLinearFitPnt1",
+    "preSpike_dvdt_max_pnt", "postSpike_dvdt_min_pnt",
+]
+# features in sweep points, see getSpikeFeatures(pntOffset)
+
+
+def setInterSpikeFeatures(features: dict, dataPointsPerMs: float):
+    """Set features that depend on the previous spike in the sweep, e.g. isi and cycle length.
+
+    Used by getSpikeFeatures() and again after joining features from blocks of one sweep.
+
+    Args:
+        features (dict): From getSpikeFeatures(), modified in place
+        dataPointsPerMs (float):
+    """
+    spikeTimes = features["thresholdPnt"]
+    numSpikes = len(spikeTimes)
+    for key in ["isi_pnts", "isi_ms", "spikeFreq_hz", "cycleLength_pnts", "cycleLength_ms"]:
+        features[key] = np.full(numSpikes, np.nan)
+
+    # instantaneous spike frequency and ISI, for first spike this is not defined
+    if numSpikes > 1:
+        isiPnts = np.diff(spikeTimes)
+        features["isi_pnts"][1:] = isiPnts
+        features["isi_ms"][1:] = isiPnts / dataPointsPerMs
+        features["spikeFreq_hz"][1:] = 1 / (isiPnts / dataPointsPerMs / 1000)
+
+        # cycle length was defined as the interval between MDPs in successive APs
+        cycleLength_pnts = np.diff(features["preMinPnt"])
+        features["cycleLength_pnts"][1:] = cycleLength_pnts
+        features["cycleLength_ms"][1:] = cycleLength_pnts / dataPointsPerMs
+
+
+def getSpikeErrorDict(spikeNumber, pnt, errorType: str, detailStr: str, dataPointsPerMs: float) -> dict:
+    """Get error dict for one spike, as used in bAnalysis results and error report.
+
+    Args:
+        spikeNumber (int): Spike number within the sweep
+        pnt (int): Point of the error
+        errorType (str):
+        detailStr (str):
+        dataPointsPerMs (float): To convert pnt to seconds
+    """
+    sec = pnt / dataPointsPerMs / 1000
+    sec = round(sec, 4)
+
+    eDict = {
+        "Spike": spikeNumber,
+        "Seconds": sec,
+        "Sweep": "",
+        "Epoch": "",
+        "Type": errorType,
+        "Details": detailStr,
+    }
+    return eDict
+
+
+def keepAfterRefractory(spikeTimes, refractoryPnts: float, lastSpikeTime=None):
+    """Get index of spikes that are at least refractoryPnts after the last kept spike.
+
+    The first spike is always kept (if lastSpikeTime is None). After a kept spike [i],
+    the next kept spike is the first one at or after spikeTimes[i] + refractoryPnts.
+    This chain is followed for all kept spikes at once by repeatedly squaring the
+    'next kept spike' index (pointer jumping), no Python loop over spikes.
+
+    Args:
+        spikeTimes (list[int]): spike times to consider, in increasing order
+        refractoryPnts (float):
+        lastSpikeTime (int): Last kept spike before spikeTimes, None if there is none.
+            Used to continue across blocks of one sweep, see getChunkOverlap().
+
+    Returns:
+        keepIdx (np.ndarray): Index into spikeTimes of kept spikes
+        lastSpikeTime (int): Last kept spike, pass to the next call
+    """
+    spikeTimes = np.asarray(spikeTimes)
+    numSpikes = len(spikeTimes)
+
+    if spikeTimes.dtype.kind in "iu":
+        # for int spike times, t-last >= refractoryPnts is t >= last+ceil(refractoryPnts)
+        refractoryPnts = math.ceil(refractoryPnts)
+        spikeTimes = spikeTimes.astype(np.int64)
+
+    # first spike we keep
+    firstIdx = 0
+    if lastSpikeTime is not None:
+        firstIdx = int(np.searchsorted(spikeTimes, lastSpikeTime + refractoryPnts, side="left"))
+
+    if firstIdx >= numSpikes:
+        keepIdx = np.zeros(0, dtype=np.int64)
+    elif refractoryPnts <= 0:
+        keepIdx = np.arange(firstIdx, numSpikes)
+    else:
+        # at most one kept spike per refractoryPnts
+        maxKeep = int((spikeTimes[-1] - spikeTimes[firstIdx]) // refractoryPnts) + 1
+        maxKeep = min(maxKeep, numSpikes - firstIdx)
+
+        # next kept spike after each spike, numSpikes if there is none
+        nextIdx = np.empty(numSpikes + 1, dtype=np.int64)
+        nextIdx[:numSpikes] = np.searchsorted(spikeTimes, spikeTimes + refractoryPnts, side="left")
+        nextIdx[numSpikes] = numSpikes
+
+        # keepIdx[k] is nextIdx applied k times to firstIdx, apply nextIdx^(2^bit) for each bit of k
+        steps = np.arange(maxKeep)
+        keepIdx = np.full(maxKeep, firstIdx, dtype=np.int64)
+        bit = 0
+        while (1 << bit) < maxKeep:
+            doJump = (steps >> bit) & 1 == 1
+            keepIdx[doJump] = nextIdx[keepIdx[doJump]]
+            bit += 1
+            if (1 << bit) < maxKeep:
+                nextIdx = nextIdx[nextIdx]
+        keepIdx = keepIdx[keepIdx < numSpikes]
+
+    if len(keepIdx):
+        lastSpikeTime = spikeTimes[keepIdx[-1]].item()
+    return keepIdx, lastSpikeTime
+
+
+@sanpy.perfUtils.timed("refractory")
+def throwOutRefractory(spikeTimes0, goodSpikeErrors, refractory_ms: float, dataPointsPerMs: float, verbose=False):
+    """If there are doubles, throw-out the second one.
+
+    Args:
+        spikeTimes0 (list[int]): spike times to consider
+        goodSpikeErrors (list): list of errors per spike, can be None
+        refractory_ms (float): remove spike [i] if it occurs within refractory_ms of spike [i-1]
+        dataPointsPerMs (float):
+    """
+    before = len(spikeTimes0)
+
+    # first spike [0] will always be good, there is no spike [i-1]
+    keepIdx, _ = keepAfterRefractory(spikeTimes0, dataPointsPerMs * refractory_ms)
+
+    # a spike time of 0 is never kept, it does not pass 'if spikeTime'
+    keepIdx = [idx for idx in keepIdx if spikeTimes0[idx]]
+    if goodSpikeErrors is not None:
+        goodSpikeErrors = [goodSpikeErrors[idx] for idx in keepIdx]
+    spikeTimes0 = [spikeTimes0[idx] for idx in keepIdx]
+
+    after = len(spikeTimes0)
+    if verbose:
+        logger.info(
+            f"From {before} to {after} spikes with refractory_ms:{refractory_ms}"
+        )
+
+    return spikeTimes0, goodSpikeErrors
+
+
+def _reduceStartStop(spikeTimes0, dDict: dict, dataPointsPerMs: float):
+    """Only keep spike times in [startSeconds, stopSeconds]."""
+    if dDict["startSeconds"] is not None and dDict["stopSeconds"] is not None:
+        startPnt = dataPointsPerMs * (dDict["startSeconds"] * 1000)  # seconds to pnt
+        stopPnt = dataPointsPerMs * (dDict["stopSeconds"] * 1000)  # seconds to pnt
+        spikeTimes0 = [
+            spikeTime
+            for spikeTime in spikeTimes0
+            if (spikeTime >= startPnt and spikeTime <= stopPnt)
+        ]
+    return spikeTimes0
+
+
+def _thresholdCrossings(y: np.ndarray, threshold: float):
+    """Points where y goes above threshold."""
+    Is = np.where(y > threshold)[0]
+    Is = np.concatenate(([0], Is))
+    Ds = Is[:-1] - Is[1:] + 1
+    return Is[np.where(Ds)[0] + 1]
+
+
+@sanpy.perfUtils.timed("threshold")
+def _dvdtCandidates(sweepY: np.ndarray, filteredDeriv: np.ndarray, dDict: dict, dataPointsPerMs: float):
+    """Threshold crossings in dV/dt with a peak above mvThreshold (in sweepY)."""
+    spikeTimes0 = _thresholdCrossings(filteredDeriv, dDict["dvdtThreshold"])
+
+    # reduce spike times based on start/stop
+    spikeTimes0 = _reduceStartStop(spikeTimes0, dDict, dataPointsPerMs)
+
+    # throw out all spikes that are below a threshold Vm (usually below -20 mV)
+    peakWindow_pnts = _ms2Pnt(dDict["peakWindow_ms"], dataPointsPerMs)
+    goodSpikeTimes = []
+    for spikeTime in spikeTimes0:
+        # wu-lab-stanford data
+        try:
+            peakVal = np.max(sweepY[spikeTime : spikeTime + peakWindow_pnts])
+            if peakVal > dDict["mvThreshold"]:
+                goodSpikeTimes.append(spikeTime)
+        except (ValueError) as e:
+            logger.error(e)
+            logger.error(f'   spikeTime:{spikeTime} peakWindow_pnts:{peakWindow_pnts}')
+            logger.error(f'   dataPointsPerMs: {dataPointsPerMs}')
+    return goodSpikeTimes
+
+
+@sanpy.perfUtils.timed("threshold")
+def _dvdtPercentOfMax(
+    filteredDeriv: np.ndarray,
+    spikeTimes0,
+    dDict: dict,
+    dataPointsPerMs: float,
+    spikeOffset: int = 0,
+    pntOffset: int = 0,
+):
+    """For each threshold crossing, search backwards in dV/dt for a % of maximum.
+
+    Args:
+        spikeOffset: Added to spike numbers in errors, when spikeTimes0 are not the first spikes of the sweep
+        pntOffset: Added to points in errors, when filteredDeriv does not start at the start of the sweep
+    """
+    window_pnts = dDict["dvdtPreWindow_ms"] * dataPointsPerMs
+    # abb 20210130 lcr analysis
+    window_pnts = round(window_pnts)
+    spikeTimes1 = []
+    spikeErrorList1 = []
+    for i, spikeTime in enumerate(spikeTimes0):
+        # get max in derivative
+        preDerivClip = filteredDeriv[spikeTime - window_pnts : spikeTime]  # backwards
+        postDerivClip = filteredDeriv[spikeTime : spikeTime + window_pnts]  # forwards
+
+        if len(preDerivClip) == 0:
+            logger.warning(
+                f"spike {i+spikeOffset} at pnt {spikeTime+pntOffset} window_pnts:{window_pnts} "
+                f"dvdtPreWindow_ms:{dDict['dvdtPreWindow_ms']} len(preDerivClip):{len(preDerivClip)}"
+            )
+
+        # look for % of max in dvdt
+        try:
+            peakPnt = np.argmax(postDerivClip)
+            peakPnt += spikeTime
+            peakVal = filteredDeriv[peakPnt]
+
+            percentMaxVal = peakVal * dDict["dvdt_percentOfMax"]  # value we are looking for in dv/dt
+            preDerivClip = np.flip(preDerivClip)  # backwards
+            tmpWhere = np.where(preDerivClip < percentMaxVal)[0]
+            if len(tmpWhere) > 0:
+                threshPnt2 = tmpWhere[0]
+                threshPnt2 = (spikeTime) - threshPnt2
+                threshPnt2 -= 1  # backup by 1 pnt
+                spikeTimes1.append(threshPnt2)
+                spikeErrorList1.append(None)
+            else:
+                errorType = "dvdt Percent"
+                errStr = f"Did not find dvdt_percentOfMax: {dDict['dvdt_percentOfMax']} peak dV/dt is {round(peakVal,2)}"
+                eDict = getSpikeErrorDict(
+                    i + spikeOffset, spikeTime + pntOffset, errorType, errStr, dataPointsPerMs
+                )
+                spikeErrorList1.append(eDict)
+                # always append, do not REJECT spike if we can't find % in dv/dt
+                spikeTimes1.append(spikeTime)
+        except (IndexError, ValueError) as e:
+            logger.warning(
+                f"IndexError for spike {i+spikeOffset} {spikeTime+pntOffset} looking for dvdt_percentOfMax: {e}"
+            )
+            # always append, do not REJECT spike if we can't find % in dv/dt
+            spikeTimes1.append(spikeTime)
+
+    return spikeTimes1, spikeErrorList1
+
+
+def spikeDetect_dvdt(sweepY: np.ndarray, filteredDeriv: np.ndarray, dDict: dict, dataPointsPerMs: float):
+    """Detect spikes in one sweep with threshold crossings (dvdtThreshold) in dV/dt.
+
+    Spikes need a peak above mvThreshold (in sweepY). The threshold is then backed
+    up to the point where dV/dt crosses dvdt_percentOfMax of its max.
+
+    Args:
+        sweepY (np.ndarray): Raw membrane potential for one sweep
+        filteredDeriv (np.ndarray): Filtered dV/dt for one sweep
+        dDict (dict): Detection dictionary
+        dataPointsPerMs (float):
+
+    Returns:
+        spikeTimes (list[int]): Threshold of each spike (pnts)
+        spikeErrorList (list): Error dict or None for each spike
+    """
+    spikeTimes0 = _dvdtCandidates(sweepY, filteredDeriv, dDict, dataPointsPerMs)
+
+    # if there are doubles, throw-out the second one
+    spikeTimes0, _ = throwOutRefractory(
+        spikeTimes0, None, dDict["refractory_ms"], dataPointsPerMs, verbose=dDict["verbose"]
+    )
+
+    return _dvdtPercentOfMax(filteredDeriv, spikeTimes0, dDict, dataPointsPerMs)
+
+
+_minISI_ms = 75  # 250
+# spikeDetect_vm() throws out spikes within this many ms of the last upward deflection
+
+_vmUpDeflection_pnts = 10
+# _vmCandidates() compares the mean of this many points before and after a threshold crossing
+
+_backupVmMaxBins = 20
+# backupSpikeVm() backs up at most this many bins
+
+_backupVmBin_ms = 1
+# width of each bin in backupSpikeVm()
+
+
+@sanpy.perfUtils.timed("threshold")
+def _vmCandidates(sweepY: np.ndarray, filteredVm: np.ndarray, dDict: dict, dataPointsPerMs: float):
+    """Threshold crossings in Vm that are upward deflections of sweepY."""
+    spikeTimes0 = _thresholdCrossings(filteredVm, dDict["mvThreshold"])
+
+    # reduce spike times based on start/stop
+    spikeTimes0 = _reduceStartStop(spikeTimes0, dDict, dataPointsPerMs)
+
+    # throw out spike that are NOT upward deflections of Vm
+    prePntUp = _vmUpDeflection_pnts  # pnts
+    goodSpikeTimes = []
+    for spikeTime in spikeTimes0:
+        preClip = sweepY[spikeTime - prePntUp : spikeTime]  # not including the stop index
+        postClip = sweepY[spikeTime + 1 : spikeTime + prePntUp + 1]  # not including the stop index
+        preAvg = np.average(preClip)
+        postAvg = np.average(postClip)
+        if postAvg > preAvg:
+            goodSpikeTimes.append(spikeTime)
+    return goodSpikeTimes
+
+
+def spikeDetect_vm(sweepY: np.ndarray, filteredVm: np.ndarray, dDict: dict, dataPointsPerMs: float):
+    """Detect spikes in one sweep with threshold crossings (mvThreshold) in Vm, not dV/dt.
+
+    Args:
+        sweepY (np.ndarray): Raw membrane potential for one sweep
+        filteredVm (np.ndarray): Filtered membrane potential for one sweep
+        dDict (dict): Detection dictionary
+        dataPointsPerMs (float):
+
+    Returns:
+        spikeTimes (list[int]): Threshold crossing of each spike (pnts)
+        spikeErrorList (list): Error dict or None for each spike
+    """
+    spikeTimes0 = _vmCandidates(sweepY, filteredVm, dDict, dataPointsPerMs)
+
+    # throw out spikes within minISI of the last good spike
+    minISI_pnts = _ms2Pnt(_minISI_ms, dataPointsPerMs)
+    with sanpy.perfUtils.span("threshold"):
+        keepIdx, _ = keepAfterRefractory(spikeTimes0, minISI_pnts)
+    goodSpikeTimes = [spikeTimes0[idx] for idx in keepIdx]
+    goodSpikeErrors = [None] * len(goodSpikeTimes)
+
+    spikeTimes0, spikeErrorList = throwOutRefractory(
+        goodSpikeTimes, goodSpikeErrors, dDict["refractory_ms"], dataPointsPerMs, verbose=dDict["verbose"]
+    )
+
+    return spikeTimes0, spikeErrorList
+
+
+@sanpy.perfUtils.timed("threshold")
+def backupSpikeVm(sweepY: np.ndarray, spikeTimes, dataPointsPerMs: float, medianFilter: int = 5):
+    """Backup spike time using deminishing SD and diff b/w vm at pnt[i]-pnt[i-1].
+
+    Used when detecting with just mV threshold (not dv/dt)
+
+    Args:
+        sweepY (np.ndarray): Raw membrane potential for one sweep
+        spikeTimes (list[int]):
+        dataPointsPerMs (float):
+        medianFilter (int): bin width
+    """
+    realSpikeTimePnts = [np.nan] * len(spikeTimes)
+
+    if medianFilter > 0:
+        myVm = scipy.signal.medfilt(sweepY, medianFilter)
+    else:
+        myVm = sweepY
+
+    #
+    # TODO: this is going to fail if spike is at start/stop of recorrding
+    #
+
+    maxNumPntsToBackup = _backupVmMaxBins  # todo: add _ms
+    bin_ms = _backupVmBin_ms
+    bin_pnts = round(bin_ms * dataPointsPerMs)
+    half_bin_pnts = math.floor(bin_pnts / 2)
+    for idx, spikeTimePnts in enumerate(spikeTimes):
+        foundRealThresh = False
+        thisMean = None
+        backupNumPnts = 0
+        atBinPnt = spikeTimePnts
+        while not foundRealThresh:
+            thisWin = myVm[atBinPnt - half_bin_pnts : atBinPnt + half_bin_pnts]
+            if thisMean is None:
+                thisMean = np.mean(thisWin)
+
+            nextStart = atBinPnt - 1 - bin_pnts - half_bin_pnts
+            nextStop = atBinPnt - 1 - bin_pnts + half_bin_pnts
+            nextWin = myVm[nextStart:nextStop]
+            nextMean = np.mean(nextWin)
+            nextSD = np.std(nextWin)
+
+            meanDiff = thisMean - nextMean
+            # logic
+            sdMult = 0.7  # 2
+            if (meanDiff < nextSD * sdMult) or (backupNumPnts == maxNumPntsToBackup):
+                # second clause will force us to terminate (this recording has a very slow rise time)
+                foundRealThresh = True
+                # not this xxx but the previous
+                moveForwardPnts = 4
+                backupNumPnts = backupNumPnts - 1  # the prev is thresh
+                if backupNumPnts < moveForwardPnts:
+                    logger.warning(
+                        f"spike {idx} backupNumPnts:{backupNumPnts} < moveForwardPnts:{moveForwardPnts}"
+                    )
+                    realBackupPnts = backupNumPnts - 0
+                    realPnt = spikeTimePnts - (realBackupPnts * bin_pnts)
+                else:
+                    realBackupPnts = backupNumPnts - moveForwardPnts
+                    realPnt = spikeTimePnts - (realBackupPnts * bin_pnts)
+                #
+                realSpikeTimePnts[idx] = realPnt
+
+            # increment
+            thisMean = nextMean
+
+            atBinPnt -= bin_pnts
+            backupNumPnts += 1
+
+    return realSpikeTimePnts
+
+
+def _backupSpikeVmPnts(dataPointsPerMs: float, medianFilter: int = 5) -> int:
+    """Number of points before a spike time that backupSpikeVm() reads."""
+    bin_pnts = round(_backupVmBin_ms * dataPointsPerMs)
+    half_bin_pnts = math.floor(bin_pnts / 2)
+    # last window starts (maxNumPntsToBackup + 1) bins back, plus the median filter
+    return (_backupVmMaxBins + 1) * bin_pnts + 1 + half_bin_pnts + medianFilter // 2
+
+
+def detectSpikeTimes(sweepY: np.ndarray, filteredVm: np.ndarray, filteredDeriv: np.ndarray, dDict: dict, dataPointsPerMs: float):
+    """Detect spikes in one sweep and find their peaks.
+
+    Uses either dV/dt or mV detection (dDict['detectionType']),
+    then throws out spikes with peaks outside (onlyPeaksAbove_mV, onlyPeaksBelow_mV).
+
+    Returns:
+        spikeTimes (list[int]): Threshold of each spike (pnts)
+        spikeErrorList (list): Error dict or None for each spike
+        peakPnts (list[int]):
+        peakVals (list[float]):
+    """
+    detectionType = dDict["detectionType"]
+
+    # detect all spikes either with dvdt or mv
+    if detectionType == sanpy.bDetection.detectionTypes["mv"].value:
+        # detect using mV threshold
+        spikeTimes, spikeErrorList = spikeDetect_vm(sweepY, filteredVm, dDict, dataPointsPerMs)
+
+        # TODO: get rid of this and replace with foot
+        # backup childish vm threshold
+        if dDict["doBackupSpikeVm"]:
+            spikeTimes = backupSpikeVm(sweepY, spikeTimes, dataPointsPerMs)
+    elif detectionType == sanpy.bDetection.detectionTypes["dvdt"].value:
+        # detect using dv/dt threshold AND min mV
+        spikeTimes, spikeErrorList = spikeDetect_dvdt(sweepY, filteredDeriv, dDict, dataPointsPerMs)
+    else:
+        logger.error(f'Unknown detection type "{detectionType}"')
+        return None
+
+    return _throwOutAboveBelow(filteredVm, spikeTimes, spikeErrorList, dDict, dataPointsPerMs)
+
+
+@sanpy.perfUtils.timed("peak")
+def _throwOutAboveBelow(filteredVm: np.ndarray, spikeTimes, spikeErrorList, dDict: dict, dataPointsPerMs: float):
+    """Throw out spikes that have peak BELOW onlyPeaksAbove_mV or ABOVE onlyPeaksBelow_mV."""
+    peakWindow_pnts = _ms2Pnt(dDict["peakWindow_ms"], dataPointsPerMs)
+    return sanpy.analysisUtil.throwOutAboveBelow(
+        filteredVm,
+        spikeTimes,
+        spikeErrorList,
+        peakWindow_pnts,
+        onlyPeaksAbove_mV=dDict["onlyPeaksAbove_mV"],
+        onlyPeaksBelow_mV=dDict["onlyPeaksBelow_mV"],
+    )
+
+
+def getChunkOverlap(dDict: dict, dataPointsPerMs: float) -> int:
+    """Number of points each block needs on either side to detect its spikes in chunks.
+
+    A spike is detected in the block with its threshold crossing. Analysis then
+    backs up from the crossing (dvdtPreWindow_ms or backupSpikeVm) to the threshold,
+    searches back mdp_ms for the pre spike min and averages avgWindow_ms around it.
+    Forward, it searches peakWindow_ms for the peak and then the largest of
+    fastAhpWindow_ms, dvdtPostWindow_ms and halfWidthWindow_ms.
+    The overlap is the longest of these chains of windows.
+
+    See detectSpikeTimesInBlock().
+    """
+    def _pnts(key):
+        return _ms2Pnt(dDict[key], dataPointsPerMs)
+
+    backupVm_pnts = _backupSpikeVmPnts(dataPointsPerMs)
+
+    # _vmCandidates() reads one point past the clip after the crossing
+    prePntUp = _vmUpDeflection_pnts + 1
+    refine_pnts = max(_pnts("dvdtPreWindow_ms") + 1, backupVm_pnts, prePntUp)
+    backward = refine_pnts + _pnts("mdp_ms") + _pnts("avgWindow_ms")
+
+    postPeak_pnts = max(
+        _pnts("fastAhpWindow_ms"),
+        _pnts("dvdtPostWindow_ms"),
+        round(dDict["halfWidthWindow_ms"] * dataPointsPerMs),
+    )
+    forward = max(refine_pnts, _pnts("peakWindow_ms") + postPeak_pnts)
+
+    return int(max(backward, forward)) + 2
+
+
+def detectSpikeTimesInBlock(
+    sweepY: np.ndarray,
+    filteredVm: np.ndarray,
+    filteredDeriv: np.ndarray,
+    dDict: dict,
+    dataPointsPerMs: float,
+    blockStart: int,
+    blockStop: int,
+    pntOffset: int,
+    state: dict,
+):
+    """Detect spikes in one block of a sweep, see detectSpikeTimes().
+
+    Blocks are detected in order. Spikes are in the block with their threshold
+    crossing in [blockStart, blockStop), so each spike is in exactly one block.
+    The arrays must extend getChunkOverlap() points on either side of the block
+    (or to the start/end of the sweep).
+
+    Args:
+        sweepY, filteredVm, filteredDeriv: Data for the block with its overlap
+        blockStart, blockStop: Sweep points of the block
+        pntOffset: Sweep point of the first point in the arrays
+        state: Dict carried between blocks of one sweep, start with {}
+
+    Returns:
+        Same as detectSpikeTimes(), points are local to the arrays (add pntOffset).
+    """
+    detectionType = dDict["detectionType"]
+    isVm = detectionType == sanpy.bDetection.detectionTypes["mv"].value
+
+    # start/stop seconds are in sweep points
+    blockDict = dict(dDict, startSeconds=None, stopSeconds=None)
+    if isVm:
+        spikeTimes0 = _vmCandidates(sweepY, filteredVm, blockDict, dataPointsPerMs)
+    elif detectionType == sanpy.bDetection.detectionTypes["dvdt"].value:
+        spikeTimes0 = _dvdtCandidates(sweepY, filteredDeriv, blockDict, dataPointsPerMs)
+    else:
+        logger.error(f'Unknown detection type "{detectionType}"')
+        return None
+
+    spikeTimes0 = [
+        spikeTime + pntOffset
+        for spikeTime in spikeTimes0
+        if blockStart <= spikeTime + pntOffset < blockStop
+    ]
+    spikeTimes0 = _reduceStartStop(spikeTimes0, dDict, dataPointsPerMs)
+
+    # throw out spikes too close to the last good spike, which can be in a previous block
+    if isVm:
+        minISI_pnts = _ms2Pnt(_minISI_ms, dataPointsPerMs)
+        with sanpy.perfUtils.span("threshold"):
+            keepIdx, state["lastIsiSpike"] = keepAfterRefractory(
+                spikeTimes0, minISI_pnts, state.get("lastIsiSpike")
+            )
+        spikeTimes0 = [spikeTimes0[idx] for idx in keepIdx]
+    with sanpy.perfUtils.span("refractory"):
+        keepIdx, state["lastRefractorySpike"] = keepAfterRefractory(
+            spikeTimes0, dataPointsPerMs * dDict["refractory_ms"], state.get("lastRefractorySpike")
+        )
+    # a spike time of 0 is never kept, see throwOutRefractory()
+    spikeTimes0 = [
+        spikeTimes0[idx] - pntOffset
+        for idx in keepIdx
+        if spikeTimes0[idx]
+    ]
+
+    spikeOffset = state.get("numSpikes", 0)
+    state["numSpikes"] = spikeOffset + len(spikeTimes0)
+
+    if isVm:
+        spikeTimes = spikeTimes0
+        spikeErrorList = [None] * len(spikeTimes)
+        if dDict["doBackupSpikeVm"]:
+            spikeTimes = backupSpikeVm(sweepY, spikeTimes, dataPointsPerMs)
+    else:
+        spikeTimes, spikeErrorList = _dvdtPercentOfMax(
+            filteredDeriv, spikeTimes0, dDict, dataPointsPerMs, spikeOffset, pntOffset
+        )
+
+    return _throwOutAboveBelow(filteredVm, spikeTimes, spikeErrorList, dDict, dataPointsPerMs)
+
+
 def getErrorDict(spikeNumber, pnt, type, detailStr):
     """
     Get error dictionary for one spike.
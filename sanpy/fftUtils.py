@@ -21,6 +21,7 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 
 import sanpy
+import sanpy.detectionUtils
 
 from sanpy.sanpyLogger import get_logger
 
@@ -360,31 +361,20 @@ def _throwOutRefractory(spikePoints, refractory_ms=100):
     """
     spikePoints: spike times to consider
     refractory_ms:
+
+    See sanpy.detectionUtils.keepAfterRefractory()
     """
     dataPointsPerMs = 10
 
     before = len(spikePoints)
 
     # if there are doubles, throw-out the second one
-    # refractory_ms = 20 #10 # remove spike [i] if it occurs within refractory_ms of spike [i-1]
-    lastGood = 0  # first spike [0] will always be good, there is no spike [i-1]
-    for i in range(len(spikePoints)):
-        if i == 0:
-            # first spike is always good
-            continue
-        dPoints = spikePoints[i] - spikePoints[lastGood]
-        if dPoints < dataPointsPerMs * refractory_ms:
-            # remove spike time [i]
-            spikePoints[i] = 0
-        else:
-            # spike time [i] was good
-            lastGood = i
-    # regenerate spikeTimes0 by throwing out any spike time that does not pass 'if spikeTime'
-    # spikeTimes[i] that were set to 0 above (they were too close to the previous spike)
-    # will not pass 'if spikeTime', as 'if 0' evaluates to False
-    # if goodSpikeErrors is not None:
-    # 	goodSpikeErrors = [goodSpikeErrors[idx] for idx, spikeTime in enumerate(spikeTimes0) if spikeTime]
-    spikePoints = [spikePoint for spikePoint in spikePoints if spikePoint]
+    # remove spike [i] if it occurs within refractory_ms of the last good spike
+    keepIdx, _ = sanpy.detectionUtils.keepAfterRefractory(
+        spikePoints, dataPointsPerMs * refractory_ms
+    )
+    # spike points of 0 do not pass 'if spikePoint'
+    spikePoints = [spikePoints[idx] for idx in keepIdx if spikePoints[idx]]
 
     # TODO: put back in and log if detection ['verbose']
     after = len(spikePoints)
@@ -1,6 +1,7 @@
 from typing import Union, Optional
 from pprint import pprint
 
+import numpy as np
 import pandas as pd
 
 import pyabf
@@ -25,6 +26,9 @@ class epochTable():
     def __init__(self, abf: pyabf.ABF = None):
         self._epochList = []
 
+        self._epochArrays = None
+        # sorted start/stop points, see _getEpochArrays()
+
         if abf is not None:
             self._builFromAbf(abf)
     
@@ -55,6 +59,7 @@ class epochTable():
             # "digitalState": digitalState,  # list of 0/1 for 8x digital states
         }
         self._epochList.append(epochDict)
+        self._epochArrays = None
 
     def getSweepEpoch(self, sweep):
         return self._epochList[sweep]
@@ -109,6 +114,7 @@ class epochTable():
                 "digitalState": digitalState,  # list of 0/1 for 8x digital states
             }
             self._epochList.append(epochDict)
+        self._epochArrays = None
 
     def getEpochList(self, asDataFrame: bool = False):
         if asDataFrame:
@@ -116,6 +122,44 @@ class epochTable():
         else:
             return self._epochList
 
+    def _getEpochArrays(self):
+        """Get (startPoints, stopPoints, epochIndex) sorted by start point.
+
+        Epochs with no points (start == stop) are not included.
+        """
+        if self._epochArrays is None:
+            startPoints = np.array([epoch["startPoint"] for epoch in self._epochList], dtype=np.int64)
+            stopPoints = np.array([epoch["stopPoint"] for epoch in self._epochList], dtype=np.int64)
+            epochIndex = np.flatnonzero(stopPoints > startPoints)
+            epochIndex = epochIndex[np.argsort(startPoints[epochIndex], kind="stable")]
+            self._epochArrays = (startPoints[epochIndex], stopPoints[epochIndex], epochIndex)
+        return self._epochArrays
+
+    def findEpochs(self, pnts: np.ndarray) -> np.ndarray:
+        """Return epoch index for each point in recording.
+
+        Epochs do not overlap, a point is in an epoch if startPoint <= pnt < stopPoint.
+
+        Parameters
+        ----------
+        pnts : np.ndarray
+            Point indices into recording (within a sweep)
+
+        Returns
+        -------
+        np.ndarray
+            Epoch index of each point, -1 if point is not in an epoch
+        """
+        pnts = np.asarray(pnts)
+        startPoints, stopPoints, epochIndex = self._getEpochArrays()
+        if len(epochIndex) == 0:
+            return np.full(pnts.shape, -1, dtype=np.int64)
+        # last epoch that starts at or before each point
+        sortedIdx = np.searchsorted(startPoints, pnts, side="right") - 1
+        sortedIdx = np.maximum(sortedIdx, 0)
+        inEpoch = (pnts >= startPoints[sortedIdx]) & (pnts < stopPoints[sortedIdx])
+        return np.where(inEpoch, epochIndex[sortedIdx], -1)
+
     def findEpoch(self, pnt: int) -> Optional[int]:
         """Return epoch index for a point in recording.
 
@@ -129,11 +173,9 @@ class epochTable():
         pnt : int
             Point index into recording (within a sweep)
         """
-        for epochIdx, epoch in enumerate(self._epochList):
-            startPoint = epoch["startPoint"]
-            stopPoint = epoch["stopPoint"]
-            if pnt >= startPoint and pnt < stopPoint:
-                return epochIdx
+        epochIdx = int(self.findEpochs(pnt))
+        if epochIdx >= 0:
+            return epochIdx
         #
         # return None
 
@@ -141,6 +183,12 @@ class epochTable():
         """Given an epoch number return the 'level'"""
         return self._epochList[epoch]["level"]
 
+    def getLevels(self, epochs: np.ndarray) -> np.ndarray:
+        """Given epoch numbers (from findEpochs) return the 'level', nan for -1."""
+        epochs = np.asarray(epochs)
+        levels = np.array([epoch["level"] for epoch in self._epochList] + [np.nan], dtype=float)
+        return levels[np.where(epochs >= 0, epochs, len(self._epochList))]
+
     def getStartSec(self, epoch):
         """Given an epoch number return the 'startSec'"""
         return self._epochList[epoch]["startSec"]
@@ -3,7 +3,7 @@ import numpy as np
 import pyabf
 
 import sanpy
-from sanpy.fileloaders.fileLoader_base import fileLoader_base, recordingModes
+from sanpy.fileloaders.fileLoader_base import fileLoader_base, recordingModes, lazySweepArray
 
 from sanpy.sanpyLogger import get_logger
 
@@ -20,6 +20,93 @@ class fileLoader_abf(fileLoader_base):
     def loadFile(self):
         self._loadAbf()
 
+    def _setSweepHeader(self, sweepNumber: int, channel: int = 0):
+        """Set the sweep of an abf opened with loadData=False.
+
+        Sets what pyabf.ABF.setSweep() would set for epochs and stimulus
+        without loading the data.
+        """
+        self._abf.sweepNumber = sweepNumber
+        self._abf.sweepChannel = channel
+        if channel < len(self._abf.holdingCommand):
+            _epochTable = pyabf.waveform.EpochTable(self._abf, channel)
+            self._abf.sweepEpochs = _epochTable.epochWaveformsBySweep[sweepNumber]
+        else:
+            self._abf.sweepEpochs = None
+
+    def _getLazySweeps(self, channel: int = 0):
+        """Get lazySweepArray for sweepY and sweepC backed by a memory map of the abf data.
+
+        Each sweep is scaled like pyabf on access.
+        Returns None if the abf can not be memory mapped, e.g. variable length sweeps.
+        """
+        abf = self._abf
+        if hasattr(abf, "_synchArraySection") and abf.sweepCount > 1:
+            if len(set(abf._synchArraySection.lLength)) > 1:
+                return None
+
+        numPoints = abf.sweepPointCount
+        numSweeps = abf.sweepCount
+        _memmapArgs = dict(
+            filename=abf.abfFilePath,
+            dtype=abf._dtype,
+            mode="r",
+            offset=abf.dataByteStart,
+            shape=(abf.dataPointCount // abf.channelCount, abf.channelCount),
+        )
+        try:
+            self._memmap = {"data": np.memmap(**_memmapArgs)}
+        except (OSError, ValueError) as e:
+            logger.warning(f"    could not memory map abf file: {e}")
+            return None
+        # dict so sweep functions do not hold the memory map (or self), see close()
+        _memmap = self._memmap
+
+        def _getData():
+            if _memmap["data"] is None:
+                # opened again after close()
+                _memmap["data"] = np.memmap(**_memmapArgs)
+            return _memmap["data"]
+
+        _isInt = abf._dtype == np.int16
+        _gain = abf._dataGain[channel]
+        _offset = abf._dataOffset[channel]
+        _stimulus = abf.stimulusByChannel[channel]
+
+        def _sweepYBlock(sweep, start, stop):
+            sweepStart = sweep * numPoints
+            sweepY = _getData()[sweepStart + start : sweepStart + stop, channel].astype(np.float32)
+            if _isInt:
+                sweepY = np.add(np.multiply(sweepY, _gain), _offset)
+            return sweepY
+
+        def _sweepY(sweep):
+            return _sweepYBlock(sweep, 0, numPoints)
+
+        def _sweepC(sweep):
+            try:
+                sweepC = _stimulus.stimulusWaveform(sweep)[:numPoints]
+            except ValueError as e:
+                logger.warning(f"ba has no sweep {sweep} sweepC: {e}")
+                sweepC = np.zeros(numPoints)
+            return sweepC
+
+        sweepY = lazySweepArray(_sweepY, numPoints, numSweeps, getBlock=_sweepYBlock)
+        sweepC = lazySweepArray(_sweepC, numPoints, numSweeps)
+        return sweepY, sweepC
+
+    def close(self):
+        """Close the memory map of a lazy abf so the file is not open (or locked on Windows).
+
+        The memory map is opened again if a sweep is loaded after this.
+        """
+        _memmap = getattr(self, "_memmap", None)
+        if _memmap is None or _memmap["data"] is None:
+            return
+        # the np.memmap (and the file) is closed when the last reference is removed,
+        # sweeps are copies (astype) and do not reference it
+        _memmap["data"] = None
+
     def _loadAbf(
         self, byteStream=None, loadData: bool = True, stimulusFileFolder: str = None
     ):
@@ -34,7 +121,7 @@ class fileLoader_abf(fileLoader_base):
                 # logger.info(f'Loading file: {self.filepath}')
                 self._abf = pyabf.ABF(
                     self.filepath,
-                    loadData=loadData,
+                    loadData=loadData and not self._lazy,
                     stimulusFileFolder=stimulusFileFolder,
                 )
 
@@ -52,6 +139,15 @@ class fileLoader_abf(fileLoader_base):
             self._loadError = True
             self._abf = None
 
+        _lazySweeps = None
+        if not self._loadError and loadData and self._lazy and byteStream is None:
+            _lazySweeps = self._getLazySweeps()
+            if _lazySweeps is None:
+                logger.warning(f"    loading all sweeps, abf can not be lazy: {self.filepath}")
+                self._abf.setSweep(0)  # loads the data
+            else:
+                self._setSweepHeader(0)
+
         self._epochTableList = None
         if not self._loadError and loadData:            
             try:
@@ -64,11 +160,15 @@ class fileLoader_abf(fileLoader_base):
                 _numSweeps = len(self._abf.sweepList)
                 self._epochTableList = [None] * _numSweeps
                 for _sweepIdx in range(_numSweeps):
-                    self._abf.setSweep(_sweepIdx)
+                    if _lazySweeps is not None:
+                        self._setSweepHeader(_sweepIdx)
+                    else:
+                        self._abf.setSweep(_sweepIdx)
                     self._epochTableList[_sweepIdx] = sanpy.fileloaders.epochTable(
                         self._abf
                     )
-                self._abf.setSweep(0)
+                if _lazySweeps is None:
+                    self._abf.setSweep(0)
 
             self._sweepList = self._abf.sweepList
             self._sweepLengthSec = (
@@ -76,7 +176,11 @@ class fileLoader_abf(fileLoader_base):
             )  # assuming all sweeps have the same duration
 
             # on load, sweep is 0
-            if loadData:
+            if _lazySweeps is not None:
+                # sweepX is computed from dataPointsPerMs
+                self._sweepY, self._sweepC = _lazySweeps
+
+            elif loadData:
                 
                 # owl
                 #<bound method ABF.sweepD of ABF (v2.9) with 1 channel (pA), sampled at 10.0 kHz, containing 18 sweeps, having no tags, with a total length of 6.33 minutes, recorded with protocol "PPR_v-clamp_owl". path=/Users/cudmore/Dropbox/data/sanpy-users/porter/2022_08_15_0022.abf>
@@ -3,13 +3,17 @@ import glob
 import math
 import enum
 import inspect
-from typing import Union, Dict, List, Tuple, Optional
+import threading
+from collections import OrderedDict
+from typing import Union, Dict, List, Tuple, Optional, Callable
 from abc import ABC, abstractmethod
 
 import numpy as np
 import scipy.signal
 
 import sanpy.fileloaders
+import sanpy.perfUtils
+import sanpy._util
 
 import sanpy.metaData
 
@@ -17,7 +21,11 @@ from sanpy.sanpyLogger import get_logger
 logger = get_logger(__name__)
 
 
-def getFileLoaders(verbose: bool = False) -> dict:
+_fileLoaderCache = sanpy._util._folderCache()
+# dict of file loaders shared by all callers in this process, see getFileLoaders()
+
+
+def getFileLoaders(verbose: bool = False, refresh: bool = False) -> dict:
     """Load file loaders from both
 
         1) Module sanpy.fileloaders
@@ -25,13 +33,41 @@ def getFileLoaders(verbose: bool = False) -> dict:
 
     Each file loader is a class derived from [fileLoader_base](../../api/fileloader/fileLoader_base.md)
 
+    File loaders are only discovered (and user file loaders imported) once per process,
+    again when the user file loader folder or one of its files changes.
+
     See: sanpy.interface.bPlugins.loadPlugins()
 
+    Parameters
+    ----------
+    refresh : bool
+        If True then discover file loaders even if they did not change.
+
     Returns
     -------
     dict
         A dictionary of file loaders.
     """
+    fileLoaderFolder = sanpy._util._getUserFileLoaderFolder()
+    retDict = dict(
+        _fileLoaderCache.get(
+            fileLoaderFolder, lambda: _discoverFileLoaders(fileLoaderFolder), refresh=refresh
+        )
+    )
+
+    if verbose:
+        logger.info(f"Loaded {len(retDict.keys())} file loaders:")
+        for k, v in retDict.items():
+            # logger.info(f'    {k}:{v}')
+            logger.info(f"  {k}")
+            for k2, v2 in v.items():
+                logger.info(f"    {k2}: {v2}")
+
+    return retDict
+
+
+def _discoverFileLoaders(fileLoaderFolder: str) -> dict:
+    """Inspect sanpy.fileloaders and import user file loaders, see getFileLoaders()."""
     retDict = {}
 
     ignoreModuleList = ["fileLoader_base", "recordingModes", "epochTable", "hekaUtils"]
@@ -80,7 +116,6 @@ def getFileLoaders(verbose: bool = False) -> dict:
 
     #
     # user plugins from files in folder "<user>/SanPy/file loaders"
-    fileLoaderFolder = sanpy._util._getUserFileLoaderFolder()
     # loadedModuleList = []
     if os.path.isdir(fileLoaderFolder):
         files = glob.glob(os.path.join(fileLoaderFolder, "*.py"))
@@ -126,14 +161,6 @@ def getFileLoaders(verbose: bool = False) -> dict:
                 logger.warning(f"  this loader will overwrite the previous loader.")
             retDict[filetype] = oneLoaderDict
 
-    if verbose:
-        logger.info(f"Loaded {len(retDict.keys())} file loaders:")
-        for k, v in retDict.items():
-            # logger.info(f'    {k}:{v}')
-            logger.info(f"  {k}")
-            for k2, v2 in v.items():
-                logger.info(f"    {k2}: {v2}")
-
     # sort
     # retDict = dict(sorted(retDict.items()))
 
@@ -149,6 +176,79 @@ class recordingModes(enum.Enum):
     unknown = "unknown"
 
 
+class lazySweepArray:
+    """Read only 2D (points, sweeps) array that loads one sweep at a time.
+
+    Used by file loaders in lazy mode in place of a 2D np.ndarray for sweepY and sweepC.
+    Indexing one sweep like `[:, sweep]` only loads that sweep, the last sweep is cached.
+    Anything else, like np.asarray(), loads all sweeps.
+
+    Args:
+        getSweep: Function taking a sweep number and returning its 1D values.
+        numPoints: Number of points in each sweep.
+        numSweeps: Number of sweeps.
+        getBlock: Optional function taking (sweep, start, stop) and returning values
+            of points [start, stop) without loading the whole sweep, see getBlock().
+    """
+
+    ndim = 2
+    dtype = np.dtype(np.float64)
+
+    def __init__(
+        self,
+        getSweep: Callable[[int], np.ndarray],
+        numPoints: int,
+        numSweeps: int,
+        getBlock: Callable[[int, int, int], np.ndarray] = None,
+    ):
+        self._getSweep = getSweep
+        self._getBlock = getBlock
+        self.shape: Tuple[int, int] = (numPoints, numSweeps)
+        self._cachedSweep: int = None
+        self._cachedData: np.ndarray = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes in memory, only the cached sweep."""
+        return 0 if self._cachedData is None else self._cachedData.nbytes
+
+    def getSweep(self, sweepNumber: int) -> np.ndarray:
+        """Get the 1D values of one sweep."""
+        numSweeps = self.shape[1]
+        if sweepNumber < 0:
+            sweepNumber += numSweeps
+        if sweepNumber < 0 or sweepNumber >= numSweeps:
+            raise IndexError(f"sweep {sweepNumber} is out of range for {numSweeps} sweeps")
+        if sweepNumber != self._cachedSweep:
+            data = np.asarray(self._getSweep(sweepNumber), dtype=self.dtype)
+            data.flags.writeable = False
+            self._cachedData = data
+            self._cachedSweep = sweepNumber
+        return self._cachedData
+
+    def getBlock(self, sweepNumber: int, start: int, stop: int) -> np.ndarray:
+        """Get values of points [start, stop) of one sweep."""
+        if self._getBlock is None:
+            return self.getSweep(sweepNumber)[start:stop]
+        return np.asarray(self._getBlock(sweepNumber, start, stop), dtype=self.dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 2 and isinstance(key[1], (int, np.integer)):
+            return self.getSweep(int(key[1]))[key[0]]
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.empty(self.shape, dtype=self.dtype)
+        for sweep in range(self.shape[1]):
+            data[:, sweep] = self._getSweep(sweep)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+
 class fileLoader_base(ABC):
     """Abstract base class to derive file loaders.
 
@@ -173,6 +273,9 @@ class fileLoader_base(ABC):
     """
 
     loadFileType: str = ""
+
+    filterCacheSize: int = 2
+    """Number of filtered recordings to keep, see _getDerivative()."""
     # @property
     # @abstractmethod
     # def loadFileType(self) -> str:
@@ -186,7 +289,7 @@ class fileLoader_base(ABC):
         """Derived classes must load the data and call setLoadedData(sweepX, sweepY)."""
         pass
 
-    def __init__(self, filepath: str, loadData: bool = True):
+    def __init__(self, filepath: str, loadData: bool = True, lazy: bool = False):
         """Base class to derive new file loaders.
 
         Parameters
@@ -195,6 +298,9 @@ class fileLoader_base(ABC):
             File path to load. Will use different derived classes based on extension
         loadData : bool
             If True then load raw data, otherwise just load the header.
+        lazy : bool
+            If True then derived classes that support it load sweeps on demand,
+            see lazySweepArray. Others ignore it and load all sweeps.
         """
 
         super().__init__()
@@ -202,6 +308,7 @@ class fileLoader_base(ABC):
         logger.info(filepath)
 
         self._loadError = False
+        self._lazy = lazy
 
         self._path = filepath
 
@@ -209,6 +316,10 @@ class fileLoader_base(ABC):
 
         self._filteredY : np.ndarray = None  # set in _getDerivative
         self._filteredDeriv : np.ndarray = None
+        self._filterCache = OrderedDict()
+        self._filterCacheLock = threading.Lock()
+        # copies of the loader used in spike detection share the cache, see bAnalysis.getSpikeDetectResults()
+        # (medianFilter, SavitzkyGolay_pnts, SavitzkyGolay_poly, dataPointsPerMs) -> (_filteredY, _filteredDeriv)
         self._currentSweep: int = 0
 
         self._epochTableList: List[sanpy.fileloaders.epochTable] = None
@@ -325,6 +436,30 @@ class fileLoader_base(ABC):
     def acqTime(self):
         return self._acqTime
 
+    @property
+    def isLazy(self) -> bool:
+        """True if sweeps are loaded on demand, see lazySweepArray."""
+        return isinstance(self._sweepY, lazySweepArray)
+
+    def close(self):
+        """Close files the loader keeps open, e.g. the memory map of a lazy loader.
+
+        Derived classes that keep files open override this.
+        Lazy sweeps open the file again if they are used after close().
+        """
+        pass
+
+    @property
+    def memoryBytes(self) -> int:
+        """Bytes of the recording and its cached filtered recordings held in memory."""
+        arrays = [self._sweepX, self._sweepY, self._sweepC, self._filteredY, self._filteredDeriv]
+        with self._filterCacheLock:
+            for filtered in self._filterCache.values():
+                arrays.extend(filtered)
+        # the current filtered recording is also in the filter cache, count it once
+        uniqueArrays = {id(array): array for array in arrays if array is not None}
+        return sum(getattr(array, "nbytes", 0) for array in uniqueArrays.values())
+
     @property
     def sweepX(self):
         """Get the X-Values for a sweep.
@@ -332,8 +467,15 @@ class fileLoader_base(ABC):
         Notes
         -----
         All sweeps are assumed to have the same x-values (seconds).
+        If the loader did not set _sweepX, it is computed from dataPointsPerMs.
         """
         # return self._sweepX[:, self.currentSweep]
+        if self._sweepX is None:
+            if self._sweepY is None or not self._dataPointsPerMs:
+                return None
+            sweepX = np.arange(self._sweepY.shape[0], dtype=np.float64)
+            sweepX *= 1 / (self._dataPointsPerMs * 1000)
+            return sweepX
         return self._sweepX[:, 0]
 
     @property
@@ -346,7 +488,7 @@ class fileLoader_base(ABC):
         """Get the DAC command for the current sweep."""
         if self._sweepC is None:
             # return np.zeros_like(self._sweepX[:, self.currentSweep])
-            return np.zeros_like(self._sweepX[:, 0])
+            return np.zeros_like(self.sweepX)
         return self._sweepC[:, self.currentSweep]
 
     def get_xUnits(self):
@@ -386,6 +528,12 @@ class fileLoader_base(ABC):
         Creates:
             self._filteredVm
             self._filteredDeriv
+
+        When lazy, both are lazySweepArray and each sweep is filtered on demand.
+
+        The last filterCacheSize results are cached by filter parameters, changing
+        detection parameters like dvdtThreshold does not filter again.
+        Call clearFilterCache() if the raw data is modified in place.
         """
 
         # logger.info(f'{self.filename} medianFilter:{medianFilter} SavitzkyGolay_pnts:{SavitzkyGolay_pnts} SavitzkyGolay_poly:{SavitzkyGolay_poly}')
@@ -393,6 +541,112 @@ class fileLoader_base(ABC):
         if not isinstance(medianFilter, int):
             logger.error(f"expecting int medianFilter, got: {medianFilter}")
 
+        medianFilter = self._checkMedianFilter(medianFilter)
+        filterArgs = (medianFilter, SavitzkyGolay_pnts, SavitzkyGolay_poly)
+
+        cacheKey = filterArgs + (self.dataPointsPerMs,)
+        with self._filterCacheLock:
+            cached = self._filterCache.get(cacheKey)
+            if cached is not None:
+                self._filterCache.move_to_end(cacheKey)
+        if cached is not None:
+            self._filteredY, self._filteredDeriv = cached
+            return self._filteredDeriv
+
+        if self.isLazy:
+            numPoints, numSweeps = self._sweepY.shape
+
+            def _filteredSweep(sweep):
+                sweepY = self._sweepY[:, sweep][:, np.newaxis]
+                return self._filterSweeps(sweepY, *filterArgs)[:, 0]
+
+            # not self._filteredY, it changes when filter parameters change
+            lazyFilteredY = lazySweepArray(_filteredSweep, numPoints, numSweeps)
+
+            def _derivSweep(sweep):
+                filteredY = lazyFilteredY[:, sweep][:, np.newaxis]
+                return self._derivSweeps(filteredY, *filterArgs)[:, 0]
+
+            self._filteredY = lazyFilteredY
+            self._filteredDeriv = lazySweepArray(_derivSweep, numPoints, numSweeps)
+        else:
+            self._filteredY = self._filterSweeps(self._sweepY, *filterArgs)
+            self._filteredDeriv = self._derivSweeps(self._filteredY, *filterArgs)
+
+        with self._filterCacheLock:
+            self._filterCache[cacheKey] = (self._filteredY, self._filteredDeriv)
+            while len(self._filterCache) > self.filterCacheSize:
+                self._filterCache.popitem(last=False)
+
+        # logger.info(f'  sweepX:{self.sweepX.shape}')
+        # logger.info(f'  sweepY:{self.sweepY.shape}')
+        # logger.info(f'  _filteredY:{self._filteredY.shape}')
+        # logger.info(f'  2- _filteredDeriv:{self._filteredDeriv.shape}')
+
+        return self._filteredDeriv
+
+    def clearFilterCache(self):
+        """Forget cached filtered recordings, see _getDerivative()."""
+        with self._filterCacheLock:
+            self._filterCache.clear()
+
+    def _setFilteredRecording(self, filteredY, filteredDeriv):
+        """Set the filtered recording and derivative from a copy of this loader.
+
+        See bAnalysis.setSpikeDetectResults(), detection filters in its own copy.
+        """
+        self._filteredY = filteredY
+        self._filteredDeriv = filteredDeriv
+
+    def getDetectionBlock(
+        self,
+        sweepNumber: int,
+        start: int,
+        stop: int,
+        medianFilter: int = 0,
+        SavitzkyGolay_pnts: int = 5,
+        SavitzkyGolay_poly: int = 2,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get points [start, stop) of one sweep and its filtered versions.
+
+        Only reads and filters the block, plus a few points on either side so
+        the filtered values are the same as filtering the whole sweep (see _getDerivative).
+        Used to detect spikes in chunks of long recordings.
+
+        Returns:
+            sweepX, sweepY, filteredY, filteredDeriv
+        """
+        medianFilter = self._checkMedianFilter(medianFilter)
+        filterArgs = (medianFilter, SavitzkyGolay_pnts, SavitzkyGolay_poly)
+
+        numPoints = self._sweepY.shape[0]
+        filterPad = 2 * max(medianFilter, SavitzkyGolay_pnts) + 2
+        padStart = max(0, start - filterPad)
+        padStop = min(numPoints, stop + filterPad)
+        if self.isLazy:
+            sweepY = self._sweepY.getBlock(sweepNumber, padStart, padStop)
+        else:
+            sweepY = self._sweepY[padStart:padStop, sweepNumber]
+
+        filteredY = self._filterSweeps(sweepY[:, np.newaxis], *filterArgs)
+        filteredDeriv = self._derivSweeps(filteredY, *filterArgs)
+
+        if self._sweepX is None:
+            sweepX = np.arange(start, stop, dtype=np.float64)
+            sweepX *= 1 / (self._dataPointsPerMs * 1000)
+        else:
+            sweepX = self._sweepX[start:stop, 0]
+
+        blockSlice = slice(start - padStart, stop - padStart)
+        return (
+            sweepX,
+            sweepY[blockSlice],
+            filteredY[blockSlice, 0],
+            filteredDeriv[blockSlice, 0],
+        )
+
+    def _checkMedianFilter(self, medianFilter: int) -> int:
+        """Median filter must be odd."""
         if medianFilter > 0:
             if not medianFilter % 2:
                 medianFilter += 1
@@ -400,65 +654,63 @@ class fileLoader_base(ABC):
                     "Please use an odd value for the median filter, set medianFilter: {medianFilter}"
                 )
             medianFilter = int(medianFilter)
-            self._filteredY = scipy.signal.medfilt2d(self._sweepY, [medianFilter, 1])
+        return medianFilter
+
+    @sanpy.perfUtils.timed("filter")
+    def _filterSweeps(
+        self,
+        sweepY: np.ndarray,
+        medianFilter: int,
+        SavitzkyGolay_pnts: int,
+        SavitzkyGolay_poly: int,
+    ) -> np.ndarray:
+        """Filter 2D (points, sweeps) recording, each sweep is filtered independently."""
+        if medianFilter > 0:
+            return scipy.signal.medfilt2d(sweepY, [medianFilter, 1])
         elif SavitzkyGolay_pnts > 0:
-            self._filteredY = scipy.signal.savgol_filter(
-                self._sweepY,
+            return scipy.signal.savgol_filter(
+                sweepY,
                 SavitzkyGolay_pnts,
                 SavitzkyGolay_poly,
                 axis=0,
                 mode="nearest",
             )
         else:
-            self._filteredY = self.sweepY
+            return sweepY
 
-        self._filteredDeriv = np.diff(self._filteredY, axis=0)
+    @sanpy.perfUtils.timed("derivative")
+    def _derivSweeps(
+        self,
+        filteredY: np.ndarray,
+        medianFilter: int,
+        SavitzkyGolay_pnts: int,
+        SavitzkyGolay_poly: int,
+    ) -> np.ndarray:
+        """Filtered first derivative (mV/ms) of 2D (points, sweeps) filtered recording."""
+        filteredDeriv = np.diff(filteredY, axis=0)
 
         # filter the derivative
         if medianFilter > 0:
-            if not medianFilter % 2:
-                medianFilter += 1
-                print(
-                    f"Please use an odd value for the median filter, set medianFilter: {medianFilter}"
-                )
-            medianFilter = int(medianFilter)
-            self._filteredDeriv = scipy.signal.medfilt2d(
-                self._filteredDeriv, [medianFilter, 1]
+            filteredDeriv = scipy.signal.medfilt2d(
+                filteredDeriv, [medianFilter, 1]
             )
         elif SavitzkyGolay_pnts > 0:
-            self._filteredDeriv = scipy.signal.savgol_filter(
-                self._filteredDeriv,
+            filteredDeriv = scipy.signal.savgol_filter(
+                filteredDeriv,
                 SavitzkyGolay_pnts,
                 SavitzkyGolay_poly,
                 axis=0,
                 mode="nearest",
             )
-        else:
-            # self._filteredDeriv = self.filteredDeriv
-            pass
 
         # mV/ms
         dataPointsPerMs = self.dataPointsPerMs
-        self._filteredDeriv = self._filteredDeriv * dataPointsPerMs  # / 1000
+        filteredDeriv = filteredDeriv * dataPointsPerMs  # / 1000
 
         # insert an initial point (rw) so it is the same length as raw data in abf.sweepY
         # three options (concatenate, insert, vstack), could only get vstack working
-        rowOfZeros = np.zeros(self.numSweeps)
-
-        # logger.info(f' dataPointsPerMs:{dataPointsPerMs}')
-        # logger.info(f' self.numSweeps:{self.numSweeps}')
-        # logger.info(f' rowOfZeros:{rowOfZeros.shape}')
-        # logger.info(f' 1 - _filteredDeriv:{self._filteredDeriv.shape}')
-
-        # rowZero = 0
-        self._filteredDeriv = np.vstack([rowOfZeros, self._filteredDeriv])
-
-        # logger.info(f'  sweepX:{self.sweepX.shape}')
-        # logger.info(f'  sweepY:{self.sweepY.shape}')
-        # logger.info(f'  _filteredY:{self._filteredY.shape}')
-        # logger.info(f'  2- _filteredDeriv:{self._filteredDeriv.shape}')
-
-        return self._filteredDeriv
+        rowOfZeros = np.zeros(filteredDeriv.shape[1])
+        return np.vstack([rowOfZeros, filteredDeriv])
     
     @property
     def sweepY_filtered(self) -> np.ndarray:
@@ -586,6 +838,8 @@ class fileLoader_base(ABC):
         self._sweepY = sweepY
         self._sweepC = sweepC
 
+        self.clearFilterCache()
+
         self._userList = userList
 
         self._numSweeps: int = self._sweepY.shape[1]
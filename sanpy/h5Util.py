@@ -1,18 +1,27 @@
 import os
-import sys
 import time
 import pathlib
 import shutil
 
+from typing import List
+
+import numpy as np
 import pandas as pd
 
-# april 5, removed (why did I remove???)
-import tables.scripts.ptrepack  # to save compressed .h5 file
+import h5py
+import tables
 
 from sanpy.sanpyLogger import get_logger
 
 logger = get_logger(__name__)
 
+_repackFragmentation = 0.5
+# repack h5 file when more than this fraction of the file is not used by data
+
+_repackMinBytes = 2**20
+# do not repack if less than this number of bytes are not used by data
+
+
 def listKeys(hdfPath, printData=False):
     """List all keys in h5 file."""
     with pd.HDFStore(hdfPath, mode="r") as store:
@@ -59,47 +68,112 @@ def _getTmpHdfFile(hdfPath):
     return tmpHdfPath
 
 
-def _repackHdf(hdfPath):
-    _folder, _file = os.path.split(hdfPath)
+def getFileBytes(hdfPath) -> int:
+    """Get size of h5 file in bytes, 0 if it does not exist."""
+    if not os.path.isfile(hdfPath):
+        return 0
+    return os.path.getsize(hdfPath)
 
-    # rebuild the file to remove old changes and reduce size
-    # tmpHdfFile = os.path.splitext(_file)[0] + '_tmp.h5'
-    # tmpHdfPath = pathlib.Path(_folder) / tmpHdfFile
 
-    # always write to a tmp and then repack into hdfPath
-    tmpHdfPath = _getTmpHdfFile(hdfPath)
+def _liveBytes(h5Group) -> int:
+    """Get number of bytes used by all objects in an h5py group.
 
-    hdfFile = os.path.splitext(_file)[0] + ".h5"
-    hdfPath = pathlib.Path(_folder) / hdfFile
-    logger.info(f"Rebuilding h5 to {hdfPath}")
+    Sums the storage of each dataset, the variable length data it points to
+    (pytables pickles object columns into these) and each object header.
+    """
+    liveBytes = [h5py.h5o.get_info(h5Group.id).hdr.space.total]
 
-    # can't pass sys.argv a 'PosixPath' from pathlib.Path, needs to be a string
-    tmpHdfPath = str(tmpHdfPath)
-    hdfPath = str(hdfPath)
+    def _objectBytes(name, obj):
+        liveBytes[0] += h5py.h5o.get_info(obj.id).hdr.space.total
+        if isinstance(obj, h5py.Dataset):
+            liveBytes[0] += obj.id.get_storage_size()
+            if h5py.check_vlen_dtype(obj.dtype) is not None:
+                # vlen data is in the global heap, only read it to get its size
+                liveBytes[0] += sum(np.asarray(oneRow).nbytes for oneRow in obj[()].ravel())
 
-    # when calling ptrepack, we need trailing ':' on each src/dst path
-    # without this Windows fails to find the file
-    _tmpHdfPath = tmpHdfPath + ":"
-    _hdfPath = hdfPath + ":"
+    h5Group.visititems(_objectBytes)
+    return liveBytes[0]
 
-    # The first item is normally the command line command name (not used)
-    sys.argv = ["", "--overwrite", "--chunkshape=auto", _tmpHdfPath, _hdfPath]
 
-    logger.info("    running tables.scripts.ptrepack.main()")
-    logger.info(f"    sys.argv: {sys.argv}")
-    try:
-        tables.scripts.ptrepack.main()
+def getKeyBytes(hdfPath, keys: List[str] = None) -> dict:
+    """Get number of bytes used by top level keys in h5 file.
+
+    For a bAnalysis, the top level key is its uuid.
+
+    Args:
+        hdfPath: Path to h5 file
+        keys: Keys to measure, if None then all keys. Keys not in the file are ignored.
+    """
+    keyBytes = {}
+    if not os.path.isfile(hdfPath):
+        return keyBytes
+    with h5py.File(hdfPath, "r") as h5File:
+        if keys is None:
+            keys = list(h5File.keys())
+        for key in keys:
+            key = key.strip("/")
+            if key not in h5File:
+                continue
+            keyBytes[key] = _liveBytes(h5File[key])
+    return keyBytes
+
+
+def getUnusedBytes(hdfPath) -> int:
+    """Get number of bytes in h5 file not used by any key.
+
+    Removing or overwriting a key in an h5 file does not free its space,
+    the file only shrinks when it is repacked. HDF5 reuses some of that space
+    while the file is open, so this is measured as the file size minus the bytes still in use.
+    """
+    if not os.path.isfile(hdfPath):
+        return 0
+    with h5py.File(hdfPath, "r") as h5File:
+        liveBytes = _liveBytes(h5File)
+    return max(0, os.path.getsize(hdfPath) - liveBytes)
+
 
-        # delete the temporary (large file)
-        logger.info(f"    Deleting tmp file: {tmpHdfPath}")
-        os.remove(tmpHdfPath)
+def getFragmentation(hdfPath, unusedBytes: int = None) -> float:
+    """Get fraction of h5 file size that is not used."""
+    fileBytes = os.path.getsize(hdfPath)
+    if fileBytes == 0:
+        return 0.0
+    if unusedBytes is None:
+        unusedBytes = getUnusedBytes(hdfPath)
+    return min(1.0, unusedBytes / fileBytes)
 
-        # self.signalApp(f'Saved compressed folder analysis with tables.scripts.ptrepack.main()')
 
-    except FileNotFoundError as e:
-        logger.error("tables.scripts.ptrepack.main() failed ... file was not saved")
+def repackIfFragmented(hdfPath, threshold: float = _repackFragmentation) -> bool:
+    """Repack h5 file if the fraction of unused space is above threshold.
+
+    Returns True if file was repacked.
+    """
+    unusedBytes = getUnusedBytes(hdfPath)
+    fragmentation = getFragmentation(hdfPath, unusedBytes)
+    if fragmentation < threshold or unusedBytes < _repackMinBytes:
+        return False
+    logger.info(f"Repacking h5 with fragmentation {round(fragmentation,2)} and {unusedBytes} unused bytes")
+    return _repackHdf(hdfPath)
+
+
+def _repackHdf(hdfPath) -> bool:
+    """Rebuild the h5 file to remove old changes and reduce size.
+
+    Copies all keys into a tmp file and then replaces hdfPath with it.
+    """
+    hdfPath = str(hdfPath)
+    tmpHdfPath = os.path.splitext(hdfPath)[0] + "_tmp.h5"
+
+    logger.info(f"Rebuilding h5 {hdfPath}")
+    try:
+        tables.copy_file(hdfPath, tmpHdfPath, overwrite=True)
+        os.replace(tmpHdfPath, hdfPath)
+    except (OSError, tables.HDF5ExtError) as e:
+        logger.error("Rebuilding h5 failed ... file was not repacked")
         logger.error(e)
-        # self.signalApp(f'ERROR in tables.scripts.ptrepack.main(): {e}')
+        if os.path.isfile(tmpHdfPath):
+            os.remove(tmpHdfPath)
+        return False
+    return True
 
 
 def _loadAnalysis(hdfPath):
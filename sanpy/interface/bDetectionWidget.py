@@ -16,6 +16,8 @@ from pyqtgraph.exporters import ImageExporter
 import sanpy
 import sanpy.bDetection
 import sanpy.interface
+import sanpy.interface.detectionWorker
+from sanpy.interface.minMaxPyramid import minMaxPyramid
 
 from sanpy.sanpyLogger import get_logger
 logger = get_logger(__name__)
@@ -57,6 +59,12 @@ class bDetectionWidget(QtWidgets.QWidget):
         # self.vmLinesFiltered = None
         # self.vmLinesFiltered2 = None
         self.linearRegionItem2 = None  # rectangle over global Vm
+
+        self._tracePyramids = {}
+        # min/max pyramid of each trace in the current sweep, see _replotTraces()
+
+        self._detectionWorker: "sanpy.interface.detectionWorker.detectionWorker" = None
+        # running background spike detection, see detect()
         # self.clipLines = None
         # self.meanClipLine = None
 
@@ -395,16 +403,23 @@ class bDetectionWidget(QtWidgets.QWidget):
         mvThreshold: float,
         startSec: float = None,
         stopSec: float = None,
+        inBackground: bool = True,
     ):
         """Detect spikes.
 
         Args:
             detectionPreset (str) corresponds to Enum sanpy.bDetection.detectionPresets_
             detectionType (sanpy.bDetection.detectionTypes): The type of detection (dvdt, vm)
+            inBackground (bool): Detect in a detectionWorker thread, plots and plugins
+                are updated when it finishes, see _slot_detectResults()
         """
 
         _startSec = time.time()
 
+        if self.isDetecting():
+            self.updateStatusBar("Already detecting spikes, please wait or cancel.")
+            return
+
         if self.ba is None:
             str = "Please select a file to analyze."
             self.updateStatusBar(str)
@@ -455,8 +470,87 @@ class bDetectionWidget(QtWidgets.QWidget):
 
         #
         # detect
-        self.ba.spikeDetect(detectionDict)
+        self.detectDict(detectionDict, inBackground=inBackground, requestTime=_startSec)
+
+    def detectDict(
+        self,
+        detectionDict: dict,
+        ba: "sanpy.bAnalysis" = None,
+        inBackground: bool = True,
+        requestTime: float = None,
+    ):
+        """Detect spikes with a full detection dict, e.g. from the detectionParams plugin.
+
+        Uses the same detectionWorker as detect(), only one detection runs at a time.
+
+        Args:
+            detectionDict (dict): Detection parameters, see sanpy.bDetection.getDetectionDict()
+            ba (sanpy.bAnalysis): Analysis to detect, if None then the current analysis
+            inBackground (bool): Detect in a detectionWorker thread, see detect()
+            requestTime (float): time.time() when detection was requested, to report elapsed time
+        """
+        if requestTime is None:
+            requestTime = time.time()
+
+        if self.isDetecting():
+            self.updateStatusBar("Already detecting spikes, please wait or cancel.")
+            return
+
+        if ba is None:
+            ba = self.ba
+        if ba is None or ba.loadError:
+            self.updateStatusBar("Did not spike detect, the file was not loaded or may be corrupt?")
+            return
+
+        if not inBackground:
+            ba.spikeDetect(detectionDict)
+            self._detectDone(ba, requestTime)
+            return
+
+        self._detectionWorker = sanpy.interface.detectionWorker.detectionWorker(
+            ba, detectionDict, parent=self
+        )
+        self._detectionWorker.signalProgress.connect(self._slot_detectProgress)
+        self._detectionWorker.signalDetectResults.connect(
+            partial(self._slot_detectResults, requestTime)
+        )
+        self.detectToolbarWidget.setDetecting(True)
+        self._detectionWorker.start()
+
+    def isDetecting(self) -> bool:
+        """True if spike detection is running in the background."""
+        return self._detectionWorker is not None and self._detectionWorker.isRunning()
+
+    def cancelDetect(self, wait: bool = False):
+        """Cancel background spike detection, the analysis is not changed.
+
+        Args:
+            wait (bool): Block until the detection thread has stopped, e.g. before closing
+        """
+        if self._detectionWorker is None:
+            return
+        self._detectionWorker.cancel()
+        if wait:
+            self._detectionWorker.wait()
 
+    def _slot_detectProgress(self, numDetected: int, numSweeps: int):
+        self.detectToolbarWidget.setDetectProgress(numDetected, numSweeps)
+        self.updateStatusBar(f"Detected sweep {numDetected} of {numSweeps}")
+
+    def _slot_detectResults(self, startSec: float, ba: "sanpy.bAnalysis", detectResults: dict):
+        """Background detection finished, swap in the results and update plots and plugins."""
+        self._detectionWorker = None
+        self.detectToolbarWidget.setDetecting(False)
+
+        if detectResults is None:
+            self.updateStatusBar("Spike detection was cancelled, analysis is unchanged.")
+            return
+
+        ba.setSpikeDetectResults(detectResults)
+        self._detectDone(ba, startSec)
+
+    def _detectDone(self, ba: "sanpy.bAnalysis", startSec: float):
+        """Update plots and plugins after spike detection of ba."""
         # show dialog when num spikes is 0
         """
         if self.ba.numSpikes == 0:
@@ -469,21 +563,23 @@ class bDetectionWidget(QtWidgets.QWidget):
         # this is done in analysisDir.xxx()
         # setCellValue(self, rowIdx, colStr, value)
 
-        self.replotOverlays()  # replot statistics over traces
+        # the user may have switched files while detecting
+        if ba is self.ba:
+            self.replotOverlays()  # replot statistics over traces
 
         # 20210821
         # refresh spike clips
         # self.refreshClips(None, None)
 
-        self.signalDetect.emit(self.ba)
+        self.signalDetect.emit(ba)
         # if self.myMainWindow is not None:
         #    # signal to main window so it can update (file list, scatter plot)
         #    self.myMainWindow.mySignal('detect') #, data=(dfReportForScatter, dfError))
 
         # report the number of spikes and the time it took
         _stopSec = time.time()
-        numSpikes = self.ba.numSpikes
-        _elapsedSec = round(_stopSec - _startSec, 2)
+        numSpikes = ba.numSpikes
+        _elapsedSec = round(_stopSec - startSec, 2)
         updateStr = f"Detected {numSpikes} in {_elapsedSec} seconds"
         self.updateStatusBar(updateStr)
 
@@ -682,6 +778,7 @@ class bDetectionWidget(QtWidgets.QWidget):
         # self.vmPlot.enableAutoRange()
         
         logger.info('!!!!! setting vmPlot_ auto range !!!!!')
+        self._replotTraces()  # auto range to all the data, not just the visible x range
         self.vmPlot.autoRange(items=[self.vmPlot_])  # 20221003
 
         # these are linked to vmPlot
@@ -2313,8 +2410,8 @@ class bDetectionWidget(QtWidgets.QWidget):
         self.selectSpikeList(self._selectedSpikeList)
 
     def _slot_y_range_changed(self, viewBox):
-        logger.info('')
-        print('   viewBox.viewRange():', viewBox.viewRange())
+        # called on every pan/zoom, do not log
+        pass
 
     def _slot_x_range_changed(self, viewBox):
         """Respond to changes in x-axis
@@ -2329,17 +2426,13 @@ class bDetectionWidget(QtWidgets.QWidget):
             The current x-axis range
         Notes
         -----
-        Trying to connect but not working yet
-
-        self.vmPlot.sigXRangeChanged.connect(self._slot_x_range_changed)
-
+        Connected once in _replot(). Replots traces at the pyramid level for the x range.
+        Called on every pan/zoom, do not log.
         """
-        logger.info('')
-        print('   viewBox.viewRange():', viewBox.viewRange())
-        
         viewRange = viewBox.viewRange()
         xMin = viewRange[0][0]
         xMax = viewRange[0][1]
+        self._replotTraces(xMin, xMax)
         self.setAxis(xMin, xMax)
 
         # 20240120 removed enableAutoRange x 3
@@ -2365,6 +2458,29 @@ class bDetectionWidget(QtWidgets.QWidget):
         # stop = range_[1]
         # self.linearRegionItem2.setRegion([start, stop])
 
+    def _replotTraces(self, xMin : Optional[float] = None, xMax : Optional[float] = None):
+        """Plot (vm, dvdt, dac) traces at the pyramid level with about 2 points per pixel.
+
+        Only points in [xMin, xMax] are plotted. When the x-axis is auto range
+        (or xMin/xMax is None) all points are plotted.
+
+        Parameters
+        ----------
+        xMin, xMax : float or None
+            Visible x range (s)
+        """
+        if not self._tracePyramids:
+            return
+        if self.vmPlot.getViewBox().autoRangeEnabled()[0]:
+            # auto range needs all the data
+            xMin = xMax = None
+        numPixels = self.vmPlot.width()
+        for plotName, plotDataItem in [("vm", self.vmPlot_),
+                                       ("dvdt", self.derivPlot_),
+                                       ("dac", self.dacPlot_)]:
+            x, y = self._tracePyramids[plotName].getData(xMin, xMax, numPixels=numPixels)
+            plotDataItem.setData(x, y, connect="finite")
+
     def _replot(self, startSec : Optional[float] = None,
                 stopSec : Optional[float] = None,
                 userUpdate : bool = False):
@@ -2417,7 +2533,16 @@ class bDetectionWidget(QtWidgets.QWidget):
         if sweepX.shape != filteredDeriv.shape:
             logger.error("filteredDeriv shapes do not match")
 
-        self.derivPlot_.setData(sweepX, filteredDeriv, connect="finite")
+        # traces are plotted from a min/max pyramid, built once per sweep
+        # the level depends on the visible x range, see _replotTraces()
+        self._tracePyramids = {
+            "vm": minMaxPyramid(sweepX, sweepY),
+            "dvdt": minMaxPyramid(sweepX, filteredDeriv),
+            "dac": minMaxPyramid(sweepX, sweepC),
+        }
+        self._replotTraces(startSec, stopSec)
+
+        # self.derivPlot_.setData(sweepX, filteredDeriv, connect="finite")
         # self.dvdtLinesFiltered = MultiLine(
         #     sweepX,
         #     filteredDeriv,
@@ -2429,7 +2554,7 @@ class bDetectionWidget(QtWidgets.QWidget):
         # # self.derivPlot.addItem(self.dvdtLines)
         # self.derivPlot.addItem(self.dvdtLinesFiltered)
 
-        self.dacPlot_.setData(sweepX, sweepC, connect="finite")
+        # self.dacPlot_.setData(sweepX, sweepC, connect="finite")
         # self.dacLines = MultiLine(
         #     sweepX, sweepC, self, forcePenColor=None, type="dac", columnOrder=True
         # )
@@ -2445,7 +2570,7 @@ class bDetectionWidget(QtWidgets.QWidget):
         #     columnOrder=True,
         # )
         # self.vmPlot.addItem(self.vmLinesFiltered)
-        self.vmPlot_.setData(sweepX, sweepY, connect="finite")
+        # self.vmPlot_.setData(sweepX, sweepY, connect="finite")
 
         # self.vmPlot.autoRange()
         # self.vmPlot.enableAutoRange(axis='y')
@@ -2457,8 +2582,9 @@ class bDetectionWidget(QtWidgets.QWidget):
         # april 30, 2023
         # was this jun 4
         # 20240118
-        self.vmPlot.sigXRangeChanged.connect(self._slot_x_range_changed)
-        self.vmPlot.sigYRangeChanged.connect(self._slot_y_range_changed)
+        # connected once, below, when we create linearRegionItem2
+        # self.vmPlot.sigXRangeChanged.connect(self._slot_x_range_changed)
+        # self.vmPlot.sigYRangeChanged.connect(self._slot_y_range_changed)
 
         # pg.setConfigOption('leftButtonPan', False)
 
@@ -2467,7 +2593,9 @@ class bDetectionWidget(QtWidgets.QWidget):
         #     sweepX, sweepY, self, forcePenColor="b", type="vmFiltered", columnOrder=True
         # )
         # self.vmPlotGlobal.addItem(self.vmLinesFiltered2)
-        self.vmPlotGlobal_.setData(sweepX, sweepY, connect="finite", pen='b')
+        # the global vm is never zoomed, always plot a coarse level
+        xGlobal, yGlobal = self._tracePyramids["vm"].getData(numPixels=self.vmPlotGlobal.width())
+        self.vmPlotGlobal_.setData(xGlobal, yGlobal, connect="finite", pen='b')
         if self.linearRegionItem2 is None:
             self.linearRegionItem2 = pg.LinearRegionItem(
                     values=(0, self.ba.fileLoader.recordingDur),
@@ -2477,6 +2605,9 @@ class bDetectionWidget(QtWidgets.QWidget):
                     )
             self.linearRegionItem2.setMovable(False)
             self.vmPlotGlobal.addItem(self.linearRegionItem2, ignorBounds=True)
+
+            self.vmPlot.sigXRangeChanged.connect(self._slot_x_range_changed)
+            self.vmPlot.sigYRangeChanged.connect(self._slot_y_range_changed)
         else:
             self.linearRegionItem2.setBounds((0, self.ba.fileLoader.recordingDur))
 
@@ -3024,6 +3155,18 @@ class myDetectToolbarWidget2(QtWidgets.QWidget):
             logger.info(f"start:{start}, stop:{stop}")
             self.detectionWidget.setAxis(start, stop)
 
+    def setDetecting(self, isDetecting: bool):
+        """Enable cancel while detecting in the background, otherwise the detect buttons."""
+        for button in self._detectButtons:
+            button.setEnabled(not isDetecting)
+        self._cancelDetectButton.setEnabled(isDetecting)
+        self._detectProgressBar.setEnabled(isDetecting)
+        self._detectProgressBar.reset()
+
+    def setDetectProgress(self, numDetected: int, numSweeps: int):
+        self._detectProgressBar.setMaximum(numSweeps)
+        self._detectProgressBar.setValue(numDetected)
+
     def on_plot_every(self):
         logger.info("TODO: update plots with plot every.")
 
@@ -3091,6 +3234,9 @@ class myDetectToolbarWidget2(QtWidgets.QWidget):
                 stopSec,
             )
 
+        elif name == "Cancel":
+            self.detectionWidget.cancelDetect()
+
         elif name == "[]":
             # Reset Axes
             self.detectionWidget.setAxisFull()
@@ -3257,6 +3403,7 @@ class myDetectToolbarWidget2(QtWidgets.QWidget):
         button = QtWidgets.QPushButton(buttonName)
         button.setToolTip("Detect spikes using dV/dt threshold.")
         button.clicked.connect(partial(self._on_button_click, buttonName))
+        self._detectButtons = [button]
 
         # row = 0
         rowSpan = 1
@@ -3280,6 +3427,7 @@ class myDetectToolbarWidget2(QtWidgets.QWidget):
         button = QtWidgets.QPushButton(buttonName)
         button.setToolTip("Detect spikes using mV threshold.")
         button.clicked.connect(partial(self._on_button_click, buttonName))
+        self._detectButtons.append(button)
         detectionGridLayout.addWidget(button, row, 0, rowSpan, columnSpan)
 
         # Vm Threshold (mV)
@@ -3294,6 +3442,20 @@ class myDetectToolbarWidget2(QtWidgets.QWidget):
         self.mvThreshold.setValue(detectMv)
         detectionGridLayout.addWidget(self.mvThreshold, row, 2, rowSpan, columnSpan)
 
+        # progress and cancel of background detection, see setDetecting()
+        row += 1
+        self._detectProgressBar = QtWidgets.QProgressBar()
+        self._detectProgressBar.setToolTip("Sweeps detected.")
+        self._detectProgressBar.setEnabled(False)
+        detectionGridLayout.addWidget(self._detectProgressBar, row, 0, rowSpan, columnSpan)
+
+        buttonName = "Cancel"
+        self._cancelDetectButton = QtWidgets.QPushButton(buttonName)
+        self._cancelDetectButton.setToolTip("Cancel spike detection, analysis is not changed.")
+        self._cancelDetectButton.setEnabled(False)
+        self._cancelDetectButton.clicked.connect(partial(self._on_button_click, buttonName))
+        detectionGridLayout.addWidget(self._cancelDetectButton, row, 2, rowSpan, columnSpan)
+
         # removed 20230419
         # decided to not show start/stop seconds ???
         #
@@ -182,6 +182,24 @@ class myTableView(QtWidgets.QTableView):
             logger.warning(f'action not taken "{action}"')
 
 
+# bits of pandasModel._rowStatus
+_statusLoaded = 1
+_statusAnalyzed = 2
+_statusDirty = 4  # analyzed but not saved
+_statusSaved = 8
+
+
+def _displayValue(value):
+    """Get a table value as shown in the table, nan is ''."""
+    if isinstance(value, np.integer):
+        return int(value)
+    elif isinstance(value, float):  # includes np.float64
+        return "" if math.isnan(value) else float(value)
+    elif isinstance(value, str) and value == "nan":
+        return ""
+    return value
+
+
 class pandasModel(QtCore.QAbstractTableModel):
     signalMyDataChanged = QtCore.pyqtSignal(object, object, object)
     """Emit on user editing a cell."""
@@ -207,6 +225,33 @@ class pandasModel(QtCore.QAbstractTableModel):
             logger.error("Expecting data in (DataFrame, sanpy.analysisDir)")
         self._data = data
 
+        # data() is called for every visible cell and role,
+        # it only reads from a snapshot of the table, see _checkSnapshot()
+        self._displayColumns: list = None
+        # one list per column of values as shown, in row order, None when out of date
+        self._checkStates: list = None
+        # Qt.Checked/Unchecked of column 'I' in row order
+        self._rowStatus: np.ndarray = None
+        # bits of (_statusLoaded, _statusAnalyzed, _statusDirty, _statusSaved) for each row
+        self._snapshotGeneration = None
+        # analysisDir.tableGeneration of the snapshot
+
+        _statusFont = QtCore.QVariant(QtGui.QFont("Arial", pointSize=32))
+        self._fontRoles = {
+            "L": [(_statusLoaded, _statusFont)],
+            "A": [(_statusAnalyzed, _statusFont)],
+            "S": [(_statusSaved, _statusFont)],
+        }
+        # column: list of (status bit, font), first matching bit is used
+        self._foregroundRoles = {
+            "L": [(_statusLoaded, QtCore.QVariant(QtGui.QColor("#4444EE")))],
+            "A": [
+                (_statusDirty, QtCore.QVariant(QtGui.QColor("#994444"))),  # red
+                (_statusAnalyzed, QtCore.QVariant(QtGui.QColor("#449944"))),  # green
+            ],
+            "S": [(_statusSaved, QtCore.QVariant(QtGui.QColor("#999944")))],  # mustard yellow
+        }
+
         # self.setSortingEnabled(True)
 
     """
@@ -239,73 +284,29 @@ class pandasModel(QtCore.QAbstractTableModel):
                 return toolTip
                 """
             elif role in [QtCore.Qt.DisplayRole, QtCore.Qt.EditRole]:
-                columnName = self._data.columns[index.column()]
-                if self.isAnalysisDir and columnName == "I":
-                    return ""
-
-                # don't get col from index, get from name
-                # retVal = self._data.iloc[index.row(), index.column()]
-                # retVal = self._data.loc[index.row(), columnName]
-                realRow = self._data.index[index.row()]
-                # retVal = self._data.iloc[realRow, index.column()]
-                retVal = self._data.loc[realRow, columnName]
-                if isinstance(retVal, np.float64):
-                    retVal = float(retVal)
-                elif isinstance(retVal, np.int64):
-                    retVal = int(retVal)
-                elif isinstance(retVal, str) and retVal == "nan":
-                    retVal = ""
-
-                if isinstance(retVal, float) and math.isnan(retVal):
-                    # don't show 'nan' in table
-                    retVal = ""
-                return retVal
+                self._checkSnapshot()
+                return self._displayColumns[index.column()][index.row()]
 
             elif role == QtCore.Qt.CheckStateRole:
-                columnName = self._data.columns[index.column()]
-                realRow = self._data.index[index.row()]
-                # retVal = self._data.iloc[index.row(), index.column()]
-                retVal = self._data.loc[realRow, columnName]
-                if columnName == "I":
-                    if retVal:
-                        return QtCore.Qt.Checked
-                    else:
-                        return QtCore.Qt.Unchecked
+                self._checkSnapshot()
+                if self._checkStates is not None and self._data.columns[index.column()] == "I":
+                    return self._checkStates[index.row()]
                 return QtCore.QVariant()
 
-            elif role == QtCore.Qt.FontRole:
-                realRow = self._data.index[index.row()]
+            elif role in [QtCore.Qt.FontRole, QtCore.Qt.ForegroundRole]:
+                if role == QtCore.Qt.FontRole:
+                    statusRoles = self._fontRoles
+                elif self.isAnalysisDir:
+                    statusRoles = self._foregroundRoles
+                else:
+                    return QtCore.QVariant()
                 columnName = self._data.columns[index.column()]
-                if columnName == "L":
-                    if self._data.isLoaded(realRow):  # or self._data.isSaved(realRow):
-                        return QtCore.QVariant(QtGui.QFont("Arial", pointSize=32))
-                elif columnName == "A":
-                    if self._data.isAnalyzed(
-                        realRow
-                    ):  # or self._data.isSaved(realRow):
-                        return QtCore.QVariant(QtGui.QFont("Arial", pointSize=32))
-                elif columnName == "S":
-                    if self._data.isSaved(realRow):
-                        return QtCore.QVariant(QtGui.QFont("Arial", pointSize=32))
-                return QtCore.QVariant()
-            elif role == QtCore.Qt.ForegroundRole:
-                if self.isAnalysisDir:
-                    realRow = self._data.index[index.row()]
-                    columnName = self._data.columns[index.column()]
-                    if columnName == "L":
-                        if self._data.isLoaded(realRow):
-                            return QtCore.QVariant(QtGui.QColor("#4444EE"))
-                    elif columnName == "A":
-                        if self._data.analysisIsDirty(realRow):
-                            # has been analyzed but not saved
-                            return QtCore.QVariant(QtGui.QColor("#994444"))  # red
-                        elif self._data.isAnalyzed(realRow):
-                            return QtCore.QVariant(QtGui.QColor("#449944"))  # green
-                    elif columnName == "S":
-                        if self._data.isSaved(realRow):
-                            return QtCore.QVariant(
-                                QtGui.QColor("#999944")
-                            )  # mustard yellow
+                if columnName in statusRoles:
+                    self._checkSnapshot()
+                    rowStatus = self._rowStatus[index.row()]
+                    for statusBit, value in statusRoles[columnName]:
+                        if rowStatus & statusBit:
+                            return value
                 return QtCore.QVariant()
             elif role == QtCore.Qt.BackgroundRole:
                 # set colors of alternating background
@@ -321,6 +322,94 @@ class pandasModel(QtCore.QAbstractTableModel):
     # def update(self, dataIn):
     #     print('  pandasModel.update() dataIn:', dataIn)
 
+    def _clearSnapshot(self):
+        """Rebuild the snapshot data() reads from on next use."""
+        self._displayColumns = None
+
+    def _checkSnapshot(self):
+        """Build the snapshot if rows were added, removed or sorted since it was built.
+
+        Rows refreshed one at a time by analysisDir._updateLoadedAnalyzed(rowIdx)
+        are updated in the current snapshot.
+        """
+        if self._displayColumns is not None:
+            if not self.isAnalysisDir:
+                return
+            if self._snapshotGeneration == self._data.tableGeneration:
+                changedRows = self._data.takeChangedRows()
+                if changedRows:
+                    index = self._data.index
+                    for realRow in changedRows:
+                        self._updateSnapshotRow(index.get_loc(realRow))
+                return
+
+        if self.isAnalysisDir:
+            df = self._data.getDataFrame()
+            self._snapshotGeneration = self._data.tableGeneration
+            # the snapshot has all rows as they are now
+            self._data.takeChangedRows()
+        else:
+            df = self._data
+        numRows = len(df)
+
+        displayColumns = []
+        for columnName in self._data.columns:
+            if self.isAnalysisDir and columnName == "I":
+                displayColumns.append([""] * numRows)
+            elif columnName not in df.columns:
+                displayColumns.append([""] * numRows)
+            elif pd.api.types.is_float_dtype(df[columnName].dtype):
+                displayColumns.append(
+                    ["" if math.isnan(value) else value for value in df[columnName].tolist()]
+                )
+            else:
+                displayColumns.append([_displayValue(value) for value in df[columnName].tolist()])
+
+        self._checkStates = None
+        if "I" in self._data.columns and "I" in df.columns:
+            self._checkStates = [
+                QtCore.Qt.Checked if value else QtCore.Qt.Unchecked
+                for value in df["I"].tolist()
+            ]
+
+        self._rowStatus = np.zeros(numRows, dtype=np.uint8)
+        if self.isAnalysisDir:
+            for rowIdx, realRow in enumerate(df.index):
+                self._rowStatus[rowIdx] = self._getRowStatus(realRow)
+
+        self._displayColumns = displayColumns
+
+    def _getRowStatus(self, realRow) -> int:
+        """Get status bits of one row of an analysisDir."""
+        rowStatus = 0
+        if self._data.isLoaded(realRow):
+            rowStatus |= _statusLoaded
+        if self._data.isAnalyzed(realRow):
+            rowStatus |= _statusAnalyzed
+        if self._data.analysisIsDirty(realRow):
+            rowStatus |= _statusDirty
+        if self._data.isSaved(realRow):
+            rowStatus |= _statusSaved
+        return rowStatus
+
+    def _updateSnapshotRow(self, rowIdx):
+        """Refresh one row of a current snapshot, rowIdx is the row in the table."""
+        realRow = self._data.index[rowIdx]
+        for columnIdx, columnName in enumerate(self._data.columns):
+            if self.isAnalysisDir and columnName == "I":
+                continue
+            try:
+                value = self._data.loc[realRow, columnName]
+            except KeyError:
+                continue
+            self._displayColumns[columnIdx][rowIdx] = _displayValue(value)
+        if self._checkStates is not None:
+            self._checkStates[rowIdx] = (
+                QtCore.Qt.Checked if self._data.loc[realRow, "I"] else QtCore.Qt.Unchecked
+            )
+        if self.isAnalysisDir:
+            self._rowStatus[rowIdx] = self._getRowStatus(realRow)
+
     def setData(self, index, value, role=QtCore.Qt.EditRole):
         """
         Respond to user/keyboard edits.
@@ -362,6 +451,8 @@ class pandasModel(QtCore.QAbstractTableModel):
                 # logger.info(f'  New value for column "{columnName}" is "{value}" {type(value)}')
                 self._data.loc[realRow, columnName] = value
                 # self._data.iloc[rowIdx, columnIdx] = value
+                if self._displayColumns is not None:
+                    self._updateSnapshotRow(rowIdx)
 
                 # emit change
                 emitRowDict = self.myGetRowDict(realRow)
@@ -377,6 +468,8 @@ class pandasModel(QtCore.QAbstractTableModel):
                 logger.info(f"CheckStateRole column:{columnName} value:{value}")
                 if columnName == "I":
                     self._data.loc[realRow, columnName] = value == 2
+                    if self._displayColumns is not None:
+                        self._updateSnapshotRow(rowIdx)
                     self.dataChanged.emit(index, index)
                     return QtCore.Qt.Checked
 
@@ -442,6 +535,7 @@ class pandasModel(QtCore.QAbstractTableModel):
             self._data = self._data.sort_values(
                 self._data.columns[Ncol], ascending=not order
             )
+        self._clearSnapshot()
         self.layoutChanged.emit()
 
     def myCopyTable(self):
@@ -492,6 +586,7 @@ class pandasModel(QtCore.QAbstractTableModel):
             df = df.reset_index(drop=True)
             self._data = df
 
+        self._clearSnapshot()
         self.endInsertRows()
 
     def old_myDeleteRow(self, rowIdx):
@@ -517,6 +612,7 @@ class pandasModel(QtCore.QAbstractTableModel):
                 df = df.reset_index(drop=True)
                 self._data = df
             #
+            self._clearSnapshot()
             self.endRemoveRows()
 
     def myUnloadRow(self, rowIdx):
@@ -576,6 +672,7 @@ class pandasModel(QtCore.QAbstractTableModel):
             #
             self._data = df
         #
+        self._clearSnapshot()
         self.endInsertRows()
 
     def mySetRow(self, rowIdx, rowDict):
@@ -587,6 +684,7 @@ class pandasModel(QtCore.QAbstractTableModel):
         for k, v in rowDict.items():
             if k in self._data.columns:
                 self._data.at[rowIdx, k] = v
+        self._clearSnapshot()
 
     def mySaveDb(self, path):
         # print('pandasModel.mySaveDb() path:', path)
@@ -608,16 +706,26 @@ class pandasModel(QtCore.QAbstractTableModel):
         if self.isAnalysisDir:
             self.beginResetModel()
             self._data.syncDfWithPath()
+            self._clearSnapshot()
             self.endResetModel()
 
-    def myUpdateLoadedAnalyzed(self, ba, rowIdx):
+    def myUpdateLoadedAnalyzed(self, ba, rowIdx=None):
+        """Refresh the row of ba, rowIdx is its table row if known."""
         if self.isAnalysisDir:
-            rowIdx = self._data.index[rowIdx]  # assume rows are sorted
-            self._data._updateLoadedAnalyzed(rowIdx)
+            if rowIdx is None:
+                realRow = self._data.findAnalysisRow(ba)
+                if realRow is None:
+                    logger.warning(f"Did not find row of {ba}")
+                    return
+                rowIdx = self._data.index.get_loc(realRow)
+            else:
+                realRow = self._data.index[rowIdx]  # assume rows are sorted
+            # only this row changed, see _checkSnapshot()
+            self._data._updateLoadedAnalyzed(realRow)
 
             # we changed the model, we need to emit dataChanged
             indexStart = self.createIndex(rowIdx, 0)
-            indexStop = self.createIndex(rowIdx + 1, 0)
+            indexStop = self.createIndex(rowIdx, self.columnCount() - 1)
             self.dataChanged.emit(indexStart, indexStop)
 
     def _old_mySetDetectionParams(self, rowIdx, cellType):
@@ -522,11 +522,11 @@ class bTableView(QtWidgets.QTableView):
         """
 
     def slot_detect(self, ba):
-        """Find row of _ba and update model"""
-        tmp = self.selectedIndexes()
-        if len(tmp) > 0:
-            selectedRow = tmp[0].row()  # not in sort order
-            self.model().myUpdateLoadedAnalyzed(ba, selectedRow)
+        """Find row of _ba and update model.
+
+        Not the selected row, the selection can change while ba is detected in the background.
+        """
+        self.model().myUpdateLoadedAnalyzed(ba)
 
 
 def test():
@@ -0,0 +1,51 @@
+import threading
+import traceback
+
+from PyQt5 import QtCore
+
+import sanpy
+
+from sanpy.sanpyLogger import get_logger
+logger = get_logger(__name__)
+
+
+class detectionWorker(QtCore.QThread):
+    """Spike detect one bAnalysis in a thread, the interface stays responsive.
+
+    Detection runs with bAnalysis.getSpikeDetectResults() and does not change the analysis.
+    Connect signalDetectResults and swap in the results with
+    bAnalysis.setSpikeDetectResults() in the GUI thread.
+    """
+
+    signalProgress = QtCore.pyqtSignal(int, int)  # numDetected, numSweeps
+    signalDetectResults = QtCore.pyqtSignal(object, object)  # ba, results (None if cancelled)
+
+    def __init__(self, ba: "sanpy.bAnalysis", detectionDict: dict, parent=None):
+        super().__init__(parent)
+        self._ba = ba
+        self._detectionDict = detectionDict
+        self._cancelEvent = threading.Event()
+
+    @property
+    def ba(self):
+        return self._ba
+
+    def cancel(self):
+        """Stop detection before the next sweep, signalDetectResults will have None."""
+        self._cancelEvent.set()
+
+    def isCancelled(self) -> bool:
+        return self._cancelEvent.is_set()
+
+    def run(self):
+        detectResults = None
+        try:
+            detectResults = self._ba.getSpikeDetectResults(
+                self._detectionDict,
+                progressCallback=self.signalProgress.emit,
+                cancelEvent=self._cancelEvent,
+            )
+        except Exception as e:
+            logger.error(f"Exception in spike detection: {e}")
+            logger.error(traceback.format_exc())
+        self.signalDetectResults.emit(self._ba, detectResults)
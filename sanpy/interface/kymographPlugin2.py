@@ -205,7 +205,7 @@ class kymographPlugin2(QtWidgets.QMainWindow):
                 _kymUserAnalysis = sanpy.user_analysis.kymUserAnalysis(self._ba)
                 _kymUserAnalysis.defineUserStats()
                 _kymUserAnalysis.run()
-                self._ba._detectionDirty = True
+                self._ba._setDetectionDirty()
 
             # self.refreshSumLinePlot()
             self.refreshDiameterPlot(autoRange='y')
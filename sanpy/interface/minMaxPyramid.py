@@ -0,0 +1,114 @@
+import numpy as np
+
+from sanpy.sanpyLogger import get_logger
+logger = get_logger(__name__)
+
+
+class minMaxPyramid:
+    def __init__(self, x: np.ndarray, y: np.ndarray, binFactor: int = 4, minBins: int = 256):
+        """Min/max decimation pyramid of one trace, to quickly plot long recordings.
+
+        Level 0 is the trace. Level i has bins of binFactor**i points,
+        each bin is plotted as two points (its min and max) at the x of the first point in the bin.
+        A peak is always the max of its bin, spikes do not disappear at any level.
+
+        Each level is built from the previous one, only once. Levels are float32,
+        in total about 1/3 the memory of a float64 trace.
+
+        Parameters
+        ----------
+        x : np.ndarray
+            Time of each point, increasing
+        y : np.ndarray
+            Values, nan are ignored unless all values in a bin are nan
+        binFactor : int
+            Points per bin in level i+1 over level i
+        minBins : int
+            Stop adding levels when a level would have fewer bins than this
+        """
+        x = np.asarray(x)
+        y = np.asarray(y)
+        if x.shape != y.shape:
+            logger.error(f"x {x.shape} and y {y.shape} shapes do not match")
+
+        self._binFactor = max(int(binFactor), 2)
+
+        self._x = x
+
+        self._levels = [y]
+        # y to plot each level, level 0 is the trace, see getLevel()
+
+        self._binSizes = [1]
+        # points of the trace in each bin of each level
+
+        numPoints = len(y)
+        binSize = 1
+        mins = maxs = y
+        while numPoints // (binSize * self._binFactor) >= minBins:
+            # bins of the previous level that make up each bin of this level
+            starts = np.arange(0, len(mins), self._binFactor)
+            with np.errstate(invalid="ignore"):
+                mins = np.fmin.reduceat(mins, starts)
+                maxs = np.fmax.reduceat(maxs, starts)
+            binSize *= self._binFactor
+
+            # two points per bin, its min then its max
+            levelY = np.empty(2 * len(mins), dtype=np.float32)
+            levelY[0::2] = mins
+            levelY[1::2] = maxs
+
+            self._levels.append(levelY)
+            self._binSizes.append(binSize)
+
+    @property
+    def numLevels(self) -> int:
+        return len(self._levels)
+
+    def getLevel(self, level: int, start: int = 0, stop: int = None):
+        """Get (x, y) of points [start, stop) of one level, level 0 is the trace."""
+        levelY = self._levels[level][start:stop]
+        if level == 0:
+            return self._x[start:stop], levelY
+        # x of each bin is x of its first point, twice
+        binSize = self._binSizes[level]
+        binStart = start // 2
+        levelX = np.repeat(self._x[binStart * binSize :: binSize][: (len(levelY) + 1) // 2], 2)
+        if start % 2:
+            levelX = levelX[1:]
+        return levelX[: len(levelY)], levelY
+
+    def chooseLevel(self, numPoints: int, maxPoints: int) -> int:
+        """Get the finest level that plots numPoints of the trace with at most maxPoints."""
+        for level, binSize in enumerate(self._binSizes):
+            numLevelPoints = numPoints if level == 0 else 2 * numPoints / binSize
+            if numLevelPoints <= maxPoints:
+                return level
+        return self.numLevels - 1
+
+    def getData(self, xMin: float = None, xMax: float = None, numPixels: int = 1000):
+        """Get (x, y) to plot [xMin, xMax] with about 2 points per pixel.
+
+        Parameters
+        ----------
+        xMin, xMax : float
+            Visible x range, None for start/end of the trace
+        numPixels : int
+            Width of the plot in pixels
+
+        Returns
+        -------
+        x, y : np.ndarray
+            Points of the chosen level in the range, plus one bin on either side
+        """
+        x = self._x
+        start = 0 if xMin is None else int(np.searchsorted(x, xMin, side="left"))
+        stop = len(x) if xMax is None else int(np.searchsorted(x, xMax, side="right"))
+        level = self.chooseLevel(max(stop - start, 0), 2 * max(numPixels, 1))
+
+        # one bin before and after the range, so lines continue past the edges
+        binSize = self._binSizes[level]
+        startBin = max(start // binSize - 1, 0)
+        stopBin = -(-stop // binSize) + 1
+        if level == 0:
+            return self.getLevel(0, startBin, stopBin)
+        return self.getLevel(level, 2 * startBin, 2 * stopBin)
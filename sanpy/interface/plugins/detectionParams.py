@@ -403,6 +403,12 @@ class detectionParams(sanpyPlugin):
         if self.ba is None:
             return
 
+        # detect with the same worker as the main window, it updates plots and plugins when done
+        sanPyWindow = self.getSanPyWindow()
+        if sanPyWindow is not None:
+            sanPyWindow.myDetectionWidget.detectDict(self._detectionDict, ba=self.ba)
+            return
+
         # spike detect
         self.ba.spikeDetect(self._detectionDict)
 
@@ -298,7 +298,7 @@ class spikeClips(sanpyPlugin):
         # this returns x-axis in ms
         # theseClips is a [list] of clips
         # theseClips_x is in ms
-        theseClips, theseClips_x, meanClip = self.ba.getSpikeClips(
+        theseClips, theseClips_x, meanClip, stdClip = self.ba.getSpikeClips(
             startSec,
             stopSec,
             spikeSelection=selectedSpikeList,
@@ -306,7 +306,8 @@ class spikeClips(sanpyPlugin):
             postSpikeClipWidth_ms=self.postClipWidth_ms,
             sweepNumber=self.sweepNumber,
             epochNumber=self.epochNumber,
-            ignoreMinMax=False  # 20230418 trying to get sweeps/epochs working
+            ignoreMinMax=False,  # 20230418 trying to get sweeps/epochs working
+            returnStd=True,
         )
         numClips = len(theseClips)
         logger.info(f'  got numClips:{numClips}')
@@ -315,17 +316,13 @@ class spikeClips(sanpyPlugin):
         if numClips == 0:
             return
 
-        # convert clips to 2d ndarray ???
-        xTmp = np.array(theseClips_x)
-        xTmp /= 1000  # ms to seconds
-        yTmp = np.array(theseClips)  # mV
+        # clips are 2d ndarray, theseClips_x is a read only view
+        xTmp = theseClips_x / 1000  # ms to seconds
+        yTmp = theseClips  # mV
 
         if isPhasePlot:
             # plot x mV versus y dV/dt
-            dvdt = np.zeros((yTmp.shape[0], yTmp.shape[1] - 1))  #
-            for i in range(dvdt.shape[0]):
-                dvdt[i, :] = np.diff(yTmp[i, :])
-                # drop first pnt in x
+            dvdt = np.diff(yTmp, axis=1)
 
             #
             xTmp = yTmp[:, 1:]  # drop first column of mV and swap to x-axis
@@ -419,7 +416,11 @@ class spikeClips(sanpyPlugin):
             self.variancePlot.show()
             # self.variancePlot.clear()
             xVarClip = np.nanmean(xTmp, axis=0)  # xTmp is in ms
-            yVarClip = np.nanvar(yTmp, axis=0)
+            if isPhasePlot:
+                yVarClip = np.nanvar(yTmp, axis=0)
+            else:
+                # variance of the clips, without waterfall offsets
+                yVarClip = stdClip**2
             tmpVarClipLine = MultiLine(
                 xVarClip, yVarClip, self, width=3, allowXAxisDrag=False, type="meanclip"
             )
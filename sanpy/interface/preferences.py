@@ -253,6 +253,12 @@ class preferences:
         # 20240124 changed from 1 to 3 (don't use for load file !!!)
         configDict['fileList']['Folder Depth'] = 3
 
+        # files before and after the selected file to load in the background
+        configDict['fileList']['Prefetch Files'] = 2
+
+        # memory of loaded files, saved files over budget are unloaded
+        configDict['fileList']['Memory Budget (MB)'] = 4096
+
         return configDict
 
     def save(self):
@@ -353,6 +353,8 @@ class SanPyWindow(QtWidgets.QMainWindow):
                     # doQuit = False
 
         if doCloseWindow:
+            # do not destroy a running detection thread
+            self.myDetectionWidget.cancelDetect(wait=True)
             self.getSanPyApp().closeSanPyWindow(self)
 
         # removing to switch to both load folder window and load file window
@@ -541,6 +543,9 @@ class SanPyWindow(QtWidgets.QMainWindow):
         if self.myAnalysisDir is not None:
             ba = self.myAnalysisDir.getAnalysis(row)  # if None then problem loading
 
+            # load the next/previous files in the background
+            self.myAnalysisDir.prefetch(row)
+
             if ba is not None:
                 self.signalSwitchFile.emit(ba, rowDict)
                 if selectingAgain:
@@ -1153,7 +1158,9 @@ class SanPyWindow(QtWidgets.QMainWindow):
         self.myAnalysisDir = sanpy.analysisDir(
             path,
             folderDepth=folderDepth,
-            fileLoaderDict=fileLoaderDict
+            fileLoaderDict=fileLoaderDict,
+            prefetchFiles=self.configDict["fileList"].get("Prefetch Files", 2),
+            memoryBudgetBytes=self.configDict["fileList"].get("Memory Budget (MB)", 4096) * 2**20,
         )
 
         # file
@@ -1314,7 +1321,9 @@ class SanPyWindow(QtWidgets.QMainWindow):
         self.myAnalysisDir = sanpy.analysisDir(
             path,
             folderDepth=folderDepth,
-            fileLoaderDict=fileLoaderDict
+            fileLoaderDict=fileLoaderDict,
+            prefetchFiles=self.configDict["fileList"].get("Prefetch Files", 2),
+            memoryBudgetBytes=self.configDict["fileList"].get("Memory Budget (MB)", 4096) * 2**20,
         )
 
         # set myAnalysisDir to file list model
@@ -36,14 +36,14 @@ right_pnt
 import os
 import math
 import time
+import concurrent.futures
 
-from multiprocessing import Pool
+from multiprocessing import shared_memory
 
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Callable
 
 import numpy as np
 import pandas as pd
-from skimage.measure import profile
 import scipy.signal
 import scipy
 import tifffile
@@ -208,6 +208,210 @@ def startStopFromDeriv(lineProfile, stdMult, doPlot=False, verbose=False):
 
     return leftPnt, rightPnt
 
+_fitBlockLines = 1024
+# number of line scans to fit at once in kymAnalysis.analyzeDiameter()
+
+_rangesPerWorker = 4
+# ranges of line scans per worker in kymAnalysis.analyzeDiameter_mp(), to report progress
+
+def _medfiltRows(lineProfiles, kernelSize):
+    """Median filter each row, same as scipy.signal.medfilt() of each row.
+
+    Next to nan, medfilt of a 2d array does not give the same values as
+    medfilt of each row. Rows with nan are filtered one at a time.
+    """
+    if not np.isnan(lineProfiles).any():
+        return scipy.signal.medfilt(lineProfiles, [1, kernelSize])
+    filtered = np.empty_like(lineProfiles)
+    for row, lineProfile in enumerate(lineProfiles):
+        filtered[row] = scipy.signal.medfilt(lineProfile, kernelSize)
+    return filtered
+
+def startStopFromDeriv2d(lineProfiles, stdMult):
+    """Given line profiles (lines, points), return start/stop pnt of each line.
+
+    Same as startStopFromDeriv() for all lines at once.
+    Start/stop is nan when not found.
+    """
+    # filter line profile again
+    SavitzkyGolay_pnts = 5
+    SavitzkyGolay_poly = 2
+    lineProfiles = scipy.signal.savgol_filter(
+        lineProfiles,
+        SavitzkyGolay_pnts,
+        SavitzkyGolay_poly,
+        axis=1,
+        mode="nearest",
+    )
+
+    # get the first derivative, append a point so it is same length as filteredDiam
+    lineDeriv = np.zeros(lineProfiles.shape)
+    lineDeriv[:, :-1] = np.diff(lineProfiles, axis=1)
+
+    lineDeriv = _medfiltRows(lineDeriv, 3)
+    lineDeriv = _medfiltRows(lineDeriv, 3)
+
+    midPoint = int(lineProfiles.shape[1]/2)
+
+    leftDeriv = lineDeriv[:, 0:midPoint]
+    rightDeriv = lineDeriv[:, midPoint:-1]
+
+    with warnings.catch_warnings():
+        # all nan lines
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        leftThreshold = np.nanmean(leftDeriv, axis=1) + (stdMult * np.nanstd(leftDeriv, axis=1))
+        rightThreshold = np.nanmean(rightDeriv, axis=1) - (stdMult * np.nanstd(rightDeriv, axis=1))
+
+    # positive deflection in deriv, first point
+    aboveLeft = leftDeriv > leftThreshold[:, np.newaxis]
+    leftPnt = np.argmax(aboveLeft, axis=1).astype(float)
+    leftPnt[~aboveLeft.any(axis=1)] = np.nan
+
+    # negative deflection in deriv, last point
+    belowRight = rightDeriv < rightThreshold[:, np.newaxis]
+    rightPnt = rightDeriv.shape[1] - 1 - np.argmax(belowRight[:, ::-1], axis=1) + midPoint
+    rightPnt = rightPnt.astype(float)
+    rightPnt[~belowRight.any(axis=1)] = np.nan
+
+    return leftPnt, rightPnt
+
+def fitLineProfiles(kymImage : np.ndarray, lineScanNumbers : np.ndarray, detectionDict : dict):
+    """Get line profiles of many line scans at once.
+
+    Same as kymAnalysis._getFitLineProfile() for each line scan in lineScanNumbers.
+
+    Parameters
+    ----------
+    kymImage : np.ndarray
+        Shape is (line scans, pixels per line)
+    lineScanNumbers : np.ndarray
+        Line scans to fit
+    detectionDict : dict
+        See kymAnalysis._getFitDetectionDict()
+
+    Returns
+    -------
+    intensityProfiles : np.ndarray
+        Shape is (len(lineScanNumbers), pixels per line), nan outside roi
+    left_idx, right_idx : np.ndarray
+        nan when not found
+    """
+    lineWidth = detectionDict['lineWidth']
+    percentOfMax = detectionDict['percentOfMax']
+    lineFilterKernel = detectionDict['lineFilterKernel']
+    interpMult = detectionDict['interpMult']
+    src_pnt_space = detectionDict['src_pnt_space']
+    dst_pnt_space = detectionDict['dst_pnt_space']
+
+    lineScanNumbers = np.asarray(lineScanNumbers)
+
+    if lineWidth == 1:
+        intensityProfiles = kymImage[lineScanNumbers, :].astype(float)
+    else:
+        # moving mean of line scans [_startLine, _stopLine), see _getFitLineProfile()
+        # sum one line at a time, same as np.mean(axis=0) of each slab
+        _numLines = kymImage.shape[0]
+        halfLineWidth = int((lineWidth-1) / 2)  # assuming lineWidth is odd
+        _startLine = np.clip(lineScanNumbers - halfLineWidth, 0, None)
+        _stopLine = np.clip(lineScanNumbers + halfLineWidth, None, _numLines - 1)
+        _numSlab = np.clip(_stopLine - _startLine, 0, None)
+        if np.issubdtype(kymImage.dtype, np.integer):
+            _sumType = np.float64
+        else:
+            _sumType = kymImage.dtype
+        intensityProfiles = np.zeros((len(lineScanNumbers), kymImage.shape[1]), dtype=_sumType)
+        for _slabLine in range(_numSlab.max(initial=0)):
+            _inSlab = _slabLine < _numSlab
+            intensityProfiles[_inSlab] += kymImage[_startLine[_inSlab] + _slabLine]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            np.true_divide(intensityProfiles, _numSlab[:, np.newaxis], out=intensityProfiles, casting='unsafe')
+        intensityProfiles[_stopLine <= _startLine] = np.nan
+    intensityProfiles = np.flip(intensityProfiles, axis=1)  # FLIPPED
+
+    # median filter line profile
+    if lineFilterKernel > 0:
+        intensityProfiles = scipy.signal.medfilt(intensityProfiles, [1, lineFilterKernel])
+
+    # Nan out before/after roi
+    intensityProfiles = np.array(intensityProfiles, dtype=float)  # we need nan
+    intensityProfiles[:, 0:src_pnt_space] = np.nan
+    intensityProfiles[:, dst_pnt_space:] = np.nan
+
+    # interpolate, same as np.interp() of each line
+    _nIntensityProfile = intensityProfiles.shape[1]
+    _xOld = np.linspace(0, _nIntensityProfile, num=_nIntensityProfile)
+    _xNew = np.linspace(0, _nIntensityProfile, num=_nIntensityProfile*interpMult)
+    _j = np.clip(np.searchsorted(_xOld, _xNew, side='right') - 1, 0, _nIntensityProfile - 2)
+    _slope = (intensityProfiles[:, _j+1] - intensityProfiles[:, _j]) / (_xOld[_j+1] - _xOld[_j])
+    _yNew = _slope * (_xNew - _xOld[_j]) + intensityProfiles[:, _j]
+    _isOld = _xNew == _xOld[_j]
+    _yNew[:, _isOld] = intensityProfiles[:, _j[_isOld]]
+    _isLast = _xNew >= _xOld[-1]
+    _yNew[:, _isLast] = intensityProfiles[:, [-1]]
+
+    # percentOfMax is actually std * percentOfMax
+    leftPnt, rightPnt = startStopFromDeriv2d(_yNew, percentOfMax)
+
+    left_idx = np.full(len(lineScanNumbers), np.nan)
+    right_idx = np.full(len(lineScanNumbers), np.nan)
+    _goodLeft = ~np.isnan(leftPnt)
+    _goodRight = ~np.isnan(rightPnt)
+    left_idx[_goodLeft] = _xNew[leftPnt[_goodLeft].astype(int)]
+    right_idx[_goodRight] = _xNew[rightPnt[_goodRight].astype(int)]
+
+    _numNan = np.sum(~_goodLeft) + np.sum(~_goodRight)
+    if _numNan > 0:
+        logger.error(f'got {np.sum(~_goodLeft)} nan left and {np.sum(~_goodRight)} nan right in {len(lineScanNumbers)} line scans !!!')
+
+    return intensityProfiles, left_idx, right_idx
+
+def fitLineRange(kymImage : np.ndarray, lineStart : int, lineStop : int, detectionDict : dict) -> dict:
+    """Fit line scans [lineStart, lineStop) in blocks of _fitBlockLines.
+
+    Returns
+    -------
+    dict
+        Keys are (sumintensity_raw, left_pnt, right_pnt, minInt, maxInt),
+        values are np.ndarray with one value per line scan.
+    """
+    lineRange = np.arange(lineStart, lineStop)
+    lineFits = {
+        'sumintensity_raw': np.full(len(lineRange), np.nan),
+        'left_pnt': np.full(len(lineRange), np.nan),
+        'right_pnt': np.full(len(lineRange), np.nan),
+        'minInt': np.full(len(lineRange), np.nan),
+        'maxInt': np.full(len(lineRange), np.nan),
+    }
+    # fit blocks of line scans at once to limit memory
+    for blockStart in range(0, len(lineRange), _fitBlockLines):
+        blockStop = blockStart + _fitBlockLines
+        lines = lineRange[blockStart:blockStop]
+
+        # get line profile using line width
+        # outside roi rect will be nan
+        intensityProfiles, left_idx, right_idx = fitLineProfiles(kymImage, lines, detectionDict)
+
+        with warnings.catch_warnings():
+            # all nan lines
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            lineFits['sumintensity_raw'][blockStart:blockStop] = np.nansum(intensityProfiles, axis=1)
+            lineFits['minInt'][blockStart:blockStop] = np.nanmin(intensityProfiles, axis=1)
+            lineFits['maxInt'][blockStart:blockStop] = np.nanmax(intensityProfiles, axis=1)
+        lineFits['left_pnt'][blockStart:blockStop] = left_idx
+        lineFits['right_pnt'][blockStart:blockStop] = right_idx
+    return lineFits
+
+def _fitLineRangeWorker(sharedName : str, shape : tuple, dtype : str,
+                        lineStart : int, lineStop : int, detectionDict : dict) -> dict:
+    """Fit line scans of a kymograph image in shared memory, see kymAnalysis.analyzeDiameter_mp()."""
+    sharedImage = shared_memory.SharedMemory(name=sharedName)
+    kymImage = np.ndarray(shape, dtype=dtype, buffer=sharedImage.buf)
+    try:
+        return fitLineRange(kymImage, lineStart, lineStop, detectionDict)
+    finally:
+        del kymImage
+        sharedImage.close()
+
 def guessDvDtThreshold(ba : sanpy.bAnalysis) -> float:
     """Guess the dvdt threshold as mean+std of dvdt.
 
@@ -508,6 +712,18 @@ def plotDiamFit(ba, ddDict, dResultsDict):
 
     plt.show()
      
+def makeKymograph(numLines: int = 10000, numPixels: int = 101, seed: int = 0) -> np.ndarray:
+    """Synthetic kymograph for tests and benchmarks.
+
+    Bright vessel with changing diameter and noise, shape is (lines, pixels).
+    """
+    rng = np.random.default_rng(seed)
+    halfWidth = 25 + 10 * np.sin(np.arange(numLines) / 20)
+    distance = np.abs(np.arange(numPixels) - numPixels / 2)
+    kymImage = (distance < halfWidth[:, np.newaxis]) * 150 + rng.normal(30, 15, (numLines, numPixels))
+    return np.clip(kymImage, 0, 255).astype(np.uint8)
+
+
 class kymRect:
     """Class to represent a rectangle as [l, t, r, b]"""
 
@@ -1263,6 +1479,26 @@ class kymAnalysis:
 
         return intensityProfile, left_idx, right_idx
 
+    def _getFitDetectionDict(self) -> dict:
+        """Get analysis parameters used to fit line profiles, see fitLineProfiles()."""
+        roiRect = self.getRoiRect()  # (l, t, r, b) in um and seconds (float)
+        return {
+            'lineWidth': self.getAnalysisParam('lineWidth'),
+            'lineFilterKernel': self.getAnalysisParam('lineFilterKernel'),
+            'percentOfMax': self.getAnalysisParam('percentOfMax'),
+            'interpMult': self.getAnalysisParam('interpMult'),
+            'src_pnt_space': roiRect.getBottom(),
+            'dst_pnt_space': roiRect.getTop(),
+        }
+
+    def _getFitLineProfiles(self, lineScanNumbers : np.ndarray):
+        """Get line profiles of many line scans at once.
+
+        Same as _getFitLineProfile() for each line scan in lineScanNumbers,
+        see fitLineProfiles().
+        """
+        return fitLineProfiles(self._filteredImage, lineScanNumbers, self._getFitDetectionDict())
+
     def _old_getFitLineProfile(self, lineScanNumber : int,
                            verbose=False, doMplPlot=False):
         """Get one line profile.
@@ -1511,9 +1747,6 @@ class kymAnalysis:
         # imageFilterKenel = self.getAnalysisParam('imageFilterKenel')
         
         lineFilterKernel = self.getAnalysisParam('lineFilterKernel')
-        
-        # to save in csv
-        finalDiamFilterKernel = self.getAnalysisParam('finalDiamFilterKernel')
 
         # if imageFilterKenel > 0:
         #     self._filteredImage = scipy.signal.medfilt(self._kymImage, imageFilterKenel)
@@ -1545,58 +1778,40 @@ class kymAnalysis:
             logger.info(f"  secondsPerLine:{self.secondsPerLine}")
             logger.info(f"  percentOfMax:{self.getAnalysisParam('percentOfMax')}")
 
-        sumIntensity = [np.nan] * self.numLineScans()
-        left_idx_list = [np.nan] * self.numLineScans()
-        right_idx_list = [np.nan] * self.numLineScans()
-        diameter_idx_list = [np.nan] * self.numLineScans()
-
-        min_list = [np.nan] * self.numLineScans()
-        max_list = [np.nan] * self.numLineScans()
-        range_list = [np.nan] * self.numLineScans()
-
-        _maxSumIntensity = 0
-
-        lineRange = np.arange(leftRect_line, rightRect_line)
-        for line in lineRange:
-            # get line profile using line width
-            # outside roi rect will be nan
-            intensityProfile, left_idx, right_idx = self._getFitLineProfile(line)
-            #intensityProfile, left_idx, right_idx = lineProfileWorker()
-
-            # logger.info(f'  len(intensityProfile):{len(intensityProfile)} \
-            #             left_idx:{left_idx} \
-            #             right_idx:{right_idx}')
-
-            _sumIntensity = np.nansum(intensityProfile)
-            sumIntensity[line] = _sumIntensity
-            #sumIntensity[line] /= self._kymImage.shape[1]  # normalize to number of points in line scan
-            if _sumIntensity > _maxSumIntensity:
-                _maxSumIntensity = _sumIntensity
-
-            # 20230920 removed -1
-            # _diamPixels = right_idx - left_idx + 1
-            _diamPixels = right_idx - left_idx
-
-            # 20230727, blank out if diam is really small
-            # if _diamPixels < (_pointsPerLineScan * 0.5):
-            #     logger.info(f'  blanking line {line} with _diamPixels:{_diamPixels}')
-            #     left_idx_list[line] = np.nan
-            #     right_idx_list[line] = np.nan
-            #     diameter_idx_list[line] = np.nan
-            # else:
-            if 1:
-                left_idx_list[line] = left_idx
-                right_idx_list[line] = right_idx
-                diameter_idx_list[line] = _diamPixels
-
-            _min = np.nanmin(intensityProfile)
-            _max = np.nanmax(intensityProfile)
-            _range = _max - _min
-            # logger.info(f'{_min} {_max} {_range}')
-            min_list[line] = _min
-            max_list[line] = _max
-            range_list[line] = _range
-            
+        lineFits = fitLineRange(self._filteredImage, leftRect_line, rightRect_line,
+                                self._getFitDetectionDict())
+        self._setDiamResults(leftRect_line, rightRect_line, lineFits)
+
+        if verbose:
+            stopSeconds = time.time()
+            durSeconds = round(stopSeconds - startSeconds, 2)
+            logger.info(f"  analyzed {rightRect_line - leftRect_line} line scans in {durSeconds} seconds")
+
+    def _setDiamResults(self, lineStart : int, lineStop : int, lineFits : dict):
+        """Set diameter results from fit of line scans [lineStart, lineStop), see fitLineRange().
+        """
+        finalDiamFilterKernel = self.getAnalysisParam('finalDiamFilterKernel')
+
+        def _lineList(values):
+            # one value per line scan, nan outside of fit line scans
+            theList = [np.nan] * self.numLineScans()
+            theList[lineStart:lineStop] = values.tolist()
+            return theList
+
+        sumIntensity = _lineList(lineFits['sumintensity_raw'])
+        left_idx_list = _lineList(lineFits['left_pnt'])
+        right_idx_list = _lineList(lineFits['right_pnt'])
+
+        # 20230920 removed -1
+        # _diamPixels = right_idx - left_idx + 1
+        diameter_idx_list = _lineList(lineFits['right_pnt'] - lineFits['left_pnt'])
+
+        min_list = _lineList(lineFits['minInt'])
+        max_list = _lineList(lineFits['maxInt'])
+        range_list = _lineList(lineFits['maxInt'] - lineFits['minInt'])
+
+        _maxSumIntensity = max(0, np.max(lineFits['sumintensity_raw'], initial=0))
+
         self._diamResults["time_sec"] = self.sweepX  #.tolist()
         self._diamResults["sumintensity_raw"] = sumIntensity
         
@@ -1681,240 +1896,79 @@ class kymAnalysis:
         self._diamAnalyzed = True
         self._analysisDirty = True
 
-        if verbose:
-            stopSeconds = time.time()
-            durSeconds = round(stopSeconds - startSeconds, 2)
-            logger.info(f"  analyzed {len(lineRange)} line scans in {durSeconds} seconds")
+    def analyzeDiameter_mp(self, workers : Optional[int] = None,
+                           progressCallback : Optional[Callable[[int, int], None]] = None,
+                           verbose=False):
+        """Analyze the diameter of each line scan with a pool of processes.
 
-    def analyzeDiameter_mp(self):
+        Same results as analyzeDiameter(). The image is copied once into shared memory
+        and each worker fits a contiguous range of line scans.
 
-        roiRect = self.getRoiRect()  # (l, t, r, b) in um and seconds (float)
-
-        _detectionDict = {
-            'lineWidth': self.getAnalysisParam('lineWidth'),
-            'lineFilterKernel': self.getAnalysisParam('lineFilterKernel'),
-            'detectPosNeg': self.getAnalysisParam('detectPosNeg'),
-            'percentOfMax': self.getAnalysisParam('percentOfMax'),
-            'src_pnt_space': roiRect.getBottom(),
-            'dst_pnt_space': roiRect.getTop(),
-        }
-    
-        results = lineProfilePool(self.getImage(), _detectionDict)
-
-        print('results:', type(results))
-        print(results[0])
-        return
-
-        #
-        # # file results
-        # self._diamResults["time_sec"] = self.sweepX.tolist()
-
-        # self._diamResults["left_pnt"] = left_idx_list
-        # self._diamResults["right_pnt"] = right_idx_list
-
-        
-        # self._diamResults["sumintensity_raw"] = sumIntensity
-
-        # # normalize sum to max
-        # sumIntensity = [_x/_maxSumIntensity for _x in sumIntensity]
-        # self._diamResults["sumintensity"] = sumIntensity
-
-        # diameter_um = np.multiply(diameter_idx_list, self.umPerPixel)
-        # self._diamResults["diameter_pnts"] = diameter_idx_list
-        # self._diamResults["diameter_um"] = diameter_um
-
-
-# def lineProfileWorker(imgData, _percentOfMax, lineFilterKernel=0, src_pnt_space=None, dst_pnt_space=None):
-def lineProfileWorker(imgData, detectionDict : dict):
-    """
-    Parameters
-    ==========
-        imgData : np.ndarry
-            Image data to extract line profile from
-            Assuming shape (line scans, pixels per line)
-            line scans must be odd
-        detectionDict : dict
-            'lineWidth': lineWidth,
-            'lineFilterKernel': lineFilterKernel,
-            'percentOfMax': percentOfMax,
-            'src_pnt_space': src_pnt_space,
-            'dst_pnt_space': dst_pnt_space,
-    """
-    lineWidth = imgData.shape[0]
-    numPixels = imgData.shape[1]
-
-    lineFilterKernel = detectionDict['lineFilterKernel']
-    detectPosNeg = detectionDict['detectPosNeg']
-    percentOfMax = detectionDict['percentOfMax']
-    src_pnt_space = detectionDict['src_pnt_space']
-    dst_pnt_space = detectionDict['dst_pnt_space']
-
-    print('lineWidth:', lineWidth, 'lineFilterKernel:', lineFilterKernel)
-    
-    if lineWidth == 1:
-        intensityProfile = imgData[0,:]
-        intensityProfile = np.flip(intensityProfile)  # FLIPPED
-
-    else:
-        middleLine = math.floor(lineWidth/2)
-        # intensityProfile will always have len() of number of pixels in line scane
-        # -1 because profile_line uses last pnt (unlike numpy)
-        src = (middleLine, numPixels - 1)
-        dst = (middleLine, 0)  # -1 because profile_line uses last pnt (unlike numpy)
-        intensityProfile = profile.profile_line(
-            imgData, src, dst, linewidth=lineWidth
-        )
-
-    # logger.info(f'intensityProfile:{intensityProfile.shape}')  # 379,
-    # sys.exit(1)
-
-    # median filter line profile
-    if lineFilterKernel > 0:
-        intensityProfile = scipy.signal.medfilt(intensityProfile, lineFilterKernel)
-
-    # x = np.arange(0, len(intensityProfile) + 1)
-
-    # Nan out before/after roi
-    intensityProfile = intensityProfile.astype(float)  # we need nan
-    if src_pnt_space is not None:
-        intensityProfile[0:src_pnt_space] = np.nan
-    if dst_pnt_space is not None:
-        intensityProfile[dst_pnt_space:] = np.nan
-
-    # fwhm, left_idx, right_idx = self.FWHM(x, intensityProfile)
-
-    # detect either a pos (max) or neg (min) intensity along the line
-    _doMax = detectPosNeg == 'pos'
-
-    # 1) FWHM
-    # if _doMax:
-    #     _intMax = np.nanmax(intensityProfile)
-    #     half_max = _intMax * percentOfMax  # 0.2
-    #     # half_max = _intMax + (_intMax * _percentOfMax)  # 0.2
-    # else:
-    #     _intMax = np.nanmin(intensityProfile)
-    #     half_max = _intMax + (_intMax * percentOfMax)  # 0.2
-
-    # 2) STD
-    stdMult = percentOfMax
-    _intMean = np.nanmean(intensityProfile)
-    _intStd = np.nanstd(intensityProfile)
-    if _doMax:
-        half_max = _intMean + (stdMult * _intStd)
-    else:
-        half_max = _intMean - (stdMult * _intStd)
-
-    # 3) determine pos/neg by comparing first/middle/last
-    if 0:
-        _linesInEpoch = 10  # must be even
-        _halfLinesInEpoch = _linesInEpoch  # int(_linesInEpoch * 2 / 2)  # twice as many point in the middle
-        _middle_pnt_space = src_pnt_space + int( (dst_pnt_space - src_pnt_space) / 2 )
-        _firstEpoch = intensityProfile[src_pnt_space:src_pnt_space+_linesInEpoch]
-        _middleEpoch = intensityProfile[_middle_pnt_space-_halfLinesInEpoch:_middle_pnt_space+_halfLinesInEpoch]
-        _lastEpoch = intensityProfile[dst_pnt_space-_linesInEpoch:dst_pnt_space]
-
-        _firstEpochMean = np.nanmean(_firstEpoch)
-        _middleEpochMean = np.nanmean(_middleEpoch)
-        _lastEpochMean = np.nanmean(_lastEpoch)
-        
-        _minFirstLast = min(_firstEpochMean, _lastEpochMean)  # really need min and/or max
-
-        # choose to search for pos/neg
-        # if _minFirstLast < _middleEpochMean:
-        #     _doMax = True
-        # else:
-        #     _doMax = False
-
-    if _doMax:
-        whr = np.asarray(intensityProfile > half_max).nonzero()
-    else:
-        whr = np.asarray(intensityProfile < half_max).nonzero()
-
-    if len(whr[0]) > 2:
-        # whr is (array,), only interested in whr[0]
-        left_idx = whr[0][0]
-        right_idx = whr[0][-1]
-        # fwhm = X[right_idx] - X[left_idx]
-    else:
-        left_idx = np.nan
-        right_idx = np.nan
-        # fwhm = np.nan
-
-    return intensityProfile, left_idx, right_idx
-    # intensityProfile, left_idx, right_idx = self._getFitLineProfile(line)
-
-# def lineProfilePool(imgData, lineWidth, roiRect, percentOfMax, detectPosNeg):
-def lineProfilePool(imgData, detectionDict):
-    """
-    Parameters
-    ==========
-    tifData : np.ndarry
-        tif data slice to analyze
-    lineWidth : int
-        Must be odd
-    """
-    startTime = time.time()
-
-    # we know the scan line, determine start/stop based on roi
-    # roiRect = self.getRoiRect()  # (l, t, r, b) in um and seconds (float)
-
-    # src_pnt_space = self.um2pnt(roiRect.getBottom())
-    # dst_pnt_space = self.um2pnt(roiRect.getTop())
+        Parameters
+        ----------
+        workers : int
+            Number of worker processes, if None then os.cpu_count()
+        progressCallback : Callable[[int, int], None]
+            Called with (number of line scans analyzed, total number of line scans)
+            as each range of line scans finishes.
+        """
+        startSeconds = time.time()
 
-    logger.info(f'imgData:{imgData.shape}')  # tifData:(10000, 519)
-    numLines = imgData.shape[0]
-    result_objs = []
+        if workers is None:
+            workers = os.cpu_count()
 
-    # _detectionDict = {
-    #     'lineWidth': lineWidth,
-    #     'lineFilterKernel': lineFilterKernel,
-    #     'detectPosNeg': detectPosNeg,
-    #     'percentOfMax': percentOfMax,
-    #     'src_pnt_space': src_pnt_space,
-    #     'dst_pnt_space': dst_pnt_space,
-    # }
+        theRect = self.getRoiRect()
+        leftRect_line = theRect.getLeft()
+        rightRect_line = theRect.getRight()
+        numLines = rightRect_line - leftRect_line
 
-    lineWidth = detectionDict['lineWidth']
+        detectionDict = self._getFitDetectionDict()
 
-    with Pool(processes=os.cpu_count() - 1) as pool:
-        
-        for line in range(numLines):
-            startLine = line - math.floor(lineWidth/2)
-            if startLine < 0:
-                startLine = 0
-            # numpy uses (] indexing
-            stopLine = line + math.floor(lineWidth/2) + 1
-            if stopLine > numLines:
-                stopLine = numLines
-
-            imageSlice = imgData[startLine:stopLine,:]
-            
-            # logger.info(f'startLine:{startLine} stopLine:{stopLine} imageSlice:{imageSlice.shape}')
-            
-            # workerParams = (imageSlice, percentOfMax, lineFilterKernel, src_pnt_space, dst_pnt_space)
-            workerParams = (imageSlice, detectionDict)
-            
-            result = pool.apply_async(lineProfileWorker, workerParams)
-            result_objs.append(result)
-
-        # run the workers
-        logger.info(f'getting results from {len(result_objs)} workers')
-        results = [result.get() for result in result_objs]
-
-        # fetch the results (fast as everything is done)
-        # for k, result in enumerate(results):
-        #     # result is a tuple like
-        #     # (intensityProfile, left_idx, right_idx)
-        #     intensityProfile = result[0]
-        #     left_idx = result[1]
-        #     right_idx = result[2]
-        
-        # print(results[0])
+        # split line scans into contiguous ranges, more ranges than workers to report progress
+        numRanges = min(max(1, numLines // _fitBlockLines), workers * _rangesPerWorker)
+        rangeStarts = np.linspace(leftRect_line, rightRect_line, numRanges + 1).astype(int).tolist()
+        lineRanges = [(rangeStarts[i], rangeStarts[i+1]) for i in range(numRanges)
+                      if rangeStarts[i+1] > rangeStarts[i]]
 
-    stopTime = time.time()
-    logger.info(f'  took {round(stopTime-startTime,3)} seconds')
+        kymImage = np.ascontiguousarray(self._filteredImage)
+        sharedImage = shared_memory.SharedMemory(create=True, size=max(1, kymImage.nbytes))
+        try:
+            sharedArray = np.ndarray(kymImage.shape, dtype=kymImage.dtype, buffer=sharedImage.buf)
+            sharedArray[:] = kymImage
+            del sharedArray
+
+            lineFitList = [None] * len(lineRanges)
+            numAnalyzed = 0
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {}
+                for rangeIdx, (lineStart, lineStop) in enumerate(lineRanges):
+                    future = pool.submit(_fitLineRangeWorker, sharedImage.name,
+                                         kymImage.shape, kymImage.dtype.str,
+                                         lineStart, lineStop, detectionDict)
+                    futures[future] = rangeIdx
+                for future in concurrent.futures.as_completed(futures):
+                    rangeIdx = futures[future]
+                    lineFitList[rangeIdx] = future.result()
+                    lineStart, lineStop = lineRanges[rangeIdx]
+                    numAnalyzed += lineStop - lineStart
+                    if progressCallback is not None:
+                        progressCallback(numAnalyzed, numLines)
+                    if verbose:
+                        logger.info(f"  analyzed {numAnalyzed} of {numLines} line scans")
+        finally:
+            sharedImage.close()
+            sharedImage.unlink()
+
+        # assemble ranges in line scan order
+        lineFits = {}
+        for key in ('sumintensity_raw', 'left_pnt', 'right_pnt', 'minInt', 'maxInt'):
+            lineFits[key] = np.concatenate([lineFit[key] for lineFit in lineFitList] + [np.zeros(0)])
+        self._setDiamResults(leftRect_line, rightRect_line, lineFits)
 
-    return results
+        if verbose:
+            stopSeconds = time.time()
+            durSeconds = round(stopSeconds - startSeconds, 2)
+            logger.info(f"  analyzed {numLines} line scans with {workers} workers in {durSeconds} seconds")
 
 def testLineProfilePool():
     # path = "/Users/cudmore/data/rosie/Raw data for contraction analysis/Female Old/filter median 1 C2-0-255 Cell 2 CTRL  2_5_21 female wt old.tif"
@@ -1932,26 +1986,12 @@ def testLineProfilePool():
     # linewidth of 3 takes 16 seconds for 10000 line scans, 7.3 sec for 5000 scans
     # linewidth of 5 takes 17 seconds
     # linewidth of 7 takes 17 seconds
-    roiRect = ka.getRoiRect()  # (l, t, r, b) in um and seconds (float)
-    
     _testLineWidth = 1
     ka.setAnalysisParam('lineWidth', _testLineWidth)
 
     # ka.setAnalysisParam('lineFilterKernel', 0)
 
-    _detectionDict = {
-        'lineWidth': ka.getAnalysisParam('lineWidth'),
-        'lineFilterKernel': ka.getAnalysisParam('lineFilterKernel'),
-        'detectPosNeg': ka.getAnalysisParam('detectPosNeg'),
-        'percentOfMax': ka.getAnalysisParam('percentOfMax'),
-        'src_pnt_space': roiRect.getBottom(),
-        'dst_pnt_space': roiRect.getTop(),
-    }
-
-
-    # todo: put this in kymAnalysis class
-    # lineProfilePool(ka.getImage(), lineWidth, roiRect, _percentOfMax)
-    lineProfilePool(ka.getImage(), _detectionDict)
+    ka.analyzeDiameter_mp(verbose=True)
 
     # plotKym(ka)
     # plotKym_plotly(ka)
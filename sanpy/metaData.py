@@ -75,4 +75,4 @@ class MetaData(dict):
         
         if triggerDirty and self._ba is not None:
             # logger.warning(f'SETTING METADATA {key} from "{oldValue}" to new value "{value}"')
-            self._ba._detectionDirty = True
+            self._ba._setDetectionDirty()
@@ -0,0 +1,216 @@
+"""Timing of named analysis stages (spans), see bAnalysis.perfReport.
+
+Spans are recorded into the perfTimer that is current in this thread, set with timing().
+When there is no current timer, span() and functions decorated with timed() only
+look up a ContextVar.
+
+Time a stage of your own analysis, for example in a user analysis plugin run()
+
+```
+with sanpy.perfUtils.span('myStage'):
+    ...
+
+@sanpy.perfUtils.timed('myOtherStage')
+def myFunction():
+    ...
+```
+"""
+
+import contextlib
+import contextvars
+import datetime
+import functools
+import json
+import threading
+import time
+from typing import Optional
+
+import pandas as pd
+
+from sanpy.sanpyLogger import get_logger
+logger = get_logger(__name__)
+
+_currentTimer = contextvars.ContextVar("sanpyPerfTimer", default=None)
+# perfTimer spans are recorded into, see timing()
+
+_perfLogFile = None
+# if not None, append one json line per spike detection, see setPerfLogFile()
+
+_perfLogLock = threading.Lock()
+
+
+class perfTimer:
+    """Total seconds and count of each named span.
+
+    Spans can be recorded from many threads.
+    """
+
+    def __init__(self):
+        self._spans = {}  # name: [seconds, count]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __getstate__(self):
+        # a lock can not be copied or pickled
+        return {"_spans": self.asDict()}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.merge(state["_spans"])
+
+    def record(self, name: str, seconds: float, count: int = 1):
+        """Add seconds to span name."""
+        with self._lock:
+            oneSpan = self._spans.setdefault(name, [0.0, 0])
+            oneSpan[0] += seconds
+            oneSpan[1] += count
+
+    def merge(self, spans: dict):
+        """Add spans from asDict() of another timer, e.g. from a worker process."""
+        for name, oneSpan in spans.items():
+            self.record(name, oneSpan["seconds"], oneSpan["count"])
+
+    def clear(self, keep: Optional[list] = None):
+        """Remove all spans except those in keep."""
+        with self._lock:
+            self._spans = {name: oneSpan for name, oneSpan in self._spans.items()
+                           if keep is not None and name in keep}
+
+    def asDict(self) -> dict:
+        """Get dict with span name keys and values of dict with keys (seconds, count)."""
+        with self._lock:
+            return {name: {"seconds": seconds, "count": count}
+                    for name, (seconds, count) in self._spans.items()}
+
+    def asDataFrame(self) -> pd.DataFrame:
+        """Get one row per span with columns (span, seconds, count)."""
+        spans = self.asDict()
+        return pd.DataFrame({
+            "span": list(spans.keys()),
+            "seconds": [oneSpan["seconds"] for oneSpan in spans.values()],
+            "count": [oneSpan["count"] for oneSpan in spans.values()],
+        })
+
+
+def getCurrentTimer() -> Optional[perfTimer]:
+    """Get the perfTimer spans are recorded into, None if not timing."""
+    return _currentTimer.get()
+
+
+@contextlib.contextmanager
+def timing(timer: perfTimer):
+    """Record spans into timer in this context."""
+    token = _currentTimer.set(timer)
+    try:
+        yield timer
+    finally:
+        _currentTimer.reset(token)
+
+
+class _span:
+    __slots__ = ("_timer", "_name", "_startTime")
+
+    def __init__(self, timer: perfTimer, name: str):
+        self._timer = timer
+        self._name = name
+
+    def __enter__(self):
+        self._startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._timer.record(self._name, time.perf_counter() - self._startTime)
+        return False
+
+
+_nullSpan = contextlib.nullcontext()
+
+
+def span(name: str):
+    """Context manager to time a block of code as span name, see timing()."""
+    timer = _currentTimer.get()
+    if timer is None:
+        return _nullSpan
+    return _span(timer, name)
+
+
+def timed(name: Optional[str] = None):
+    """Decorator to time each call of a function as span name (default is function name)."""
+
+    def decorator(func):
+        spanName = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = _currentTimer.get()
+            if timer is None:
+                return func(*args, **kwargs)
+            startTime = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.record(spanName, time.perf_counter() - startTime)
+
+        return wrapper
+
+    return decorator
+
+
+class lapTimer:
+    """Time consecutive stages of one function, each lap() ends a stage.
+
+    Used when stages are too long to indent in span().
+    """
+
+    __slots__ = ("_timer", "_startTime")
+
+    def __init__(self):
+        self._timer = _currentTimer.get()
+        self._startTime = time.perf_counter() if self._timer is not None else None
+
+    def lap(self, name: str):
+        """Record time since the last lap (or creation) as span name."""
+        if self._timer is None:
+            return
+        now = time.perf_counter()
+        self._timer.record(name, now - self._startTime)
+        self._startTime = now
+
+
+def timedCall(func, *args, **kwargs):
+    """Call func with a new current timer.
+
+    Used for functions in a thread or process pool.
+
+    Returns:
+        (result of func, asDict() of the timer)
+    """
+    timer = perfTimer()
+    with timing(timer):
+        result = func(*args, **kwargs)
+    return result, timer.asDict()
+
+
+def setPerfLogFile(path: Optional[str]):
+    """Append timing of each spike detection to json lines file path, None to stop."""
+    global _perfLogFile
+    _perfLogFile = path
+
+
+def getPerfLogFile() -> Optional[str]:
+    return _perfLogFile
+
+
+def writePerfLog(record: dict):
+    """Append record as one json line to the perf log file, if set with setPerfLogFile()."""
+    path = _perfLogFile
+    if path is None:
+        return
+    record = dict(record, date=datetime.datetime.now().isoformat(timespec="seconds"))
+    try:
+        with _perfLogLock, open(path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+    except OSError as e:
+        logger.error(f'Did not write perf log "{path}": {e}')
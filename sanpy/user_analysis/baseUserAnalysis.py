@@ -7,7 +7,11 @@ import traceback  # to print call stack on exception
 import inspect
 from typing import List, Union
 
+import numpy as np
+
 import sanpy
+import sanpy.perfUtils
+import sanpy._util
 from sanpy import DO_KYMOGRAPH_ANALYSIS
 
 from sanpy.sanpyLogger import get_logger
@@ -36,22 +40,44 @@ def _module_from_file(module_name, file_path):
     return module
 
 
-def _getObjectList(verbose=True) -> List[dict]:
+_objectListCache = sanpy._util._folderCache()
+# list of dict, see _getObjectList()
+
+
+def _getObjectList(verbose=True, refresh: bool = False) -> List[dict]:
     """Return a list of classes defined in sanpy.userAnalysis.
 
     Each of these is an object we can (i) construct or (ii) interrogate static class members
 
+    User analysis is only discovered (and user files imported) once per process,
+    again when the user analysis folder or one of its files changes.
+
+    Parameters
+    ----------
+    refresh : bool
+        If True then discover user analysis even if it did not change.
+
     Returns
     -------
     list of dict
     """
+    userAnalysisFolder = sanpy._util._getUserAnalysisFolder()
+    objectList = _objectListCache.get(
+        userAnalysisFolder,
+        lambda: _discoverObjectList(userAnalysisFolder, verbose=verbose),
+        refresh=refresh,
+    )
+    return list(objectList)
+
+
+def _discoverObjectList(userAnalysisFolder: str, verbose=True) -> List[dict]:
+    """Import user analysis files and inspect sanpy.user_analysis, see _getObjectList()."""
 
     if verbose:
         logger.info("Loading user analysis plugins")
   
     #
     # user plugins from files in folder <user>/SanPy/analysis
-    userAnalysisFolder = sanpy._util._getUserAnalysisFolder()
     files = glob.glob(os.path.join(userAnalysisFolder, "*.py"))
 
     pluginDict = {}
@@ -154,21 +180,19 @@ def _getObjectList(verbose=True) -> List[dict]:
 def findUserAnalysisStats() -> List[dict]:
     """Get the stat names of all user defined analysis.
     
-    This is determined once at runtime. If files change, sanpy must be restarted.
+    This is determined once at runtime, again when user analysis files change.
     """
     userStatList: List[dict] = []
-    objList = _getObjectList()  # list of dict
+    objList = _getObjectList(verbose=False)  # list of dict
     for obj in objList:
         # sanpy._util.pprint(obj)
         # print('')
 
-        # instantiate the object
-        userObj = obj["constructor"](ba=None)
-
-        userObjStatDict = userObj._getUserStatDict()
+        # stats were defined when the object list was discovered
+        userObjStatDict = obj["staticStatDict"]
 
         for k, v in userObjStatDict.items():
-            oneUserStatDict = {k: v}
+            oneUserStatDict = {k: dict(v)}
             userStatList.append(oneUserStatDict)
 
     return userStatList
@@ -181,8 +205,8 @@ def runAllUserAnalysis(ba, verbose=False):
     Called at end of sanpy.bAnalysis.detect()
     """
 
-    # step through each
-    objList = _getObjectList()  # list of dict
+    # step through each, discovered once, not on every detection
+    objList = _getObjectList(verbose=False)  # list of dict
 
     if verbose:
         logger.info(f"objList: {objList}")
@@ -196,8 +220,9 @@ def runAllUserAnalysis(ba, verbose=False):
             # instantiate a user object
             userObj = obj["constructor"](ba)
 
-            # run the analysis
-            userObj.run()  # run the analysis and append to actual ba object
+            # run the analysis, timed in ba.perfReport
+            with sanpy.perfUtils.span(f"userAnalysis/{type(userObj).__name__}"):
+                userObj.run()  # run the analysis and append to actual ba object
         except Exception as e:
             logger.error(f"Exception in running user defined analysis: {e}")
             logger.error(traceback.format_exc())
@@ -341,8 +366,86 @@ class baseUserAnalysis:
                 f"spikeIdx {spikeIdx} is out of range, max value is {self.ba.numSpikes}"
             )
 
+    def setStatArray(self, theKey, values, spikeIdx=None) -> bool:
+        """Set the values of a key for all (or some) spikes at once.
+
+        Much faster than setSpikeValue() in a loop over spikes,
+        values are checked once and written as one column.
+
+        Parameters
+        ----------
+        theKey : str
+            Name of the user defined internal name (or an existing analysis result).
+        values : scalar, np.ndarray or list
+            One value per spike in spikeIdx, a scalar sets all of them.
+        spikeIdx : np.ndarray, list or None
+            Spike indices (0 based) or a bool mask, default is all spikes.
+
+        Returns
+        -------
+        bool
+            False if the key does not exist or values do not match spikeIdx.
+        """
+        userStatNames = [v["name"] for v in self._getUserStatDict().values()]
+        if theKey not in userStatNames and theKey not in self.ba.spikeDict.keys():
+            logger.error(f'User internal stat does not exist "{theKey}"')
+            return False
+
+        numSpikes = self.ba.numSpikes
+        if spikeIdx is not None:
+            spikeIdx = np.asarray(spikeIdx)
+            try:
+                numRows = len(np.arange(numSpikes)[spikeIdx])
+            except IndexError as e:
+                logger.error(
+                    f"spikeIdx is out of range, number of spikes is {numSpikes}: {e}"
+                )
+                return False
+        else:
+            numRows = numSpikes
+
+        if not np.isscalar(values) and len(values) != numRows:
+            logger.error(
+                f'"{theKey}" has {len(values)} values for {numRows} spikes'
+            )
+            return False
+
+        self.ba.spikeDict.setColumn(theKey, values, rowIdx=spikeIdx)
+        return True
+
+    def getStatArray(self, theKey, spikeIdx=None):
+        """Get the values of a key for all (or some) spikes as np.ndarray.
+
+        Parameters
+        ----------
+        theKey : str
+            Name of the analysis result defined internal name.
+        spikeIdx : np.ndarray, list or None
+            Spike indices (0 based) or a bool mask, default is all spikes.
+
+        Returns
+        -------
+        np.ndarray or None
+            None if theKey is not a key in analysis results.
+        """
+        if spikeIdx is not None:
+            spikeIdx = np.asarray(spikeIdx)
+        try:
+            return self.ba.spikeDict.getValues(theKey, rowIdx=spikeIdx)
+        except KeyError:
+            logger.error(f'User internal stat does not exist "{theKey}"')
+        except IndexError:
+            logger.error(
+                f"spikeIdx is out of range, number of spikes is {self.ba.numSpikes}"
+            )
+        return None
+
     def run(self):
-        """Run user analysis. Calculate values for each new user stat."""
+        """Run user analysis. Calculate values for each new user stat.
+
+        The time of run() is in ba.perfReport, time stages within it with
+        sanpy.perfUtils.span() or sanpy.perfUtils.timed().
+        """
 
 
 if __name__ == "__main__":
@@ -60,55 +60,54 @@ class kymUserAnalysis(baseUserAnalysis):
         #         logger.warning(f'ba spike {spikeIdx} is not in pairedSpikeList:{pairedSpikeList}')
         #         continue
         
-        for _tmpIdx, spikeIdx in enumerate(pairedSpikeList):
-            # spikeIdx is index into ba spike dict
+        if len(pairedSpikeList) == 0:
+            return
 
-            diamSpikeIdx = _tmpIdx
-            
-            k_diam_foot_pnt = dResultDict['diamSpikeTimes'][diamSpikeIdx]
-            k_diam_foot_sec = self.ba.fileLoader.pnt2Sec_(k_diam_foot_pnt)
-            k_diam_foot = filteredDiam[k_diam_foot_pnt]
+        # spikeIdx is index into ba spike dict, one per diameter spike
+        spikeIdx = np.asarray(pairedSpikeList, dtype=int)
 
-            k_diam_peak_pnt = dResultDict['diamPeakPnts'][diamSpikeIdx]
-            k_diam_peak_sec = self.ba.fileLoader.pnt2Sec_(k_diam_peak_pnt)
-            k_diam_peak = filteredDiam[k_diam_peak_pnt]
+        k_diam_foot_pnt = np.asarray(dResultDict['diamSpikeTimes'], dtype=int)
+        k_diam_foot_sec = self.ba.fileLoader.pnt2Sec_(k_diam_foot_pnt)
+        k_diam_foot = filteredDiam[k_diam_foot_pnt]
 
-            k_diam_time_to_peak_sec = k_diam_peak_sec - k_diam_foot_sec
-            k_diam_amp = k_diam_peak - k_diam_foot  # may be reversed +/-
+        k_diam_peak_pnt = np.asarray(dResultDict['diamPeakPnts'], dtype=int)
+        k_diam_peak_sec = self.ba.fileLoader.pnt2Sec_(k_diam_peak_pnt)
+        k_diam_peak = filteredDiam[k_diam_peak_pnt]
 
-            k_fit_m = dResultDict['fit_tau_sec'][diamSpikeIdx]
-            k_fit_tau = dResultDict['fit_tau_sec'][diamSpikeIdx]
-            k_fit_b = dResultDict['fit_tau_sec'][diamSpikeIdx]
+        k_diam_time_to_peak_sec = k_diam_peak_sec - k_diam_foot_sec
+        k_diam_amp = k_diam_peak - k_diam_foot  # may be reversed +/-
 
-            k_diam_tau_sec = dResultDict['fit_tau_sec'][diamSpikeIdx]
-            k_diam_fit_r2 = dResultDict['fit_r2'][diamSpikeIdx]
+        # fit is None when it failed
+        fit_tau_sec = np.asarray(dResultDict['fit_tau_sec'], dtype=float)
+        k_fit_m = fit_tau_sec
+        k_fit_tau = fit_tau_sec
+        k_fit_b = fit_tau_sec
 
-            # logger.info(f'ba spike {spikeIdx} k_diam_foot_sec:{k_diam_foot_sec} k_diam_foot:{k_diam_foot}')
-            # logger.info(f'    k_diam_peak_sec:{k_diam_peak_sec} k_diam_peak:{k_diam_peak}')
-            
-            # set values in main ba
-            self.setSpikeValue(spikeIdx, "k_diam_foot", k_diam_foot)
-            self.setSpikeValue(spikeIdx, "k_diam_foot_pnt", k_diam_foot_pnt)
-            self.setSpikeValue(spikeIdx, "k_diam_foot_sec", k_diam_foot_sec)
-            # peak
-            self.setSpikeValue(spikeIdx, "k_diam_peak", k_diam_peak)
-            # logger.info(f'                                                           spikeIdx:{spikeIdx} k_diam_peak_pnt:{k_diam_peak_pnt}')
-            self.setSpikeValue(spikeIdx, "k_diam_peak_pnt", k_diam_peak_pnt)
-            self.setSpikeValue(spikeIdx, "k_diam_peak_sec", k_diam_peak_sec)
-            # summary
-            self.setSpikeValue(spikeIdx, "k_diam_time_to_peak_sec", k_diam_time_to_peak_sec)
-            self.setSpikeValue(spikeIdx, "k_diam_amp", k_diam_amp)
+        k_diam_tau_sec = fit_tau_sec
+        k_diam_fit_r2 = np.asarray(dResultDict['fit_r2'], dtype=float)
 
-            # percent change in diameter from foot to peak
-            k_diam_percent = round( k_diam_peak / k_diam_foot * 100, 3)
-            self.setSpikeValue(spikeIdx, "k_diam_percent", k_diam_percent)
+        # percent change in diameter from foot to peak
+        k_diam_percent = np.round(k_diam_peak / k_diam_foot * 100, 3)
+
+        # set values in main ba, one column per stat
+        self.setStatArray("k_diam_foot", k_diam_foot, spikeIdx)
+        self.setStatArray("k_diam_foot_pnt", k_diam_foot_pnt, spikeIdx)
+        self.setStatArray("k_diam_foot_sec", k_diam_foot_sec, spikeIdx)
+        # peak
+        self.setStatArray("k_diam_peak", k_diam_peak, spikeIdx)
+        self.setStatArray("k_diam_peak_pnt", k_diam_peak_pnt, spikeIdx)
+        self.setStatArray("k_diam_peak_sec", k_diam_peak_sec, spikeIdx)
+        # summary
+        self.setStatArray("k_diam_time_to_peak_sec", k_diam_time_to_peak_sec, spikeIdx)
+        self.setStatArray("k_diam_amp", k_diam_amp, spikeIdx)
+        self.setStatArray("k_diam_percent", k_diam_percent, spikeIdx)
 
-            self.setSpikeValue(spikeIdx, "k_fit_m", k_fit_m)
-            self.setSpikeValue(spikeIdx, "k_fit_tau", k_fit_tau)
-            self.setSpikeValue(spikeIdx, "k_fit_b", k_fit_b)
+        self.setStatArray("k_fit_m", k_fit_m, spikeIdx)
+        self.setStatArray("k_fit_tau", k_fit_tau, spikeIdx)
+        self.setStatArray("k_fit_b", k_fit_b, spikeIdx)
 
-            self.setSpikeValue(spikeIdx, "k_diam_tau_sec", k_diam_tau_sec)
-            self.setSpikeValue(spikeIdx, "k_diam_fit_r2", k_diam_fit_r2)
+        self.setStatArray("k_diam_tau_sec", k_diam_tau_sec, spikeIdx)
+        self.setStatArray("k_diam_fit_r2", k_diam_fit_r2, spikeIdx)
 
     def run(self):
         if not self.ba.fileLoader.isKymograph:
@@ -0,0 +1,19 @@
+import os
+import shutil
+
+import pytest
+
+from sanpy.interface.sanpy_app import SanPyApp
+
+# this makes qapp be our SanPyApp, it is derived from QApplication
+@pytest.fixture(scope="session")
+def qapp_cls():
+    return SanPyApp
+
+@pytest.fixture
+def dataFolder(tmp_path):
+    """Copy of the recordings in data/ so tests do not write into the repo."""
+    for file in os.listdir('data'):
+        if os.path.isfile(os.path.join('data', file)):
+            shutil.copy(os.path.join('data', file), tmp_path)
+    return str(tmp_path)
@@ -0,0 +1,21 @@
+import sanpy
+from sanpy.interface.detectionWorker import detectionWorker
+
+def test_detection_worker(qtbot):
+    """Detection in the worker thread only changes the analysis once results are set."""
+    path = 'data/19114001.abf'
+    dDict = sanpy.bDetection().getDetectionDict('SA Node')
+    ba = sanpy.bAnalysis(path)
+
+    worker = detectionWorker(ba, dDict)
+    with qtbot.waitSignal(worker.signalDetectResults, timeout=60000) as blocker:
+        worker.start()
+    worker.wait()
+    _ba, detectResults = blocker.args
+    assert _ba is ba
+    assert ba.numSpikes == 0
+
+    ba.setSpikeDetectResults(detectResults)
+    baSync = sanpy.bAnalysis(path)
+    baSync.spikeDetect(dDict)
+    assert ba.numSpikes == baSync.numSpikes > 0
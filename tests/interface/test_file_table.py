@@ -0,0 +1,70 @@
+import math
+
+from PyQt5 import QtCore
+
+import sanpy
+from sanpy.interface.bFileTable import pandasModel
+from sanpy.interface.bTableView import bTableView
+from sanpy.interface.detectionWorker import detectionWorker
+
+def test_file_table_model(qtbot, dataFolder):
+    """The model shows the analysisDir table and refreshes rows that change."""
+    ad = sanpy.analysisDir(dataFolder)
+    model = pandasModel(ad)
+    df = ad.getDataFrame()
+    assert model.rowCount() == len(df)
+
+    fileColumn = ad.columns.index('File')
+    durColumn = ad.columns.index('Dur(s)')
+    for row in range(model.rowCount()):
+        assert model.data(model.index(row, fileColumn)) == df['File'].iloc[row]
+        durSec = df['Dur(s)'].iloc[row]
+        assert model.data(model.index(row, durColumn)) == ('' if math.isnan(durSec) else durSec)
+
+    # loading a file shows it as loaded
+    loadedColumn = ad.columns.index('L')
+    loadedIndex = model.index(0, loadedColumn)
+    assert not model.data(loadedIndex, QtCore.Qt.FontRole).isValid()
+    ad.getAnalysis(0)
+    model.myUpdateLoadedAnalyzed(None, 0)
+    assert model.data(loadedIndex) == ad.loc[ad.index[0], 'L'] != ''
+    assert model.data(loadedIndex, QtCore.Qt.FontRole).isValid()
+
+    # loading another file only refreshes its row, the snapshot is not rebuilt
+    tableGeneration = ad.tableGeneration
+    displayColumns = model._displayColumns
+    ad.getAnalysis(1)
+    assert model.data(model.index(1, loadedColumn)) == ad.loc[ad.index[1], 'L'] != ''
+    assert ad.tableGeneration == tableGeneration
+    assert model._displayColumns is displayColumns
+
+    # sorting changes row order
+    model.sort(fileColumn, QtCore.Qt.DescendingOrder)
+    files = [model.data(model.index(row, fileColumn)) for row in range(model.rowCount())]
+    assert files == sorted(files, reverse=True)
+
+def test_detect_refreshes_analysis_row(qtbot, dataFolder):
+    """Detection in the background refreshes the row of its analysis, not the selected row."""
+    ad = sanpy.analysisDir(dataFolder)
+    model = pandasModel(ad)
+    tableView = bTableView(model)
+    qtbot.addWidget(tableView)
+
+    tableView.selectRow(0)
+    ba = ad.getAnalysis(0)
+    worker = detectionWorker(ba, sanpy.bDetection().getDetectionDict('SA Node'))
+    with qtbot.waitSignal(worker.signalDetectResults, timeout=60000) as blocker:
+        worker.start()
+        # user selects another file before detection is done
+        tableView.selectRow(1)
+        ad.getAnalysis(1)
+    worker.wait()
+    ba.setSpikeDetectResults(blocker.args[1])
+    tableView.slot_detect(ba)
+
+    numColumn = ad.columns.index('N')
+    analyzedColumn = ad.columns.index('A')
+    assert ba.numSpikes > 0
+    assert model.data(model.index(0, numColumn)) == ba.numSpikes
+    assert model.data(model.index(0, analyzedColumn)) != ''
+    assert model.data(model.index(1, analyzedColumn)) == ''
@@ -0,0 +1,34 @@
+import numpy as np
+
+from sanpy.interface.minMaxPyramid import minMaxPyramid
+
+def test_min_max_pyramid():
+    """Every level keeps the peaks and plots about 2 points per pixel."""
+    numPoints = 200000
+    x = np.arange(numPoints) / 10000
+    y = np.random.default_rng(0).normal(size=numPoints)
+    peaks = [5, 12345, numPoints - 1]
+    y[peaks] = 50
+    y[100:200] = np.nan
+
+    pyramid = minMaxPyramid(x, y)
+    assert pyramid.numLevels > 2
+    for level in range(pyramid.numLevels):
+        levelX, levelY = pyramid.getLevel(level)
+        assert len(levelX) == len(levelY)
+        assert np.sum(levelY == 50) == len(peaks)
+
+        # slices of a level are the same as slicing the level
+        sliceX, sliceY = pyramid.getLevel(level, 3, 14)
+        np.testing.assert_array_equal(sliceX, levelX[3:14])
+        np.testing.assert_array_equal(sliceY, levelY[3:14])
+
+    # zoomed in, all points
+    plotX, plotY = pyramid.getData(1, 1.01, numPixels=500)
+    assert plotX[0] <= 1 and plotX[-1] >= 1.01
+    np.testing.assert_array_equal(plotY, y[(x >= plotX[0]) & (x <= plotX[-1])])
+
+    # zoomed out, a coarse level
+    plotX, plotY = pyramid.getData(numPixels=500)
+    assert len(plotX) <= 2 * 500 * 2
+    assert np.nanmax(plotY) == 50
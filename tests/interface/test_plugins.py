@@ -1,19 +1,12 @@
 import os
 import sys
-import pytest
 
 import sanpy
-from sanpy.interface.sanpy_app import SanPyApp
 from sanpy.interface.sanpy_window import SanPyWindow
 
 from sanpy.sanpyLogger import get_logger
 logger = get_logger(__name__)
 
-# this makes qapp be our SanPyApp, it is derived from QApplication
-@pytest.fixture(scope="session")
-def qapp_cls():
-    return SanPyApp
-
 # @pytest.fixture
 # def sanpyAppObject(qtbot):
 #     return SanPyWindow()
@@ -108,12 +101,12 @@ def _test_app(qtbot, qapp):
     # _scatterPlugin.close()
     # _scatterPlugin = None
 
-def test_analysisdir_tableview(qtbot, qapp):
+def test_analysisdir_tableview(qtbot, qapp, dataFolder):
     logger.info('')
 
     #
     # analysis dir    
-    folderPath = 'data'
+    folderPath = dataFolder
     _analysisDir = sanpy.analysisDir(folderPath)
     _model = sanpy.interface.bFileTable.pandasModel(_analysisDir)
     
@@ -125,14 +118,14 @@ def test_analysisdir_tableview(qtbot, qapp):
     _selectedRow = 1
     _tableView._onLeftClick(_selectedRow)
 
-def test_plugins(qtbot, qapp):
+def test_plugins(qtbot, qapp, dataFolder):
     """Run all plugins through a number of different tests.
     """
     logger.info('')
 
     # sanpyAppObject = SanPyApp(sys.argv)
     
-    path = os.path.join('data', '19114001.abf')
+    path = os.path.join(dataFolder, '19114001.abf')
     sanpyWindowObject = SanPyWindow(qapp, path=path)
 
     if 1:
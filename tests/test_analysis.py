@@ -9,8 +9,12 @@ python -m unittest sanpy/tests/test_analysis.py
 """
 
 import os, shutil, tempfile
+import threading
+import json
 import unittest
 
+import numpy as np
+
 import sanpy
 
 import logging
@@ -53,5 +57,189 @@ class Test_Analysis(unittest.TestCase):
 
         self.assertEqual(len(thresholdSec), self.expectedNumSpikes) # expecting 102 spikes
 
+    def test_3_legacy_detect(self):
+        """Vectorized and legacy (per-spike loop) detection give the same results."""
+        logger.info('RUNNING')
+        dDict = sanpy.bDetection().getDetectionDict('SA Node')
+        baLegacy = sanpy.bAnalysis(self.path)
+        baLegacy.spikeDetect(dDict, legacy=True)
+
+        self.assertEqual(baLegacy.numSpikes, self.expectedNumSpikes)
+        self.assertEqual(len(baLegacy.dfError), self.expectedNumErrors)
+
+        for stat in ['thresholdPnt', 'peakPnt', 'preMinPnt', 'earlyDiastolicDurationRate',
+                     'postSpike_dvdt_min_pnt', 'cycleLength_ms', 'widths_50']:
+            np.testing.assert_allclose(baLegacy.getStat(stat),
+                                       self.ba.getStat(stat),
+                                       rtol=1e-9,
+                                       err_msg=stat)
+        self.assertEqual(list(baLegacy.dfError['Details']), list(self.ba.dfError['Details']))
+
+    def test_4_stat_sweep_epoch(self):
+        logger.info('RUNNING')
+        epochs = self.ba.getStat('epoch', asArray=True)
+        epoch = epochs[0]
+        thresholdSec = self.ba.getStat('thresholdSec', sweepNumber=0, epochNumber=epoch)
+        self.assertEqual(len(thresholdSec), np.sum(epochs == epoch))
+
+        # full list is all spikes with nan outside of the epoch
+        fullList = self.ba.getStat('thresholdSec', epochNumber=epoch+1, getFullList=True)
+        self.assertEqual(len(fullList), self.expectedNumSpikes)
+        self.assertEqual(np.sum(~np.isnan(fullList)), np.sum(epochs == epoch+1))
+        self.assertEqual(len(self.ba.getStat('thresholdSec')), self.expectedNumSpikes)
+        self.assertFalse(np.isnan(self.ba.getStat('thresholdSec')).any())
+
+    def test_5_sweep_workers(self):
+        """Detecting sweeps in a pool gives the same results, in sweep order."""
+        logger.info('RUNNING')
+        path = 'data/2021_07_20_0010.abf'  # multiple sweeps
+        dDict = sanpy.bDetection().getDetectionDict('Fast Neuron')
+        baSerial = sanpy.bAnalysis(path)
+        baSerial.spikeDetect(dDict)
+        baPool = sanpy.bAnalysis(path)
+        baPool.spikeDetect(dDict, workers=4)
+
+        self.assertEqual(baPool.numSpikes, baSerial.numSpikes)
+        for stat in ['sweep', 'spikeNumber', 'thresholdPnt', 'widths_50']:
+            np.testing.assert_array_equal(baPool.getStat(stat), baSerial.getStat(stat), err_msg=stat)
+
+    def test_6_chunked_detect(self):
+        """Detecting in blocks of points gives the same results as whole sweeps."""
+        logger.info('RUNNING')
+        dDict = sanpy.bDetection().getDetectionDict('SA Node')
+        baChunked = sanpy.bAnalysis(self.path, lazy=True)
+        baChunked.spikeDetect(dDict, chunkSize=10000)
+
+        self.assertEqual(baChunked.numSpikes, self.expectedNumSpikes)
+        self.assertEqual(list(baChunked.dfError['Details']), list(self.ba.dfError['Details']))
+        for stat in ['thresholdPnt', 'peakPnt', 'preMinPnt', 'earlyDiastolicDurationRate',
+                     'isi_ms', 'cycleLength_ms', 'widths_50']:
+            np.testing.assert_array_equal(baChunked.getStat(stat), self.ba.getStat(stat), err_msg=stat)
+
+    def test_7_spike_clips(self):
+        """Spike clips are the recording around each spike threshold."""
+        logger.info('RUNNING')
+        theseClips, theseClips_x, meanClip = self.ba.getSpikeClips(None, None,
+                                                                   preSpikeClipWidth_ms=10,
+                                                                   postSpikeClipWidth_ms=50)
+        prePnts = self.ba.fileLoader.ms2Pnt_(10)
+        postPnts = self.ba.fileLoader.ms2Pnt_(50)
+        self.assertEqual(theseClips.shape, (self.expectedNumSpikes, prePnts + postPnts))
+        self.assertEqual(theseClips_x.shape, theseClips.shape)
+        self.assertEqual(theseClips_x[0, prePnts], 0)
+
+        sweepY = self.ba.fileLoader.sweepY_filtered
+        for idx, spikeTime in enumerate(self.ba.getSpikeTimes()):
+            np.testing.assert_array_equal(theseClips[idx], sweepY[spikeTime-prePnts:spikeTime+postPnts])
+        np.testing.assert_allclose(meanClip, np.mean(theseClips, axis=0))
+
+        # standard deviation of the clips is the same as for each point of a clip
+        _, _, _, stdClip = self.ba.getSpikeClips(None, None, preSpikeClipWidth_ms=10,
+                                                 postSpikeClipWidth_ms=50, returnStd=True)
+        loopStd = [np.std([clip[pnt] for clip in theseClips]) for pnt in range(theseClips.shape[1])]
+        np.testing.assert_allclose(stdClip, loopStd)
+
+        # clips are skipped if they do not fit in the recording
+        theseClips, _, _ = self.ba.getSpikeClips(None, None, spikeSelection=[0, 1],
+                                                 preSpikeClipWidth_ms=500,
+                                                 postSpikeClipWidth_ms=50)
+        self.assertEqual(len(theseClips), 1)
+
+    def test_8_perf_report(self):
+        """Seconds in each detection stage are in perfReport and the perf log."""
+        logger.info('RUNNING')
+        dDict = sanpy.bDetection().getDetectionDict('SA Node')
+        ba = sanpy.bAnalysis(self.path)
+        with tempfile.TemporaryDirectory() as tmpDir:
+            perfLogFile = os.path.join(tmpDir, 'perf.jsonl')
+            sanpy.perfUtils.setPerfLogFile(perfLogFile)
+            try:
+                ba.spikeDetect(dDict, workers=2)
+                ba.spikeDetect(dDict)
+            finally:
+                sanpy.perfUtils.setPerfLogFile(None)
+            with open(perfLogFile) as f:
+                perfLog = [json.loads(line) for line in f]
+
+        perfReport = ba.perfReport
+        for stage in ['load', 'threshold', 'refractory', 'peak', 'mdp', 'halfWidth', 'results', 'detect']:
+            self.assertIn(stage, perfReport)
+        # only the last detection
+        self.assertEqual(perfReport['detect']['count'], 1)
+        self.assertEqual(perfReport['peak']['count'], ba.fileLoader.numSweeps)
+        self.assertEqual(perfReport['refractory']['count'], ba.fileLoader.numSweeps)
+
+        self.assertEqual(len(perfLog), 2)
+        self.assertEqual(perfLog[0]['numSpikes'], self.expectedNumSpikes)
+        self.assertEqual(perfLog[-1]['perfReport'], perfReport)
+
+    def test_9_detect_progress_cancel(self):
+        """Progress is reported per sweep and a cancelled detection does not change the analysis or its file loader."""
+        logger.info('RUNNING')
+        path = 'data/2021_07_20_0010.abf'  # multiple sweeps
+        dDict = sanpy.bDetection().getDetectionDict('Fast Neuron')
+        ba = sanpy.bAnalysis(path)
+        progress = []
+        self.assertTrue(ba.spikeDetect(dDict, progressCallback=lambda *args: progress.append(args)))
+        numSweeps = ba.fileLoader.numSweeps
+        self.assertEqual(progress, [(i, numSweeps) for i in range(1, numSweeps + 1)])
+        numSpikes = ba.numSpikes
+        filteredY = ba.fileLoader.sweepY_filtered.copy()
+        filteredDeriv = ba.fileLoader.filteredDeriv.copy()
+
+        # cancel after the first sweep, the recording is not filtered with the new parameters
+        cancelEvent = threading.Event()
+        dDict = dict(dDict, dvdtThreshold=1000, medianFilter=5)
+        for legacy in [False, True]:
+            isDetected = ba.spikeDetect(dDict, workers=2, cancelEvent=cancelEvent, legacy=legacy,
+                                        progressCallback=lambda *args: cancelEvent.set())
+            self.assertFalse(isDetected)
+            self.assertEqual(ba.numSpikes, numSpikes)
+            self.assertNotEqual(ba.getDetectionDict()['dvdtThreshold'], 1000)
+            self.assertEqual(ba.fileLoader.currentSweep, 0)
+            np.testing.assert_array_equal(ba.fileLoader.sweepY_filtered, filteredY)
+            np.testing.assert_array_equal(ba.fileLoader.filteredDeriv, filteredDeriv)
+            cancelEvent.clear()
+
+        # filtered with the new parameters once the results are set
+        self.assertTrue(ba.spikeDetect(dDict))
+        self.assertFalse(np.array_equal(ba.fileLoader.sweepY_filtered, filteredY))
+
+    def test_10_user_stat_array(self):
+        """User analysis sets and gets whole stat columns, plugins are discovered once."""
+        logger.info('RUNNING')
+        baseUserAnalysis = sanpy.user_analysis.baseUserAnalysis
+
+        class userStatArray(baseUserAnalysis.baseUserAnalysis):
+            def defineUserStats(self):
+                self.addUserStat('User Peak Height (mV)', 'user_peakHeight')
+
+        # own analysis, do not add a user stat to self.ba
+        ba = sanpy.bAnalysis(self.path)
+        ba.spikeDetect(sanpy.bDetection().getDetectionDict('SA Node'))
+        userObj = userStatArray(ba)
+        peakHeight = ba.getStat('peakVal', asArray=True) - ba.getStat('thresholdVal', asArray=True)
+        self.assertTrue(userObj.setStatArray('user_peakHeight', peakHeight))
+        np.testing.assert_array_equal(userObj.getStatArray('user_peakHeight'), peakHeight)
+        self.assertEqual(userObj.getSpikeValue(3, 'user_peakHeight'), peakHeight[3])
+
+        spikeIdx = [0, 2]
+        self.assertTrue(userObj.setStatArray('user_peakHeight', [-1, -2], spikeIdx))
+        np.testing.assert_array_equal(userObj.getStatArray('user_peakHeight', spikeIdx), [-1, -2])
+        self.assertEqual(userObj.getSpikeValue(1, 'user_peakHeight'), peakHeight[1])
+
+        # values are checked once, nothing is set
+        self.assertFalse(userObj.setStatArray('user_peakHeight', peakHeight[:-1]))
+        self.assertFalse(userObj.setStatArray('user_notDefined', peakHeight))
+        self.assertIsNone(userObj.getStatArray('user_notDefined'))
+        self.assertEqual(userObj.getStatArray('user_peakHeight')[0], -1)
+
+        objList = baseUserAnalysis._getObjectList(verbose=False)
+        cachedObjList = baseUserAnalysis._objectListCache.value
+        self.assertEqual(baseUserAnalysis._getObjectList(verbose=False), objList)
+        self.assertIs(baseUserAnalysis._objectListCache.value, cachedObjList)
+        baseUserAnalysis._getObjectList(verbose=False, refresh=True)
+        self.assertIsNot(baseUserAnalysis._objectListCache.value, cachedObjList)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,21 @@
 import os
+import shutil
+
+import pytest
 
 import sanpy
 from sanpy.sanpyLogger import get_logger
 logger = get_logger(__name__)
 
-def test_dir():
-	path = os.path.join('data')
+def _copyData(tmp_path):
+	"""Copy recordings in data/ so tests do not write into the repo."""
+	for file in os.listdir('data'):
+		if os.path.isfile(os.path.join('data', file)):
+			shutil.copy(os.path.join('data', file), tmp_path)
+
+def test_dir(tmp_path):
+	_copyData(tmp_path)
+	path = str(tmp_path)
 	autoLoad = False
 	ad = sanpy.analysisDir(path=path, autoLoad=autoLoad, folderDepth=1)
 
@@ -17,13 +27,177 @@ def test_dir():
 		ba = ad.getAnalysis(rowIdx)
 		print(ba)
 
-def test_file():
-	filePath = os.path.join('data', '2021_07_20_0010.abf')
+def test_file(tmp_path):
+	_copyData(tmp_path)
+	filePath = os.path.join(str(tmp_path), '2021_07_20_0010.abf')
 	autoLoad = False
-	ad = sanpy.analysisDir(path=filePath, autoLoad=autoLoad, folderDepth=1)
+	ad = sanpy.analysisDir(path=filePath, autoLoad=autoLoad, folderDepth=1, useHeaderIndex=False)
 
 	assert ad is not None
+	# nothing is written in the folder
+	assert not os.path.isfile(tmp_path / ad.headerIndexFile)
+	assert ad.loadHeaderIndex() == {}
 	
+def test_header_index(tmp_path):
+	for file in ['19114001.abf', '2021_07_20_0010.abf']:
+		shutil.copy(os.path.join('data', file), tmp_path)
+	ad = sanpy.analysisDir(path=str(tmp_path), folderDepth=1)
+	headerIndex = ad.loadHeaderIndex()
+	assert len(headerIndex) == 2
+
+	# unchanged files are not loaded again
+	probed = []
+	getFileRow = ad.getFileRow
+	def _getFileRow(path, loadData=False):
+		probed.append(os.path.split(path)[1])
+		return getFileRow(path, loadData=loadData)
+	ad.getFileRow = _getFileRow
+	df = ad.loadFolder()
+	assert probed == []
+	assert list(df['Sweeps']) == list(ad.getDataFrame()['Sweeps'])
+
+	# modified file is loaded again
+	os.utime(tmp_path / '19114001.abf', ns=(0, 0))
+	ad.loadFolder()
+	assert probed == ['19114001.abf']
+
+def test_unload_closes_file(tmp_path):
+	shutil.copy(os.path.join('data', '19114001.abf'), tmp_path)
+	ad = sanpy.analysisDir(path=str(tmp_path), folderDepth=1, lazy=True)
+	ba = ad.getAnalysis(0)
+	assert ba.fileLoader._memmap['data'] is not None
+
+	# the abf is not left open (locked on Windows) after the row is unloaded
+	ad.unloadRow(0)
+	assert ba.fileLoader._memmap['data'] is None
+
+def test_detect_all(tmp_path):
+	files = ['19114001.abf', '2021_07_20_0010.abf', '19114000.abf']
+	for file in files:
+		shutil.copy(os.path.join('data', file), tmp_path)
+	ad = sanpy.analysisDir(path=str(tmp_path), folderDepth=1)
+	dDict = sanpy.bDetection().getDetectionDict('SA Node')
+
+	# a bad file does not stop the batch
+	badRow = list(ad.getDataFrame()['File']).index('19114000.abf')
+	with open(tmp_path / '19114000.abf', 'wb') as f:
+		f.write(b'not an abf file')
+	errorDict = ad.detectAll(dDict, workers=2, verbose=False)
+	assert list(errorDict.keys()) == [badRow]
+
+	for rowIdx, file in enumerate(ad.getDataFrame()['File']):
+		if rowIdx == badRow:
+			assert not ad.isAnalyzed(rowIdx)
+			continue
+		baSerial = sanpy.bAnalysis(os.path.join('data', file))
+		baSerial.spikeDetect(dDict)
+
+		# results are attached without holding the raw recording
+		ba = ad.getDataFrame().loc[rowIdx, '_ba']
+		assert ba.fileLoader.sweepY_filtered is None
+		assert ad.isAnalyzed(rowIdx) and ba.isDirty()
+		assert ba.dateAnalyzed == baSerial.dateAnalyzed
+		assert ba.numSpikes == baSerial.numSpikes
+		for stat in ['sweep', 'thresholdPnt', 'peakPnt', 'widths_50']:
+			assert ba.getStat(stat) == baSerial.getStat(stat)
+
+		# filtered when used
+		ba = ad.getAnalysis(rowIdx)
+		assert (ba.fileLoader.sweepY_filtered == baSerial.fileLoader.sweepY_filtered).all()
+
+def test_pool_cache(tmp_path):
+	shutil.copy(os.path.join('data', '19114001.abf'), tmp_path)
+	ad = sanpy.analysisDir(path=str(tmp_path), folderDepth=1, persistPool=True)
+	ba = ad.getAnalysis(0, allowAutoLoad=True)
+	ba.spikeDetect(sanpy.bDetection().getDetectionDict('SA Node'))
+
+	masterDf = ad.pool_build()
+	assert len(masterDf) == ba.numSpikes
+	poolDf = ad._poolCache[ba.uuid]['df']
+
+	# analysis did not change, file is not pooled again
+	assert ad.pool_build()['thresholdSec'].equals(masterDf['thresholdSec'])
+	assert ad._poolCache[ba.uuid]['df'] is poolDf
+
+	# analysis changed, file is pooled again
+	ba._setDetectionDirty()
+	ad.pool_build()
+	assert ad._poolCache[ba.uuid]['df'] is not poolDf
+
+	# saved files are pooled without loading them
+	saveDict = ad.saveHdf()
+	assert saveDict['numSaved'] == 1 and saveDict['bytesWritten'] > 0
+	keyBytes = sanpy.h5Util.getKeyBytes(os.path.join(tmp_path, 'sanpy_recording_db.h5'), [ba.uuid])
+	assert 0 < keyBytes[ba.uuid] <= saveDict['bytesWritten']
+	ad2 = sanpy.analysisDir(path=str(tmp_path), folderDepth=1, persistPool=True)
+	masterDf2 = ad2.pool_build()
+	assert ad2.getDataFrame().loc[0, '_ba'] is None
+	assert masterDf2['thresholdSec'].equals(masterDf['thresholdSec'])
+
+def test_repack(tmp_path):
+	shutil.copy(os.path.join('data', '19114001.abf'), tmp_path)
+	hdfPath = os.path.join(tmp_path, 'sanpy_recording_db.h5')
+	ad = sanpy.analysisDir(path=str(tmp_path), folderDepth=1)
+	ba = ad.getAnalysis(0)
+	ba.spikeDetect(sanpy.bDetection().getDetectionDict('SA Node'))
+
+	# saving again does not leave dead space, file is not repacked
+	assert not ad.saveHdf()['repacked']
+	assert not ad.saveHdf()['repacked']
+	assert sanpy.h5Util.getUnusedBytes(hdfPath) < sanpy.h5Util._repackMinBytes
+	assert not sanpy.h5Util.repackIfFragmented(hdfPath, threshold=0.0)
+
+	# removed analysis is dead space until repacked
+	keyBytes = sanpy.h5Util.getKeyBytes(hdfPath, [ba.uuid])[ba.uuid]
+	fileBytes = os.path.getsize(hdfPath)
+	ad._deleteFromHdf(ba.uuid)
+	assert sanpy.h5Util.getUnusedBytes(hdfPath) >= keyBytes
+	assert sanpy.h5Util.repackIfFragmented(hdfPath)
+	assert os.path.getsize(hdfPath) <= fileBytes - keyBytes
+	assert sanpy.h5Util.getUnusedBytes(hdfPath) < sanpy.h5Util._repackMinBytes
+
+def test_prefetch(tmp_path):
+	for file in ['19114001.abf', '2021_07_20_0010.abf', '19114000.abf']:
+		shutil.copy(os.path.join('data', file), tmp_path)
+	ad = sanpy.analysisDir(path=str(tmp_path), folderDepth=1, prefetchFiles=1)
+	ad.getAnalysis(0)
+	ad.prefetch(0)
+
+	# the neighbour of row 0 was prefetched, rows 0 and 2 were not
+	ba = ad.getAnalysis(1)
+	assert ba is not None and not ba.loadError
+	ad.getAnalysis(2)
+	prefetchStats = ad.getPrefetchStats()
+	assert (prefetchStats['numHits'], prefetchStats['numMisses']) == (1, 2)
+
+def test_memory_budget(tmp_path):
+	files = ['19114001.abf', '2021_07_20_0010.abf', '19114000.abf']
+	for file in files:
+		shutil.copy(os.path.join('data', file), tmp_path)
+	ad = sanpy.analysisDir(path=str(tmp_path), folderDepth=1, memoryBudgetBytes=1)
+	dDict = sanpy.bDetection().getDetectionDict('SA Node')
+
+	# dirty analysis is not unloaded
+	ba0 = ad.getAnalysis(0)
+	ba0.spikeDetect(dDict)
+	ad.getAnalysis(1)
+	assert ad.isLoaded(0) and ad.isLoaded(1)
+
+	# saved analysis is unloaded, the table still shows it is analyzed
+	ad.saveHdf()
+	ad.getAnalysis(2)
+	assert not ad.isLoaded(0) and not ad.isLoaded(1) and ad.isLoaded(2)
+	assert ad.isAnalyzed(0) and ad.isSaved(0)
+	assert ad.getDataFrame().loc[0, 'A'] != ''
+
+	# analysis still in use is used again
+	assert ad.getAnalysis(0) is ba0
+	del ba0
+	ad.getAnalysis(1)
+
+	# otherwise loaded again from the h5 file
+	ba0 = ad.getAnalysis(0)
+	assert ba0.numSpikes > 0 and not ba0.isDirty()
+
 if __name__ == '__main__':
-	test_dir()
-	test_file()
+	pytest.main([__file__])
@@ -0,0 +1,44 @@
+import numpy as np
+
+from sanpy.bAnalysisResults import analysisResultList
+
+def test_analysisResultList():
+    arl = analysisResultList()
+    assert len(arl) == 0
+
+    arl.appendDefault(3)
+    assert len(arl) == 3
+
+    arl.setColumn('sweep', np.array([0, 0, 1]))
+    arl.setColumn('peakVal', np.array([10.0, 20.0, 30.0]))
+
+    # column access and row views see the same values
+    assert list(arl.getValues('sweep')) == [0, 0, 1]
+    assert arl[1]['peakVal'] == 20.0
+    arl[1]['peakVal'] = 25.0
+    assert arl.getColumn('peakVal')[1] == 25.0
+
+    # new keys are added on assignment
+    arl[2]['userStat'] = 'a'
+    assert np.isnan(arl[0]['userStat'])
+
+    assert list(arl.sweepMask(0)) == [True, True, False]
+    assert list(arl.sweepMask('All')) == [True, True, True]
+
+    # append and round trip through a DataFrame
+    other = analysisResultList()
+    other.appendDefault()
+    other[0]['sweep'] = 2
+    arl.appendAnalysis(other)
+    assert len(arl) == 4
+
+    df = arl.asDataFrame()
+    arl2 = analysisResultList()
+    arl2.setFromDataFrame(df)
+    assert len(arl2) == 4
+    assert list(arl2.getValues('sweep')) == [0, 0, 1, 2]
+    assert arl2[1]['peakVal'] == 25.0
+    assert arl2[2]['userStat'] == 'a'
+
+if __name__ == '__main__':
+    test_analysisResultList()
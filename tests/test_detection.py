@@ -1,4 +1,7 @@
+import numpy as np
+
 from sanpy.bDetection import bDetection
+from sanpy.detectionUtils import keepAfterRefractory
 
 def test_detection():
     bd = bDetection()
@@ -18,5 +21,60 @@ def test_detection():
     
     # print(presetList)
 
+def test_keep_after_refractory():
+    spikeTimes = [100, 105, 112, 130, 131, 200, 201]
+
+    # compare to last kept spike, not to previous spike
+    keepIdx, lastSpikeTime = keepAfterRefractory(spikeTimes, 10)
+    assert list(keepIdx) == [0, 2, 3, 5]
+    assert lastSpikeTime == 200
+
+    # continue after a kept spike in a previous block
+    keepIdx, lastSpikeTime = keepAfterRefractory(spikeTimes, 10, lastSpikeTime=95)
+    assert list(keepIdx) == [1, 3, 5]
+
+    keepIdx, lastSpikeTime = keepAfterRefractory([], 10, lastSpikeTime=95)
+    assert len(keepIdx) == 0 and lastSpikeTime == 95
+
+    # same as a loop over spikes
+    spikeTimes = np.sort(np.random.default_rng(0).integers(0, 10000, 2000))
+    keep = []
+    lastSpikeTime = None
+    for idx, spikeTime in enumerate(spikeTimes):
+        if lastSpikeTime is None or spikeTime - lastSpikeTime >= 20.5:
+            keep.append(idx)
+            lastSpikeTime = spikeTime
+    assert list(keepAfterRefractory(spikeTimes, 20.5)[0]) == keep
+
+def test_chunk_overlap_backup_vm():
+    """A block boundary inside the backupSpikeVm() window gives the same spikes as whole sweeps."""
+    import sanpy
+    from sanpy import detectionUtils
+
+    dDict = sanpy.bDetection().getDetectionDict('SA Node')
+    # short windows so the overlap is set by backupSpikeVm()
+    dDict = dict(dDict, detectionType='mv', doBackupSpikeVm=True,
+                 mdp_ms=2, avgWindow_ms=2, peakWindow_ms=5, fastAhpWindow_ms=2,
+                 dvdtPostWindow_ms=2, halfWidthWindow_ms=2, dvdtPreWindow_ms=2)
+
+    path = 'data/19114001.abf'
+    ba = sanpy.bAnalysis(path)
+    ba.spikeDetect(dDict)
+    dataPointsPerMs = ba.fileLoader.dataPointsPerMs
+    assert detectionUtils.getChunkOverlap(dDict, dataPointsPerMs) > detectionUtils._backupSpikeVmPnts(dataPointsPerMs)
+
+    # boundary between the backed up threshold and the threshold crossing of the second spike
+    thresholdPnts = ba.getStat('thresholdPnt', asArray=True)
+    crossingPnts = detectionUtils._vmCandidates(ba.fileLoader.sweepY, ba.fileLoader.sweepY_filtered,
+                                                dDict, dataPointsPerMs)
+    crossingPnt = min(pnt for pnt in crossingPnts if pnt > thresholdPnts[1])
+    chunkSize = int(thresholdPnts[1] + crossingPnt) // 2
+
+    baChunked = sanpy.bAnalysis(path)
+    baChunked.spikeDetect(dDict, chunkSize=chunkSize)
+    for stat in ['thresholdPnt', 'peakPnt', 'preMinPnt']:
+        np.testing.assert_array_equal(baChunked.getStat(stat, asArray=True),
+                                      ba.getStat(stat, asArray=True), err_msg=stat)
+
 if __name__ == '__main__':
     test_detection()
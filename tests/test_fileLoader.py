@@ -1,4 +1,7 @@
 import os
+import importlib
+
+import numpy as np
 
 import sanpy
 
@@ -105,7 +108,82 @@ def test_fileLoader_abf():
         print('csvPath:', csvPath)
         df.to_csv(csvPath, index=False)
 
-    
+def test_fileLoader_abf_lazy():
+    path = os.path.join('data', '2021_07_20_0010.abf')
+
+    abfFile = fileLoader_abf(path)
+    lazyFile = fileLoader_abf(path, lazy=True)
+    assert lazyFile.isLazy
+    assert not abfFile.isLazy
+
+    # sweepX is computed, not loaded
+    assert lazyFile._sweepX is None
+    assert np.array_equal(lazyFile.sweepX, abfFile.sweepX)
+
+    abfFile._getDerivative()
+    lazyFile._getDerivative()
+    for _sweep in [0, 5, abfFile.numSweeps-1]:
+        abfFile.setSweep(_sweep)
+        lazyFile.setSweep(_sweep)
+        assert np.array_equal(lazyFile.sweepY, abfFile.sweepY)
+        assert np.array_equal(lazyFile.sweepC, abfFile.sweepC)
+        assert np.array_equal(lazyFile.filteredDeriv, abfFile.filteredDeriv)
+
+    assert np.array_equal(np.asarray(lazyFile._sweepY), abfFile._sweepY)
+
+    # close() releases the memory map, sweeps still load after it
+    lazyFile.close()
+    assert lazyFile._memmap['data'] is None
+    assert np.array_equal(lazyFile._sweepY.getBlock(1, 0, 100), abfFile._sweepY[:100, 1])
+    lazyFile.close()
+
+def test_fileLoader_filter_cache():
+    path = os.path.join('data', '19114001.abf')
+    abfFile = fileLoader_abf(path)
+
+    filteredDeriv = abfFile._getDerivative(medianFilter=0, SavitzkyGolay_pnts=5)
+    assert abfFile._getDerivative(medianFilter=0, SavitzkyGolay_pnts=5) is filteredDeriv
+
+    # toggle between two filters without filtering again
+    medianDeriv = abfFile._getDerivative(medianFilter=5, SavitzkyGolay_pnts=5)
+    assert medianDeriv is not filteredDeriv
+    assert abfFile._getDerivative(medianFilter=0, SavitzkyGolay_pnts=5) is filteredDeriv
+
+    # least recently used is dropped
+    abfFile._getDerivative(medianFilter=0, SavitzkyGolay_pnts=11)
+    assert abfFile._getDerivative(medianFilter=5, SavitzkyGolay_pnts=5) is not medianDeriv
+
+    abfFile.clearFilterCache()
+    assert abfFile._getDerivative(medianFilter=0, SavitzkyGolay_pnts=5) is not filteredDeriv
+
+def test_epoch_table():
+    et = sanpy.fileloaders.epochTable()
+    dataPointsPerMs = 10
+    et.addEpoch(0, 0, 0.1, dataPointsPerMs, level=-0.1)
+    et.addEpoch(0, 0.1, 0.1, dataPointsPerMs, level=0.5)  # no points
+    et.addEpoch(0, 0.1, 0.5, dataPointsPerMs, level=0.7)
+    et.addEpoch(0, 0.6, 1.0, dataPointsPerMs, level=-0.1)
+
+    pnts = np.array([-1, 0, 999, 1000, 4999, 5000, 5500, 6000, 9999, 10000])
+    epochs = et.findEpochs(pnts)
+    assert list(epochs) == [-1, 0, 0, 2, 2, -1, -1, 3, 3, -1]
+    assert [et.findEpoch(pnt) for pnt in pnts] == [None if e < 0 else e for e in epochs]
+    np.testing.assert_array_equal(et.getLevels(epochs[:4]), [np.nan, -0.1, -0.1, 0.7])
+
+def test_file_loader_registry():
+    # sanpy.fileloaders.fileLoader_base is the class
+    fileLoaderModule = importlib.import_module('sanpy.fileloaders.fileLoader_base')
+    fileLoaders = sanpy.fileloaders.getFileLoaders()
+    assert '.abf' in fileLoaders.keys()
+
+    # file loaders are only discovered once
+    cachedFileLoaders = fileLoaderModule._fileLoaderCache.value
+    assert sanpy.fileloaders.getFileLoaders() == fileLoaders
+    assert fileLoaderModule._fileLoaderCache.value is cachedFileLoaders
+
+    sanpy.fileloaders.getFileLoaders(refresh=True)
+    assert fileLoaderModule._fileLoaderCache.value is not cachedFileLoaders
+
 def test_new_b_analysis():
     # test new version of bAnalysis using fileLoader
     # path = 'data/19114001.abf'
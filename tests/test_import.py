@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+def test_lazy_import():
+    """import sanpy does not import plotting and h5 modules until they are used."""
+    code = (
+        "import sys, sanpy\n"
+        "assert 'matplotlib' not in sys.modules\n"
+        "assert 'tables' not in sys.modules\n"
+        "assert sanpy.analysisDir.__name__ == 'analysisDir'\n"
+        "import sanpy.kymAnalysis\n"
+        "assert isinstance(sanpy.kymAnalysis, type)\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+    # importing the submodule first still gives the class, star import includes lazy names
+    code = (
+        "import sanpy.analysisDir\n"
+        "from sanpy import *\n"
+        "assert isinstance(analysisDir, type) and isinstance(bExport, type)\n"
+        "assert sanpy.analysisDir is analysisDir\n"
+        "assert set(sanpy._lazyAttributes) <= set(sanpy.__all__)\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from sanpy.kymAnalysis import kymAnalysis, makeKymograph
+
+def test_fit_line_profiles():
+    """Fitting all line scans at once is the same as fitting each line scan."""
+    ka = kymAnalysis('kymograph.tif', tifData=makeKymograph(numLines=200, seed=0), autoLoad=False)
+    ka.setRoiRect([0, 90, 200, 10])
+
+    lines = np.arange(ka.numLineScans())
+    intensityProfiles, left_idx, right_idx = ka._getFitLineProfiles(lines)
+    for line in [0, 1, 100, 198, 199]:
+        intensityProfile, left, right = ka._getFitLineProfile(line)
+        np.testing.assert_array_equal(intensityProfiles[line], intensityProfile)
+        assert left_idx[line] == left
+        assert right_idx[line] == right
+
+    ka.analyzeDiameter()
+    assert ka.getResults('left_pnt')[100] == left_idx[100]
+
+def test_analyze_diameter_mp():
+    """Diameter analysis with a pool of workers is the same as analyzeDiameter()."""
+    ka = kymAnalysis('kymograph.tif', tifData=makeKymograph(numLines=3000, seed=0), autoLoad=False)
+    ka.setRoiRect([100, 90, 2900, 10])
+    ka.analyzeDiameter()
+    serialResults = dict(ka._diamResults)
+
+    progress = []
+    ka.analyzeDiameter_mp(workers=2, progressCallback=lambda numAnalyzed, numLines: progress.append(numAnalyzed))
+    assert progress[-1] == 2800
+    for key, values in serialResults.items():
+        np.testing.assert_array_equal(ka.getResults(key), values, err_msg=key)